@@ -0,0 +1,142 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+Time and peak memory of generating the probe IPs of a synthetic full routing table (announced-pfxs dataset), comparing
+the radix tree based generation (all the prefixes loaded in a TargetIpGenerator tree, then mapped in one go) with the
+streaming generation of pfxs_to_ip, on a sorted and on a shuffled input file.
+
+Each run is done in a child process so that its peak RSS is measured independently.
+
+Usage (from the repository root): PYTHONPATH=. python benchmarks/bench_announced_pfxs_probe_ips.py [-n NUM_BLOCKS]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+import wandio
+
+from grip.active.ripe_atlas.target_ip_generator import TargetIpGenerator, pfx_sort_key
+from grip.tagger.announced_pfxs_probe_ips import pfxs_to_ip
+
+
+def block_prefixes(rand, block):
+    """prefixes announced in a /16 block: the block itself, covering /17-/23 and many /24s"""
+    base = block << 16
+    pfxs = set()
+    if rand.random() < 0.15:
+        pfxs.add((base, 16))
+    for _ in range(rand.randint(0, 4)):
+        length = rand.randint(17, 23)
+        pfxs.add((base + (rand.getrandbits(length - 16) << (32 - length)), length))
+    for _ in range(rand.randint(0, 30)):
+        pfxs.add((base + (rand.getrandbits(8) << 8), 24))
+    return ["{}.{}.{}.{}/{}".format(first >> 24, first >> 16 & 255, first >> 8 & 255, first & 255, length)
+            for first, length in pfxs]
+
+
+def write_table(path, num_blocks, shuffle):
+    """write the prefixes of randomly picked /16 blocks, sorted by pfx_sort_key or shuffled"""
+    rand = random.Random(0)
+    blocks = sorted(rand.sample(range(1 << 8, 224 << 8), num_blocks))
+    if shuffle:
+        pfxs = [pfx for block in blocks for pfx in block_prefixes(rand, block)]
+        rand.shuffle(pfxs)
+    else:
+        pfxs = (pfx for block in blocks for pfx in sorted(block_prefixes(rand, block), key=pfx_sort_key))
+    count = 0
+    with wandio.open(path, mode="w") as fh:
+        for pfx in pfxs:
+            fh.write(pfx + "\n")
+            count += 1
+    return count
+
+
+def radix_pfxs_to_ip(input_file, output_file):
+    """generation with all the prefixes in the radix tree"""
+    ip_gen = TargetIpGenerator()
+    with wandio.open(input_file) as in_fh:
+        for line in in_fh:
+            ip_gen.add_pfx(line.strip())
+    pfx_ip = ip_gen.get_probe_pfx_ip_map()
+    with wandio.open(output_file, mode="w") as out_fh:
+        for pfx in pfx_ip:
+            out_fh.write("%s\t%s\n" % (pfx, pfx_ip[pfx]))
+
+
+def run(func, input_file, output_file, queue):
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    func(input_file, output_file)
+    duration = time.time() - start
+    queue.put((duration, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) / 1024.0))
+
+
+def measure(func, input_file, output_file):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run, args=(func, input_file, output_file, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--num-blocks", type=int, default=50000,
+                        help="number of /16 blocks with announced prefixes (50000 is about a full table)")
+    opts = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sorted_file = os.path.join(tmp_dir, "announced-pfxs.sorted.gz")
+        shuffled_file = os.path.join(tmp_dir, "announced-pfxs.shuffled.gz")
+        output_file = os.path.join(tmp_dir, "probe-ips.gz")
+        print("prefixes:           {}".format(write_table(sorted_file, opts.num_blocks, shuffle=False)))
+        write_table(shuffled_file, opts.num_blocks, shuffle=True)
+
+        for name, func, input_file in [("radix tree", radix_pfxs_to_ip, sorted_file),
+                                       ("stream (sorted)", pfxs_to_ip, sorted_file),
+                                       ("stream (shuffled)", pfxs_to_ip, shuffled_file)]:
+            duration, peak = measure(func, input_file, output_file)
+            print("{:<19} {:6.2f} s   peak RSS +{:.0f} MiB".format(name + ":", duration, peak))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+Traceroute measurement creation against a stand-in RIPE Atlas server answering after a fixed latency: one request at a
+time, as done before the dispatcher, versus concurrent requests from the worker pool.
+
+Usage (from the repository root): PYTHONPATH=. python benchmarks/bench_atlas_dispatch.py [-p NUM_PFX_EVENTS]
+    [-a NUM_ASES] [-l LATENCY] [-w WORKERS]
+"""
+
+import argparse
+import time
+
+from grip.active.ripe_atlas.atlas_dispatcher import AtlasDispatcher
+from grip.active.ripe_atlas.ripe_atlas_utils import RipeAtlasUtils
+from grip.active.tests.test_atlas_dispatcher import AtlasStub, FakeProbe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RIPE Atlas measurement creation")
+    parser.add_argument("-p", "--num-pfx-events", type=int, default=20, help="number of traceroute targets")
+    parser.add_argument("-a", "--num-ases", type=int, default=10, help="number of ASes probing each target")
+    parser.add_argument("-l", "--latency", type=float, default=0.05, help="stub response latency in seconds")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="number of concurrent workers")
+    args = parser.parse_args()
+
+    targets = [("10.0.{}.1".format(i), "10.0.{}.0/24".format(i)) for i in range(args.num_pfx_events)]
+    asn_probes_mapping = {str(asn): [FakeProbe(asn * 10 + i) for i in range(3)] for asn in range(1, args.num_ases + 1)}
+
+    for name, workers in [("serial", 1), ("concurrent", args.workers)]:
+        with AtlasStub(latency=args.latency) as stub:
+            # no client-side rate limit here, the stub has no quota
+            dispatcher = AtlasDispatcher(key="bench", max_workers=workers, rate=1e6, burst=1e6,
+                                         server=stub.server, scheme="http")
+            atlas = RipeAtlasUtils(key="bench", dispatcher=dispatcher)
+            start = time.time()
+            results = atlas.create_requests(targets, asn_probes_mapping, "moas-1577836800-1")
+            elapsed = time.time() - start
+            dispatcher.close()
+            assert sum(len(succeeded) for succeeded, _ in results) == len(targets) * args.num_ases
+            print("{:10s} {:6.2f}s {:8.1f} requests/s ({} requests, {} in flight max)".format(
+                name, elapsed, stub.requests / elapsed, stub.requests, stub.max_in_flight))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+Event commit throughput against a stand-in ElasticSearch server: one index request per event, as done by
+ElasticConn.index_event, versus the buffered bulk writer.
+
+Usage (from the repository root): PYTHONPATH=. python benchmarks/bench_elastic_bulk.py [-n NUM_EVENTS]
+"""
+
+import argparse
+import time
+
+from elasticsearch import Elasticsearch
+
+from grip.utils.data.elastic import update_event_ts
+from grip.utils.data.elastic_bulk import ElasticBulkWriter
+from grip.utils.tests.test_elastic_bulk import ElasticStub, INDEX, build_event
+
+
+def bench_serial(es, events):
+    for event in events:
+        update_event_ts(event)
+        es.index(index=INDEX, id=event.event_id, body=event.as_json())
+
+
+def bench_bulk(es, events):
+    writer = ElasticBulkWriter(es)
+    for event in events:
+        writer.add_event(event, INDEX)
+    assert not writer.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event commits to ElasticSearch")
+    parser.add_argument("-n", "--num-events", type=int, default=5000, help="number of events to commit")
+    args = parser.parse_args()
+
+    events = [build_event("moas-1577836800-{}".format(i)) for i in range(args.num_events)]
+
+    for name, func in [("serial", bench_serial), ("bulk", bench_bulk)]:
+        with ElasticStub() as stub:
+            es = Elasticsearch(stub.url)
+            start = time.time()
+            func(es, events)
+            elapsed = time.time() - start
+            assert len(stub.docs) == len(events)
+            print("{:8s} {:8.0f} docs/s ({} requests)".format(
+                name, len(events) / elapsed, sum(stub.requests.values())))
+            es.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+Peak memory of a synthetic large view: one event per 100 prefix events, a mix of moas, submoas, defcon and edges
+prefix events with tags and AS paths, as built by the taggers.
+
+Usage (from the repository root): PYTHONPATH=. python benchmarks/bench_event_memory.py [-n NUM_PFX_EVENTS]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from grip.events.details_defcon import DefconDetails
+from grip.events.details_edges import EdgesDetails
+from grip.events.details_moas import MoasDetails
+from grip.events.details_submoas import SubmoasDetails
+from grip.events.event import Event
+from grip.events.pfxevent import PfxEvent
+from grip.tagger.tags import tagshelper
+
+VIEW_TS = 1577836800
+PFX_EVENTS_PER_EVENT = 100
+
+
+def build_details(event_type, i, rand):
+    prefix = "10.{}.{}.0/24".format(i // 256 % 256, i % 256)
+    sub_prefix = "10.{}.{}.0/25".format(i // 256 % 256, i % 256)
+    origin = str(64512 + i % 1000)
+    aspaths = [["3356", "1299", origin], ["174", "2914", origin], ["6939", str(64512 + rand.randint(0, 999))]]
+    if event_type == "moas":
+        return MoasDetails(prefix=prefix, origins_set={origin, aspaths[2][-1]}, aspaths=aspaths,
+                           old_origins_set={origin})
+    if event_type == "submoas":
+        return SubmoasDetails(super_pfx=prefix, sub_pfx=sub_prefix, super_origins={origin},
+                              sub_origins={aspaths[2][-1]}, super_aspaths=aspaths[:2], sub_aspaths=aspaths[2:])
+    if event_type == "defcon":
+        return DefconDetails(super_pfx=prefix, sub_pfx=sub_prefix, origins_set={origin}, super_aspaths=aspaths[:2],
+                             sub_aspaths=aspaths[2:])
+    return EdgesDetails(as1=3356, as2=int(origin), prefix=prefix,
+                        aspaths_str=":".join(" ".join(path) for path in aspaths))
+
+
+def build_view(num_pfx_events):
+    rand = random.Random(0)
+    tags = [tagshelper.get_tag(name) for name in sorted(tagshelper.all_tag_map)]
+    events = []
+    event_types = ["moas", "submoas", "defcon", "edges"]
+    for i in range(num_pfx_events):
+        event_type = event_types[(i // PFX_EVENTS_PER_EVENT) % len(event_types)]
+        if i % PFX_EVENTS_PER_EVENT == 0:
+            events.append(Event(event_type=event_type, position="NEW", view_ts=VIEW_TS,
+                                event_id="{}-{}-{}".format(event_type, VIEW_TS, i)))
+        pfx_event = PfxEvent(event_type=event_type, view_ts=VIEW_TS, position="NEW",
+                             details=build_details(event_type, i, rand), tags=set(rand.sample(tags, 6)))
+        events[-1].add_pfx_event(pfx_event)
+    for event in events:
+        event.summary.update()
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--num-pfx-events", type=int, default=200000, help="number of prefix events")
+    opts = parser.parse_args()
+
+    tracemalloc.start()
+    start = time.time()
+    events = build_view(opts.num_pfx_events)
+    duration = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("events:          {}".format(len(events)))
+    print("pfx events:      {}".format(sum(len(e.pfx_events) for e in events)))
+    print("memory (current): {:.1f} MiB".format(current / 2 ** 20))
+    print("memory (peak):    {:.1f} MiB".format(peak / 2 ** 20))
+    print("time:             {:.2f} s".format(duration))
+
+
+if __name__ == "__main__":
+    main()
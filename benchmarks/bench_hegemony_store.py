@@ -0,0 +1,107 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+Compare hegemony lookups served by the local HegemonyStore against the IHR HTTP path.
+
+The HTTP path is replayed from the recorded API fixture by a local HTTP server, so the numbers only account for
+the request/parse overhead and not for the IHR API latency itself (which is usually orders of magnitude larger).
+
+Usage (from the repository root): PYTHONPATH=. python benchmarks/bench_hegemony_store.py [-n ROUNDS]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from grip.utils.data.hegemony import HegemonyUtils
+from grip.utils.data.hegemony_store import HegemonyStore
+from grip.utils.tests.test_hegemony_store import DUMP_FILE, VIEW_TS, RecordedResponse
+
+PATHS = [["3356", "15169", "1299"], ["174", "2914", "6939", "15169"], ["9121", "1299", "3356", "13335"],
+         ["7018", "3257", "6453", "4134"], ["2914", "174", "9121"]]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(RecordedResponse(self.path).json()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(hegemony_factory, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        # fresh instance per round: cold process-local cache, as for a new view
+        hegemony = hegemony_factory()
+        hegemony.count_global_hegemony_valleys(VIEW_TS, PATHS, 0)
+        hegemony.get_local_hege_path(VIEW_TS, PATHS)
+    return (time.time() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--rounds", type=int, default=200, help="number of rounds")
+    opts = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReplayHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = "http://127.0.0.1:{}/ihr/api/hegemony/".format(server.server_address[1])
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        store = HegemonyStore(os.path.join(tmp_dir, "hegemony.db"))
+        store.ingest_file(DUMP_FILE)
+
+        http_time = run(lambda: HegemonyUtils(api_url=api_url), opts.rounds)
+        local_time = run(lambda: HegemonyUtils(store=store), opts.rounds)
+        print("http (replayed): {:.3f} ms/view".format(http_time * 1000))
+        print("local store:     {:.3f} ms/view".format(local_time * 1000))
+        print("speedup:         {:.1f}x".format(http_time / local_time))
+        store.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+Serialization throughput of large edges and MOAS events: conversion to dicts, JSON encoding with the standard library
+and with grip.utils.serialization (orjson when installed), decoding, and conversion back to Event objects.
+
+Usage (from the repository root): PYTHONPATH=. python benchmarks/bench_serialization.py [-n NUM_PFX_EVENTS] [-r ROUNDS]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from benchmarks.bench_event_memory import build_details, VIEW_TS
+from grip.events.event import Event
+from grip.events.pfxevent import PfxEvent
+from grip.tagger.tags import tagshelper
+from grip.utils import serialization
+
+
+def build_event(event_type, num_pfx_events, rand):
+    tags = [tagshelper.get_tag(name) for name in sorted(tagshelper.all_tag_map)]
+    event = Event(event_type=event_type, position="NEW", view_ts=VIEW_TS,
+                  event_id="{}-{}-large".format(event_type, VIEW_TS))
+    for i in range(num_pfx_events):
+        event.add_pfx_event(PfxEvent(event_type=event_type, view_ts=VIEW_TS, position="NEW",
+                                     details=build_details(event_type, i, rand), tags=set(rand.sample(tags, 6))))
+    event.summary.update()
+    event.event_metrics.proc_time_tagger = 0.125
+    return event
+
+
+def measure(func, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        res = func()
+    return (time.time() - start) / rounds, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--num-pfx-events", type=int, default=1000, help="number of prefix events per event")
+    parser.add_argument("-r", "--rounds", type=int, default=20, help="number of rounds per measurement")
+    opts = parser.parse_args()
+
+    rand = random.Random(0)
+    print("backend: {}".format(serialization.backend()))
+    for event_type in ["edges", "moas"]:
+        event = build_event(event_type, opts.num_pfx_events, rand)
+        d = event.as_dict()
+        std_json = json.dumps(d)
+        fast_json = serialization.dumps_compact(d)
+        # the same document whichever the encoder
+        assert serialization.dumps(d) == std_json
+        assert json.loads(std_json) == serialization.loads(fast_json)
+
+        results = [
+            ("as_dict", measure(event.as_dict, opts.rounds)[0]),
+            ("json.dumps", measure(lambda: json.dumps(d), opts.rounds)[0]),
+            ("dumps_compact", measure(lambda: serialization.dumps_compact(d), opts.rounds)[0]),
+            ("json.loads", measure(lambda: json.loads(std_json), opts.rounds)[0]),
+            ("loads", measure(lambda: serialization.loads(fast_json), opts.rounds)[0]),
+            ("from_dict", measure(lambda: Event.from_dict(json.loads(std_json)), opts.rounds)[0]
+             - measure(lambda: json.loads(std_json), opts.rounds)[0]),
+        ]
+        print("{} event: {} prefix events, {:.1f} KiB of JSON".format(
+            event_type, len(event.pfx_events), len(std_json) / 1024))
+        for name, duration in results:
+            print("  {:<14} {:8.2f} ms  {:8.1f} MiB/s".format(
+                name, duration * 1000, len(std_json) / 2 ** 20 / duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+Memory and allocation benchmark of the tags carried by prefix events of a large view.
+
+Builds prefix events from dicts (as loaded from ElasticSearch) with a handful of tags each, and reports the peak
+traced memory, the number of distinct Tag objects alive and the time spent.
+
+Usage (from the repository root): PYTHONPATH=. python benchmarks/bench_tags.py [-n NUM_PFX_EVENTS]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+import grip.events.event  # imported before pfxevent to avoid a circular import
+from grip.events.pfxevent import PfxEvent
+from grip.tagger.tags import tagshelper
+from grip.tagger.tags.tag import Tag
+
+
+def generate_pfx_event_dicts(num, tags_per_event=8):
+    rand = random.Random(0)
+    tag_names = sorted(tagshelper.all_tag_map)
+    for i in range(num):
+        yield {
+            "event_type": "moas",
+            "view_ts": 1577836800,
+            "position": "NEW",
+            "details": {
+                "prefix": "10.{}.{}.0/24".format(i // 256 % 256, i % 256),
+                "origins": ["15169", "65001"],
+                "old_origins": ["15169"],
+                "aspaths": "3356 15169:1299 65001",
+            },
+            "tags": [{"name": name} for name in rand.sample(tag_names, tags_per_event)],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--num-pfx-events", type=int, default=100000, help="number of prefix events")
+    opts = parser.parse_args()
+
+    dicts = list(generate_pfx_event_dicts(opts.num_pfx_events))
+
+    tracemalloc.start()
+    start = time.time()
+    pfx_events = [PfxEvent.from_dict(d) for d in dicts]
+    duration = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tag_objects = {id(t) for pfx_event in pfx_events for t in pfx_event.tags if isinstance(t, Tag)}
+    print("pfx events:          {}".format(len(pfx_events)))
+    print("distinct tag objects: {}".format(len(tag_objects)))
+    print("memory (current):    {:.1f} MiB".format(current / 2 ** 20))
+    print("memory (peak):       {:.1f} MiB".format(peak / 2 ** 20))
+    print("time:                {:.2f} s".format(duration))
+
+
+if __name__ == "__main__":
+    main()
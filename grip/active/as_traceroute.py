@@ -31,7 +31,7 @@
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 import itertools
 
-from grip.redis import Pfx2AsHistorical
+from grip.active.ip_to_as import IpToAsResolver
 from grip.utils.data.reserved_prefixes import ReservedPrefixes
 
 
@@ -40,9 +40,14 @@ class AsTracerouteDriver:
     AS Tracereoute Driver, converting traceroute IP hops to AS paths
     """
 
-    def __init__(self):
+    def __init__(self, pfx_origin_db=None):
+        """
+        :param pfx_origin_db: (optional) IpToAsResolver to share, e.g. with `extract_atlas_response`
+        """
         self.ixp_dataset = None
-        self.pfx_origin_dataset = Pfx2AsHistorical()
+        if pfx_origin_db is None:
+            pfx_origin_db = IpToAsResolver()
+        self.pfx_origin_dataset = pfx_origin_db
         self.reserved_pfxs = ReservedPrefixes()
 
     @staticmethod
@@ -54,7 +59,9 @@ class AsTracerouteDriver:
         ]
 
     def fill_as_traceroute_results(self, traceroute_results, view_ts):
-        """do as traceroute and fill the results structure"""
+        """
+        do as traceroute and fill the results structure
+        """
 
         for result_dict in traceroute_results:
             hops = self.__preprocess_trace(result_dict)
@@ -53,6 +53,9 @@ def start_driver():
                         help="Ripe atlas key")
     parser.add_argument('-c', '--count', nargs="?", type=int,
                         help="Exit after receiving n events")
+    parser.add_argument("-b", "--batch-size", type=int, default=1,
+                        help="Number of messages to process at once, requesting the measurements of their events "
+                             "together")
 
     parser.add_argument('-v', '--verbose', action="store_true",
                         required=False, help='Verbose logging')
@@ -71,7 +74,7 @@ def start_driver():
         opts.key = atlaskey
 
     driver = ActiveProbingDriver(opts.type, opts.key, debug=opts.debug)
-    driver.listen()
+    driver.listen(batch_size=opts.batch_size)
 
 
 def start_collector():
@@ -85,6 +88,8 @@ def start_collector():
                         help="Event type to listen for")
     parser.add_argument("-d", "--debug", action="store_true", default=False,
                         help="Whether to enable debug mode")
+    parser.add_argument("-s", "--state-file", nargs="?", default=None,
+                        help="File to persist pending measurements to across restarts")
 
     # add argument for list of brokers
     logging.basicConfig(format="%(levelname)s %(asctime)s: %(message)s",
@@ -93,4 +98,4 @@ def start_collector():
 
     opts = parser.parse_args()
 
-    ActiveProbingCollector(event_type=opts.type, debug=opts.debug).listen()
+    ActiveProbingCollector(event_type=opts.type, debug=opts.debug, state_file=opts.state_file).listen()
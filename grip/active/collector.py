@@ -34,14 +34,17 @@ import logging
 import signal
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 from ripe.atlas.cousteau import AtlasResultsRequest
 
 from grip.active.as_traceroute import AsTracerouteDriver
+from grip.active.ip_to_as import IpToAsResolver
+from grip.active.ripe_atlas.msm_tracker import MeasurementTracker
 from grip.active.ripe_atlas.ripe_atlas_msm import AtlasMeasurement
-from grip.active.ripe_atlas.ripe_atlas_utils import extract_atlas_response, get_traceroute_status_map
-from grip.common import get_kafka_topic
+from grip.active.ripe_atlas.ripe_atlas_utils import extract_atlas_response, get_traceroute_status_map, get_hop_ips
+from grip.common import get_kafka_topic, ATLAS_MAX_WORKERS
 from grip.events.event import Event
 from grip.events.pfxevent import PfxEvent
 from grip.redis import Pfx2AsHistorical
@@ -62,7 +65,7 @@ class TRACEROUTE_STATUS(Enum):
 
 class ActiveProbingCollector:
 
-    def __init__(self, event_type, debug=False):
+    def __init__(self, event_type, debug=False, state_file=None):
         self.DEBUG = debug
         producer_topic = get_kafka_topic("collector", event_type, debug)  # produce as driver
         consumer_topic = get_kafka_topic("driver", event_type, debug)  # consumer from tagger
@@ -73,33 +76,49 @@ class ActiveProbingCollector:
 
         self.event_type = event_type
 
-        # prefix-to-as mapping
+        # prefix-to-as mapping, memoised across loops as the same router IPs recur in many traceroutes
         # self._pfx_origin_db = Pfx2AsNewcomer()
-        self._pfx_origin_db = Pfx2AsHistorical()
+        self._pfx_origin_db = IpToAsResolver(Pfx2AsHistorical())
 
         # initialize kafka helper
         self.kafka_helper = KafkaHelper()
-        self.kafka_helper.init_producer(topic=producer_topic)
+        self.kafka_helper.init_producer(topic=producer_topic, asynchronous=True)
         self.kafka_helper.init_consumer(topics=[consumer_topic], group_id=consumer_group, offset="earliest")
 
         # ElasticSearch
         self.es_conn = ElasticConn()
+        self.es_bulk = self.es_conn.bulk_writer()
+
+        # pending measurements, saved to state_file (if set) to survive restarts
+        self.tracker = MeasurementTracker(state_file=state_file, min_interval=REQUEST_RETRY_INTERVAL)
+        # workers for fetching measurements status and results from RIPE Atlas
+        self.executor = ThreadPoolExecutor(max_workers=ATLAS_MAX_WORKERS, thread_name_prefix="atlas-collector")
 
     @staticmethod
-    def _retrieve_results_map(msm_ids):
+    def _retrieve_results_map(msm_ids, executor=None):
         """
         retrieve traceroute results by measurement IDs
         :param msm_ids:
+        :param executor: if set, status and results requests are sent concurrently by the executor
         :return: map of traceroute results, key: measurement id, value: traceroute result json
         """
 
         results_map = {}
         if not msm_ids:
             return results_map
-        status_map = get_traceroute_status_map(msm_ids)
+        status_map = get_traceroute_status_map(msm_ids, executor=executor)
         if not status_map:
             return {}
 
+        def request_results(msm_id):
+            return AtlasResultsRequest(msm_id=msm_id).create()
+
+        # results of the stopped measurements (status 4: Stopped, or 5: Forced to stop) can be extracted now
+        stopped_msm_ids = [msm_id for msm_id in msm_ids
+                           if status_map.get(msm_id) and 4 <= status_map[msm_id]["id"] <= 5]
+        mapper = executor.map if executor is not None else map
+        results_map = dict(zip(stopped_msm_ids, mapper(request_results, stopped_msm_ids)))
+
         for msm_id in msm_ids:
             """
             status (integer): 0: Specified, 1: Scheduled, 2: Ongoing, 4: Stopped, 5: Forced to stop, 6: No suitable probes, 7: Failed, 8: Archived
@@ -124,51 +143,180 @@ class ActiveProbingCollector:
 
             # reaching here means the status is either 4: Stopped, or 5: Forced to stop
             # meaning we can extract the results now
-            is_success, responses = AtlasResultsRequest(msm_id=msm_id).create()
+            is_success, responses = results_map[msm_id]
             if is_success:
                 yield msm_id, (TRACEROUTE_STATUS.Finished, responses)
                 continue
 
             yield msm_id, (TRACEROUTE_STATUS.Failed, [])
 
-    def _process_finished_measurements(self, measurements):
-        event_id_set = set()
+    def _check_measurements(self, due_msms, stop=None):
+        """
+        Retrieve the status of the due measurements from Atlas, and the results of the stopped ones.
+
+        Measurements that are still going on, or whose status could not be retrieved (e.g. one of the status requests
+        failed), are rescheduled. They are given up once they expire, and returned as finished with an error so that
+        they are still written to their events.
+
+        :param due_msms: list of tracked AtlasMeasurement objects to check
+        :param stop: function returning True when checking should stop, the unchecked measurements are rescheduled
+        :return: (finished measurements, list of (measurement, responses) tuples of the stopped measurements)
+        """
+        finished_msms = []
+        stopped_msms = []
+        checked = set()
+        for msm_id, (status, responses) in self._retrieve_results_map([int(msm.msm_id) for msm in due_msms],
+                                                                      executor=self.executor):
+            if stop is not None and stop():
+                logging.info("Shutting down")
+                break
+            if msm_id not in self.tracker:
+                logging.warning("retrieved measurement {} but it is not tracked".format(msm_id))
+                continue
+            checked.add(msm_id)
+            msm = self.tracker.get(msm_id)
+            assert (isinstance(msm, AtlasMeasurement))
+            if status in (TRACEROUTE_STATUS.RetrievalError, TRACEROUTE_STATUS.Ongoing):
+                if self.tracker.is_expired(msm_id):
+                    logging.info("measurement %d still not finished or not retrieved after %d seconds, giving up",
+                                 msm_id, self.tracker.get_age(msm_id))
+                    msm.results = []
+                    if status == TRACEROUTE_STATUS.RetrievalError:
+                        msm.request_error = ["cannot retrieve measurement status"]
+                    else:
+                        msm.request_error = ["measurement did not finish in time"]
+                    finished_msms.append(msm)
+                    continue
+                if status == TRACEROUTE_STATUS.RetrievalError:
+                    # failed to retrieve status from Atlas
+                    logging.warning("cannot retrieve status of measurement %d, checking again later", msm_id)
+                # on-going measurement, check again later
+                self.tracker.reschedule(msm_id)
+                continue
+            elif status == TRACEROUTE_STATUS.Failed:
+                # measurement failed
+                logging.info("measurement %d failed (https://atlas.ripe.net/api/v2/measurements/%s/): %s",
+                             msm_id, msm_id, responses)
+                logging.info("%s", msm.as_str())
+                msm.results = []
+                msm.request_error = responses
+                finished_msms.append(msm)
+                continue
+            elif status == TRACEROUTE_STATUS.Finished:
+                # results of all the stopped measurements are processed in one batch
+                stopped_msms.append((msm, responses))
+                finished_msms.append(msm)
+
+        # measurements without an answer (e.g. all the status requests failed) are checked again later
+        for msm in due_msms:
+            msm_id = int(msm.msm_id)
+            if msm_id not in checked and msm_id in self.tracker:
+                self.tracker.reschedule(msm_id)
+        return finished_msms, stopped_msms
+
+    def _extract_results(self, stopped_msms, as_traceroute_driver):
+        """
+        Extract the traceroute results of stopped measurements. The origins of the hop IPs of all the measurements
+        that are not cached yet are fetched from Redis in one batch.
+
+        :param stopped_msms: list of (AtlasMeasurement, responses) tuples
+        :param as_traceroute_driver: AsTracerouteDriver filling the AS-level traceroutes, sharing the collector's
+        IpToAsResolver
+        :return: map of event ID to the (lookups, cache hits) counts of the hop IP origin lookups
+        """
+        pfx_origin_db = self._pfx_origin_db
+        queries = []
+        for msm, responses in stopped_msms:
+            view_ts = msm.event_id.split("-")[1]
+            for response in responses:
+                # NOTE: the prefix-to-as database handles only IPv4
+                for ip in get_hop_ips([response]):
+                    if ":" not in ip:
+                        # hops are looked up at the response time (origins) and at the event time (AS traceroute)
+                        queries.append(("{}/32".format(ip), response.get("timestamp")))
+                        queries.append(("{}/32".format(ip), view_ts))
+        pfx_origin_db.prefetch(queries)
+
+        ip_to_as_stats = {}
+        for msm, responses in stopped_msms:
+            logging.info("processing results for measurement {} for event {}".format(msm.msm_id, msm.event_id))
+            lookup_cnt, hit_cnt = pfx_origin_db.lookup_cnt, pfx_origin_db.hit_cnt
+            view_ts = msm.event_id.split("-")[1]
+            traceroute_results = extract_atlas_response(pfx_origin_db=pfx_origin_db, responses=responses,
+                                                        target_pfx=msm.target_pfx)
+            as_traceroute_driver.fill_as_traceroute_results(traceroute_results=traceroute_results, view_ts=view_ts)
+            msm.results = traceroute_results
+
+            stats = ip_to_as_stats.setdefault(msm.event_id, [0, 0])
+            stats[0] += pfx_origin_db.lookup_cnt - lookup_cnt
+            stats[1] += pfx_origin_db.hit_cnt - hit_cnt
+
+        logging.info("IP-to-AS cache: %d entries, %.1f%% hit rate", len(pfx_origin_db),
+                     100 * pfx_origin_db.get_hit_rate())
+        return {event_id: tuple(stats) for event_id, stats in ip_to_as_stats.items()}
+
+    def _process_finished_measurements(self, measurements, ip_to_as_stats=None):
+        """
+        Update the events of the finished measurements. The events are retrieved with multi-get requests and committed
+        back with bulk requests. Downstream is notified of each event once it is committed, without waiting for the
+        delivery of the notifications.
+
+        :param ip_to_as_stats: (optional) map of event ID to the (lookups, cache hits) counts to add to the event's
+        traceroute metrics
+        :return: set of IDs of the events that could not be committed because of transient errors
+        """
+        if ip_to_as_stats is None:
+            ip_to_as_stats = {}
+        event_ids = {}  # ordered set
         msm_map = {}
 
         for msm in measurements:
             assert (isinstance(msm, AtlasMeasurement))
-            event_id_set.add(msm.event_id)
+            event_ids[msm.event_id] = None
             msm_map[msm.msm_id] = msm
 
-        for event_id in event_id_set:
-            event = self.es_conn.get_event_by_id(event_id=event_id)
+        def on_elastic(committed_event):
+            # notify downstream (i.e. inference engine) that new updated events are ready to be retrieved
+            msg = EventOnElasticMsg(
+                sender="ripe-collector",
+                es_index=self.es_conn.infer_index_name_by_id(committed_event.event_id),
+                es_id=committed_event.event_id,
+                tr_worthy=committed_event.summary.tr_worthy)
+            self.kafka_helper.produce(value_str=msg.to_str())
+
+        events = self.es_conn.get_events_by_ids(event_ids)
+        for event_id in event_ids:
+            event = events.get(event_id)
             if event is None:
                 logging.warning("cannot find event {}".format(event_id))
                 continue
             assert (isinstance(event, Event))
 
-            # update prefix event traceroutes
+            # update prefix event traceroutes, replacing the finished measurements
             for pfx_event in event.pfx_events:
                 assert (isinstance(pfx_event, PfxEvent))
-                new_msms = []
-                for msm in pfx_event.traceroutes["msms"]:
-                    if msm.msm_id in msm_map:
-                        # need to replace this measurement
-                        new_msms.append(msm_map[msm.msm_id])
-                    else:
-                        new_msms.append(msm)
-                pfx_event.traceroutes["msms"] = new_msms
+                pfx_event.traceroutes["msms"] = [msm_map.get(msm.msm_id, msm) for msm in pfx_event.traceroutes["msms"]]
+
+            if event_id in ip_to_as_stats:
+                lookup_cnt, hit_cnt = ip_to_as_stats[event_id]
+                event.tr_metrics.ip_to_as_lookup_cnt += lookup_cnt
+                event.tr_metrics.ip_to_as_cache_hit_cnt += hit_cnt
 
             # recommit event to ElasticSearch
-            self.es_conn.index_event(event=event, update=True)
+            self.es_bulk.add_event(event, index=self.es_conn.infer_index_name_by_id(event_id), update=True,
+                                   callback=on_elastic)
 
-            # notify downstream (i.e. inference engine) that new updated events are ready to be retrieved
-            msg = EventOnElasticMsg(
-                sender="ripe-collector",
-                es_index=self.es_conn.infer_index_name_by_id(event.event_id),
-                es_id=event_id,
-                tr_worthy=event.summary.tr_worthy)
-            self.kafka_helper.produce(value_str=msg.to_str(), flush=True)
+        failed = self.es_bulk.flush()
+        if failed:
+            logging.error("failed to commit {} events with finished measurements".format(len(failed)))
+        return {item.doc_id for item in failed if item.retriable}
+
+    def _flush_kafka(self):
+        """
+        wait for the EventOnElasticMsg produced so far to be delivered, producing the failed ones again.
+        it must be called before committing consumer offsets, see KafkaHelper.deliver.
+        """
+        self.kafka_helper.deliver()
 
     def listen(self):
         """listen for traceroute request IDs from driver and retrieve results"""
@@ -186,23 +334,25 @@ class ActiveProbingCollector:
         signal.signal(signal.SIGINT, _stop_handler)
 
         # measurement jobs
-        msms_map = {}
         proc_time_map = {}
 
-        prev_measurements = []
-
-        as_traceroute_driver = AsTracerouteDriver()
+        as_traceroute_driver = AsTracerouteDriver(self._pfx_origin_db)
         while True:
 
             if shutdown["count"] > 0:
                 logging.info("Shutting down")
+                self.tracker.save()
+                self._flush_kafka()
                 break
 
             msg = self.kafka_helper.poll(KAFKA_POOLING_INTERVAL)
+            if msg is None:
+                # no pending messages, make sure the notifications produced so far are delivered
+                self._flush_kafka()
 
             # quickly polling all pending messages from kafka before processing results
             if msg is not None and not msg.error():
-                msms_msg = MeasurementsRequestedMsg.from_str(msg.value().decode("utf-8"))
+                msms_msg = MeasurementsRequestedMsg.from_wire(msg.value())
 
                 view_ts = msms_msg.view_ts
 
@@ -213,56 +363,41 @@ class ActiveProbingCollector:
                 # collect measurement from event
                 for msm in msms_msg.measurements:
                     assert (isinstance(msm, AtlasMeasurement))
-                    if msm.msm_id > 0:
+                    if msm.msm_id > 0 and self.tracker.add(msm):
                         # only save succeeded measurements
-                        msms_map[int(msm.msm_id)] = msm
+                        logging.info("tracking measurement {} for event {} (total {} pending)".format(
+                            msm.msm_id, msm.event_id, len(self.tracker)))
                 continue  # continue to poll next kafka message
 
-            # all messages from Kafka have been registered, continue to processing the measurements
-            # check current measurements to see if new results have come
-            if len(msms_map.keys()) != len(prev_measurements):
-                # only log changes of pending measurement results
-                prev_measurements = msms_map.keys()
-                logging.info("ongoing measurements updated (total {} stored in cache): {}".format(len(msms_map.keys()), msms_map.keys()))
-
-            finished_msms = []
-            for msm_id, (status, responses) in self._retrieve_results_map(list(msms_map)):
-                if shutdown["count"] > 0:
-                    logging.info("Shutting down")
-                    break
-                if msm_id not in msms_map:
-                    logging.warn("retrieved measurement {} but msms_map does not have it".format(msm_id))
-                    continue
-                msm = msms_map.pop(msm_id)
-                assert (isinstance(msm, AtlasMeasurement))
-                if status == TRACEROUTE_STATUS.RetrievalError:
-                    # failed to retrieve status from Atlas
-                    logging.error("cannot retrieve result for measurement %d, discard now", msm_id)
-                    continue
-                elif status == TRACEROUTE_STATUS.Ongoing:
-                    # on-going measurement, put popped measurement object back into map
-                    msms_map[msm_id] = msm
-                    continue
-                elif status == TRACEROUTE_STATUS.Failed:
-                    # measurement failed
-                    logging.info("measurement %d failed (https://atlas.ripe.net/api/v2/measurements/%s/): %s",
-                                 msm_id, msm_id, responses)
-                    logging.info("%s", msm.as_str())
-                    msm.results = []
-                    msm.request_error = responses
-                    finished_msms.append(msm)
-                    continue
-                elif status == TRACEROUTE_STATUS.Finished:
-                    logging.info("processing results for measurement {} for event {}".format(msm_id, msm.event_id))
-                    view_ts = msm.event_id.split("-")[1]
-                    traceroute_results = extract_atlas_response(pfx_origin_db=self._pfx_origin_db, responses=responses,
-                                                                target_pfx=msm.target_pfx)
-                    as_traceroute_driver.fill_as_traceroute_results(traceroute_results=traceroute_results, view_ts=view_ts)
-                    msm.results = traceroute_results
-                    finished_msms.append(msm)
+            # all messages from Kafka have been registered, persist the pending measurements
+            self.tracker.save()
+
+            # check the measurements that are due to see if new results have come
+            due_msms = self.tracker.pop_due()
+            if not due_msms:
+                continue
+            logging.info("checking {} of {} pending measurements".format(len(due_msms), len(self.tracker)))
+
+            finished_msms, stopped_msms = self._check_measurements(due_msms, stop=lambda: shutdown["count"] > 0)
+
+            ip_to_as_stats = {}
+            if stopped_msms:
+                ip_to_as_stats = self._extract_results(stopped_msms, as_traceroute_driver)
 
             if finished_msms:
                 logging.info("updating events for {} finished measurements".format(len(finished_msms)))
-                self._process_finished_measurements(finished_msms)
-                logging.info("updating kafka offset")
-                self.kafka_helper.commit_offset()
+                uncommitted = self._process_finished_measurements(finished_msms, ip_to_as_stats)
+                # finished measurements stay tracked until their events are committed, the ones of events that could
+                # not be committed are checked again later
+                for msm in finished_msms:
+                    if msm.event_id in uncommitted:
+                        self.tracker.reschedule(int(msm.msm_id))
+                    else:
+                        self.tracker.remove(int(msm.msm_id))
+                self.tracker.save()
+                self._flush_kafka()
+                if uncommitted:
+                    logging.warning("not updating kafka offset, {} events are not committed".format(len(uncommitted)))
+                else:
+                    logging.info("updating kafka offset")
+                    self.kafka_helper.commit_offset()
@@ -30,6 +30,7 @@
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
+import functools
 import json
 import logging
 import signal
@@ -41,12 +42,14 @@ from future.utils import iteritems
 import grip.common
 import grip.coodinator.announce
 from grip.active.ripe_atlas import target_ip_generator
+from grip.active.ripe_atlas.target_ip_generator import TargetIpGenerator, pfx_sort_key
 from grip.active.ripe_atlas.ripe_atlas_probe import ProbeSelector
 from grip.active.ripe_atlas.ripe_atlas_utils import RipeAtlasUtils
 from grip.common import *
 from grip.events.event import Event
 from grip.events.pfxevent import PfxEvent
 from grip.utils.data.elastic import ElasticConn
+from grip.utils.data.elastic_bulk import BulkWriteError
 from grip.utils.general import to_dict
 from grip.utils.kafka import KafkaHelper
 from grip.utils.messages import EventOnElasticMsg, MeasurementsRequestedMsg
@@ -75,27 +78,30 @@ class ActiveProbingDriver:
         self.event_type = event_type
         self.traceroute = RipeAtlasUtils(key=key, num_probes=ACTIVE_MAX_PROBES_PER_TARGET)
         self.probe_selector = ProbeSelector(event_type)
+        self.target_ip_generator = TargetIpGenerator()
         self.tr_event_count = {}  # count of events requested traceroutes per bin
 
         # kafka-related initialization
         self.kafka_helper = KafkaHelper()
-        self.kafka_helper.init_producer(topic=producer_topic)
+        self.kafka_helper.init_producer(topic=producer_topic, asynchronous=True)
         self.kafka_helper.init_consumer(topics=[consumer_topic], group_id=consumer_group, offset="earliest")
 
         # ElasticSearch
         self.es_conn = ElasticConn()
+        self.es_bulk = self.es_conn.bulk_writer()
 
-    def request_measurements(self, event):
+    def _prepare_request(self, event, asn_probes_cache=None):
         """
-        Send RIPE Atlas traceroute requests for a given event.
+        Check whether traceroutes can be requested for a given event, and select its vantage points and targets.
+        The traceroute metrics of the event are updated along the way.
+
         :param event:
-        :return:
+        :param asn_probes_cache: (optional) dict of (view_ts, ASN) to the probes picked for the ASN, shared by the
+        events of a batch so that the probes of each ASN are picked once
+        :return: (tr-worthy pfx events, [(pfx_event, target_ip, target_prefix)], asn_probes_mapping) tuple, None if
+        the event is skipped
         """
         assert isinstance(event, Event)
-        # local variables
-        all_requested_jobs = []
-        all_failed_jobs = []
-        all_succeeded_jobs = []
 
         # extract traceroute worthy prefix events
         tr_worthy_pfx_events = [pfx_event for pfx_event in event.pfx_events if
@@ -114,13 +120,13 @@ class ActiveProbingDriver:
             event.tr_metrics.tr_skipped = True
             event.tr_metrics.tr_skip_reason = "traceroute disabled for %s" % self.event_type
             logging.info("skipping traceroutes due to explicit disabling")
-            return []
+            return None
         if self.tr_event_count[event.view_ts] >= ACTIVE_MAX_EVENTS_PER_BIN:
             event.tr_metrics.tr_skipped = True
             event.tr_metrics.tr_skip_reason = "reached self-imposed rate limit of %d per five minutes for %s" \
                                               % (ACTIVE_MAX_EVENTS_PER_BIN, self.event_type)
             logging.info("skipping traceroutes due to rate limiting")
-            return []
+            return None
 
         # increase the counter and continue requesting traceroute
         self.tr_event_count[event.view_ts] += 1
@@ -133,9 +139,14 @@ class ActiveProbingDriver:
         succeeded = 0
         for asn in event_ases:
             asn = str(asn)
-            # Pick the given number of adjacent probes according to the given ASN
-            probes = self.probe_selector.pick_adjacent_probes(asn, ACTIVE_MAX_PROBES_PER_TARGET)
-            logging.info("found {} probes for asn {}".format(len(probes), asn))
+            if asn_probes_cache is not None and (event.view_ts, asn) in asn_probes_cache:
+                probes = asn_probes_cache[(event.view_ts, asn)]
+            else:
+                # Pick the given number of adjacent probes according to the given ASN
+                probes = self.probe_selector.pick_adjacent_probes(asn, ACTIVE_MAX_PROBES_PER_TARGET)
+                logging.info("found {} probes for asn {}".format(len(probes), asn))
+                if asn_probes_cache is not None:
+                    asn_probes_cache[(event.view_ts, asn)] = probes
             if probes:
                 succeeded += 1
                 asn_probes_mapping[asn] = probes
@@ -152,7 +163,7 @@ class ActiveProbingDriver:
         # now go through the pfx events and pick some to traceroute
         # this also generates the IP addresses that we will traceroute
         probe_pfx_ip_map = self._select_target_ip(event)
-        logging.info("start sending atlas requests")
+        targets = []  # (pfx_event, target_ip, target_prefix)
         for pfx_event in tr_worthy_pfx_events[:ACTIVE_MAX_PFX_EVENTS]:
             assert isinstance(pfx_event, PfxEvent)
             # get probe IP
@@ -166,14 +177,24 @@ class ActiveProbingDriver:
 
             target_ip = probe_pfx_ip_map[target_prefix]
             event.tr_metrics.selected_pfx_event_cnt += 1
+            targets.append((pfx_event, target_ip, target_prefix))
+
+        return tr_worthy_pfx_events, targets, asn_probes_mapping
+
+    @staticmethod
+    def _record_requests(event, tr_worthy_pfx_events, targets, results):
+        """
+        Add the measurements requested for a given event to its prefix events and update its traceroute metrics.
 
-            jobs_succeeded, jobs_failed = self.traceroute.create_request(
-                target_ip=target_ip,
-                target_pfx=target_prefix,
-                asn_probes_mapping=asn_probes_mapping,
-                event_id=event.event_id
-            )
+        :param targets: list of (pfx_event, target_ip, target_prefix) tuples
+        :param results: list of (jobs_succeeded, jobs_failed) tuples, one per target
+        :return: list of succeeded jobs
+        """
+        all_requested_jobs = []
+        all_failed_jobs = []
+        all_succeeded_jobs = []
 
+        for (pfx_event, _, _), (jobs_succeeded, jobs_failed) in zip(targets, results):
             all_requested_jobs.extend(jobs_succeeded + jobs_failed)
             all_succeeded_jobs.extend(jobs_succeeded)
             all_failed_jobs.extend(jobs_failed)
@@ -195,23 +216,98 @@ class ActiveProbingDriver:
 
         return all_succeeded_jobs
 
-    @staticmethod
-    def _select_target_ip(event):
-        # create a pfx2probe-ip dataset
-        ip_gen = grip.active.ripe_atlas.target_ip_generator.TargetIpGenerator()
+    def request_measurements(self, event):
+        """
+        Send RIPE Atlas traceroute requests for a given event.
+        :param event:
+        :return:
+        """
+        request = self._prepare_request(event)
+        if request is None:
+            return []
+        tr_worthy_pfx_events, targets, asn_probes_mapping = request
+
+        # requests for all the selected pfx events are sent concurrently, results come back in order
+        logging.info("start sending atlas requests")
+        results = self.traceroute.create_requests(
+            targets=[(target_ip, target_prefix) for _, target_ip, target_prefix in targets],
+            asn_probes_mapping=asn_probes_mapping,
+            event_id=event.event_id
+        )
+
+        return self._record_requests(event, tr_worthy_pfx_events, targets, results)
+
+    def request_measurements_batch(self, events):
+        """
+        Send RIPE Atlas traceroute requests for a batch of events.
+
+        The events are checked in order against the per-bin rate limit, exactly as if they were passed one by one to
+        `request_measurements`. The probes of each ASN are picked once for the whole batch, and the requests of all
+        the events are sent concurrently.
+
+        The processing time of each event (event_metrics.proc_time_driver) is the time spent preparing and recording
+        its own requests, plus the time the concurrent requests of the batch took to be sent.
+
+        :param events: list of Event objects
+        :return: list of succeeded jobs for each event, in the same order as events
+        """
+        asn_probes_cache = {}
+        proc_times = [0.0] * len(events)
+        prepared = []  # (event index, tr-worthy pfx events, targets, asn_probes_mapping)
+        for idx, event in enumerate(events):
+            start_time = time.time()
+            request = self._prepare_request(event, asn_probes_cache)
+            proc_times[idx] = time.time() - start_time
+            if request is not None:
+                prepared.append((idx,) + request)
+
+        logging.info("start sending atlas requests for {} events".format(len(prepared)))
+        start_time = time.time()
+        results = self.traceroute.create_event_requests([
+            (events[idx].event_id, [(target_ip, target_prefix) for _, target_ip, target_prefix in targets],
+             asn_probes_mapping)
+            for idx, _, targets, asn_probes_mapping in prepared
+        ])
+        dispatch_time = time.time() - start_time
+
+        succeeded = [[] for _ in events]
+        for (idx, tr_worthy_pfx_events, targets, _), event_results in zip(prepared, results):
+            start_time = time.time()
+            succeeded[idx] = self._record_requests(events[idx], tr_worthy_pfx_events, targets, event_results)
+            proc_times[idx] += dispatch_time + time.time() - start_time
+        for event, proc_time in zip(events, proc_times):
+            event.event_metrics.proc_time_driver = proc_time
+        return succeeded
+
+    def _select_target_ip(self, event):
+        # create a pfx2probe-ip dataset, the prefixes of the event are swept in order by the shared generator
+        pfxs = set()
         for pfx_event in event.pfx_events:
             assert isinstance(pfx_event, PfxEvent)
+            pfx = pfx_event.details.get_prefix_of_interest()
             try:
-                ip_gen.add_pfx(pfx_event.details.get_prefix_of_interest())
+                if self.target_ip_generator.is_probe_pfx(pfx):
+                    pfxs.add(pfx)
             except ValueError as e:
-                logging.error("cannot find probe IP for prefix: {}".format(pfx_event.details.get_prefix_of_interest()))
+                logging.error("cannot find probe IP for prefix: {}".format(pfx))
                 raise e
 
         # get a mapping from prefixes to probe IP
-        pfx_ip_map = ip_gen.get_probe_pfx_ip_map()
+        pfx_ip_map = dict(self.target_ip_generator.iter_probe_pfx_ips(sorted(pfxs, key=pfx_sort_key)))
 
         return pfx_ip_map
 
+    def _notify_collector(self, event, msm_requests):
+        """send a message to collector to let it know that some event's traceroute has been requested"""
+        msg = MeasurementsRequestedMsg.from_event(
+            sender="driver",
+            event_type=event.event_type,
+            view_ts=event.view_ts,
+            event_id=event.event_id,
+            measurements=msm_requests)
+        logging.info("sending MeasurementsRequestedMsg to collector: {}".format(msg.to_str()))
+        self.kafka_helper.produce(value_str=msg.to_str())
+
     def process_event(self, event):
         """
         Given a Event object, process and request for active measurements.
@@ -233,23 +329,133 @@ class ActiveProbingDriver:
         self.es_conn.index_event(event=event, debug=self.DEBUG, update=True)
 
         if len(succeeeded_msm_requests) > 0:
-            # send a message to collector to let it know that some event's traceroute has been requested
-            msg = MeasurementsRequestedMsg.from_event(
-                sender="driver",
-                event_type=event.event_type,
-                view_ts=event.view_ts,
-                event_id=event.event_id,
-                measurements=succeeeded_msm_requests)
-            logging.info("sending MeasurementsRequestedMsg to collector: {}".format(msg.to_str()))
-            self.kafka_helper.produce(value_str=msg.to_str(), flush=True)
-
-    def listen(self, limit=float("inf")):
+            self._notify_collector(event, succeeeded_msm_requests)
+
+    def process_events(self, events):
+        """
+        Given a batch of Event objects, request active measurements for all of them (see `request_measurements_batch`)
+        and update them on ElasticSearch with bulk requests. The collector is notified of the measurements of each
+        event once the event is committed.
+
+        :param events: list of Event objects
+        :raises BulkWriteError: with the BulkItems of the events that could still be committed by retrying, see
+        `retry_commits`; the kafka offset of the batch must not be committed before they are
+        """
+        for event in events:
+            # events must be traceroute worthy
+            assert event.summary.tr_worthy
+
+        # request measurements
+        succeeded_msm_requests = self.request_measurements_batch(events)
+
+        failed = []
+        for event, msm_requests in zip(events, succeeded_msm_requests):
+            logging.info("finished processing event %s: %s", event.event_id, json.dumps(to_dict(event.tr_metrics)))
+            callback = functools.partial(self._notify_collector, msm_requests=msm_requests) if msm_requests else None
+            failed.extend(self.es_bulk.add_event(event, index=self.es_conn.infer_index_name_by_id(event.event_id,
+                                                                                                 self.DEBUG),
+                                                 update=True, callback=callback))
+        failed.extend(self.es_bulk.flush())
+        if failed:
+            logging.error("failed to commit {} events with requested measurements".format(len(failed)))
+        # the bulk writer gave up retrying transient failures, the measurements are requested by then so the caller
+        # must retry the writes rather than process the batch again. events rejected by ElasticSearch would be
+        # rejected again and are only logged
+        retriable = [item for item in failed if item.retriable]
+        if retriable:
+            raise BulkWriteError(retriable)
+
+    def retry_commits(self, items):
+        """
+        Write again the events whose measurements are requested but whose bulk writes failed, until they are
+        committed or rejected by ElasticSearch. Measurements must not be requested twice for the same event, so the
+        writes are retried with exponential backoff rather than processing the events again. The collector is
+        notified of the measurements of each event once the event is committed.
+
+        :param items: BulkItems of the events to commit, see `BulkWriteError`
+        """
+        attempt = 0
+        while items:
+            backoff = min(ACTIVE_COMMIT_RETRY_BACKOFF * 2 ** attempt, ACTIVE_COMMIT_MAX_BACKOFF)
+            logging.warning("retrying to commit {} events in {} seconds".format(len(items), backoff))
+            time.sleep(backoff)
+            attempt += 1
+            failed = []
+            for item in items:
+                failed.extend(self.es_bulk.add(item))
+            failed.extend(self.es_bulk.flush())
+            items = [item for item in failed if item.retriable]
+
+    def process_messages(self, messages):
+        """
+        Request active measurements for a batch of EventOnElasticMsg messages coming from the tagger.
+
+        Events announced more than once in the batch are processed once, and all events are retrieved with one
+        multi-get request. See `process_events`.
+
+        :param messages: list of kafka messages
+        """
+        event_ready_msgs = {}
+        for msg in messages:
+            if msg.error():
+                continue
+            event_ready_msg = EventOnElasticMsg.from_wire(msg.value())
+            if not event_ready_msg.tr_worthy or "v2" not in event_ready_msg.es_index:
+                # if the event is not tr_worthy, don't bother doing anything forward
+                continue
+            event_ready_msgs[event_ready_msg.es_id] = event_ready_msg
+
+        # the event snapshots embedded in the messages are only used to skip old events without reading them,
+        # the events are written back as a whole and must be read from ElasticSearch
+        for es_id, event_ready_msg in list(event_ready_msgs.items()):
+            snapshot = event_ready_msg.get_event()
+            if snapshot is not None and self._is_too_old(snapshot):
+                del event_ready_msgs[es_id]
+        events = {}
+        if event_ready_msgs:
+            events = self.es_conn.get_events_by_ids(event_ready_msgs.keys(),
+                                                    indices={es_id: msg.es_index
+                                                             for es_id, msg in event_ready_msgs.items()})
+
+        to_process = []
+        for es_id, event_ready_msg in event_ready_msgs.items():
+            event = events.get(es_id)
+            if event is None:
+                logging.info("cannot retrieve event from {}".format(event_ready_msg.to_url()))
+                continue
+            if self._is_too_old(event):
+                continue
+            to_process.append(event)
+
+        if to_process:
+            self.process_events(to_process)
+
+    @staticmethod
+    def _is_too_old(event):
+        """check if the event is too old for conducting traceroutes, threshold is defined in ACTIVE_MAX_TIME_DELTA"""
+        if time.time() - event.view_ts > ACTIVE_MAX_TIME_DELTA:
+            # event is too old to worth traceroute
+            logging.info("event {} is older than {} seconds before now, skipping traceroute"
+                         .format(event.event_id, ACTIVE_MAX_TIME_DELTA))
+            return True
+        return False
+
+    def _flush_kafka(self):
+        """
+        wait for the MeasurementsRequestedMsg produced so far to be delivered, producing the failed ones again.
+        it must be called before committing consumer offsets: the driver stops with KafkaDeliveryError rather than
+        committing the offsets of events whose messages to the collector are lost.
+        """
+        self.kafka_helper.deliver()
+
+    def listen(self, limit=float("inf"), batch_size=1):
         """
         Listen to EventReadyMsg coming in from Tagger via Kafka. The message contains information on how to retrieve
         event object from ElasticSearch. The active probing driver and collector only updates the event object on
         ElasticSearch if necessary.
 
         :param limit: maximum number of messages it processes in current execution
+        :param batch_size: number of messages to process at once, kafka offsets are committed once per batch
         """
         shutdown = {"count": 0}
 
@@ -268,10 +474,33 @@ class ActiveProbingDriver:
             if shutdown["count"] > 0 or msg_count >= limit:
                 # shutdown the service if sigint/sigterm received, or reach msg limit
                 logging.info("Shutting down")
+                self._flush_kafka()
                 break
 
+            if batch_size > 1:
+                messages = self.kafka_helper.consume(batch_size, 5)
+                if not messages:
+                    # no more pending events, deliver the messages produced so far
+                    self._flush_kafka()
+                    continue
+                msg_count += len(messages)
+                # measurements are requested by then, the batch must not be processed again
+                try:
+                    self.process_messages(messages)
+                except BulkWriteError as e:
+                    # deliver the notifications of the committed events first, the other events are committed
+                    # before the offset of the batch
+                    self._flush_kafka()
+                    self.retry_commits(e.failed)
+                self._flush_kafka()
+                self.kafka_helper.commit_offset()
+                continue
+
             # retrieve message from kafka
             msg = self.kafka_helper.poll(5)
+            if msg is None:
+                # no more pending events, deliver the messages produced so far
+                self._flush_kafka()
             if msg is None or msg.error():
                 self.kafka_helper.commit_offset()
                 continue
@@ -280,27 +509,29 @@ class ActiveProbingDriver:
             # at this point, we have a good EventOnElasticMsg object from the tagger.
             # Example message:
             # 'tagger observatory-test-moas-2019-9-30 moas-1569847800-5602_7713 event_result False'
-            event_ready_msg = EventOnElasticMsg.from_str(msg.value().decode("utf-8"))
+            event_ready_msg = EventOnElasticMsg.from_wire(msg.value())
             if not event_ready_msg.tr_worthy or "v2" not in event_ready_msg.es_index:
                 # if the event is not tr_worthy, don't bother doing anything forward
                 self.kafka_helper.commit_offset()
                 continue
 
             # now the event is tr_worthy
-            # retrieve event from ElasticSearch and parse it into Event object
+            # the event snapshot embedded in the message is only used to skip old events without reading them.
+            # the event is written back as a whole, so it is retrieved from ElasticSearch and parsed into Event object
+            snapshot = event_ready_msg.get_event()
+            if snapshot is not None and self._is_too_old(snapshot):
+                self.kafka_helper.commit_offset()
+                continue
             event = self.es_conn.get_event_by_id(index=event_ready_msg.es_index, event_id=event_ready_msg.es_id)
             if event is None:
                 logging.info("cannot retrieve event from {}".format(event_ready_msg.to_url()))
                 self.kafka_helper.commit_offset()
                 continue
-            # check if the event is too old for conducting traceroutes, threshold is defined in ACTIVE_MAX_TIME_DELTA
-            if time.time() - event.view_ts > ACTIVE_MAX_TIME_DELTA:
-                # event is too old to worth traceroute
-                logging.info("event {} is older than {} seconds before now, skipping traceroute"
-                             .format(event.event_id, ACTIVE_MAX_TIME_DELTA))
+            if self._is_too_old(event):
                 self.kafka_helper.commit_offset()
                 continue
             self.process_event(event)
+            self._flush_kafka()
             self.kafka_helper.commit_offset()
         # end of while True loop
 
@@ -0,0 +1,148 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import time
+from collections import OrderedDict
+
+from grip.redis import Pfx2AsHistorical
+from grip.redis.pfx2as_historical import DAYS_KEY
+
+IP_TO_AS_CACHE_SIZE = 100000  # number of (prefix, day) entries kept in memory
+IP_TO_AS_DAYS_CHECK_INTERVAL = 60  # seconds between two checks for newly promoted days
+DAY_SECONDS = 86400
+
+
+class IpToAsResolver(Pfx2AsHistorical):
+    """
+    Pfx2AsHistorical memoising the origin lookups of traceroute hops, as the same router IPs recur across probes,
+    measurements and events. The records of a prefix are cached per day in a bounded LRU and filtered by `max_ts` on
+    each lookup, so results are the same as `Pfx2AsHistorical.lookup`. Lookups with min_ts or exact_match set, or of
+    IPv6 prefixes, go to Redis as usual.
+
+    The records only change when a new day is promoted into the database, the cache is cleared when the newest
+    promoted day changes. The list of promoted days is checked at most every `days_check_interval` seconds.
+
+    The resolver counts the cacheable lookups and the ones answered without querying Redis (`lookup_cnt` and
+    `hit_cnt`). The first lookup of a record fetched by `prefetch` counts as a miss, the following ones as hits.
+    """
+
+    def __init__(self, pfx2as=None, cache_size=IP_TO_AS_CACHE_SIZE, days_check_interval=IP_TO_AS_DAYS_CHECK_INTERVAL):
+        """
+        :param pfx2as: (optional) Pfx2AsHistorical object whose Redis connection is used
+        :param cache_size: maximum number of (prefix, day) entries to cache
+        :param days_check_interval: seconds between two checks for newly promoted days
+        """
+        if pfx2as is None:
+            pfx2as = Pfx2AsHistorical()
+        self.rh = pfx2as.rh
+        self.cache_size = cache_size
+        self.lookup_cnt = 0
+        self.hit_cnt = 0
+        self._cache = OrderedDict()
+        self._unclaimed = set()  # prefetched entries not looked up yet
+        self.days_check_interval = days_check_interval
+        self._newest_day = None  # newest day promoted into the database when the cache was filled
+        self._days_checked = None  # time of the last check of the promoted days
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def _get_key(prefix, ts):
+        return prefix, None if ts is None else int(ts) // DAY_SECONDS
+
+    def _store(self, key, result):
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            evicted, _ = self._cache.popitem(last=False)
+            self._unclaimed.discard(evicted)
+
+    def _check_days(self):
+        """clear the cache if a new day was promoted into the database since the cache was filled"""
+        now = time.time()
+        if self._days_checked is not None and now - self._days_checked < self.days_check_interval:
+            return
+        self._days_checked = now
+        days = self.rh.zrange(DAYS_KEY, -1, -1, withscores=True)
+        newest_day = int(days[0][1]) if days else None
+        if newest_day != self._newest_day:
+            self._cache.clear()
+            self._unclaimed.clear()
+            self._newest_day = newest_day
+
+    def get_hit_rate(self):
+        """return the fraction of the cacheable lookups answered without querying Redis"""
+        return self.hit_cnt / self.lookup_cnt if self.lookup_cnt else 0.0
+
+    def prefetch(self, queries):
+        """
+        fetch the records of the given (prefix, timestamp) queries that are not cached yet with one pipelined request.
+        Duplicate queries, and queries of the same prefix for different days, are fetched once.
+        """
+        self._check_days()
+        missing = {self._get_key(prefix, ts) for prefix, ts in queries if ":" not in prefix}
+        missing = [key for key in missing if key not in self._cache]
+        if not missing:
+            return
+        found = self.lookup_many({prefix for prefix, _ in missing})
+        for key in missing:
+            if key[0] in found:
+                self._store(key, found[key[0]])
+                self._unclaimed.add(key)
+
+    def lookup(self, prefix, min_ts=None, max_ts=None, exact_match=False):
+        if min_ts is not None or exact_match or ":" in prefix:
+            return Pfx2AsHistorical.lookup(self, prefix, min_ts=min_ts, max_ts=max_ts, exact_match=exact_match)
+
+        self._check_days()
+        self.lookup_cnt += 1
+        key = self._get_key(prefix, max_ts)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            if key in self._unclaimed:
+                self._unclaimed.discard(key)
+            else:
+                self.hit_cnt += 1
+            matched_pfx, records = self._cache[key]
+        else:
+            found = self.lookup_many([prefix])
+            if prefix not in found:
+                # malformatted prefix
+                return Pfx2AsHistorical.lookup(self, prefix, max_ts=max_ts)
+            self._store(key, found[prefix])
+            matched_pfx, records = found[prefix]
+
+        if max_ts is not None:
+            # only retain records with start time before the `max_ts`
+            records = [record for record in records if int(record[0]) <= int(max_ts)]
+        return matched_pfx, records
@@ -0,0 +1,221 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+from ripe.atlas.cousteau import AtlasCreateRequest
+
+from grip.common import ATLAS_MAX_WORKERS, ATLAS_MAX_REQUESTS_PER_SECOND, ATLAS_REQUEST_BURST, ATLAS_MAX_RETRIES, \
+    ATLAS_RETRY_BACKOFF, ATLAS_REQUEST_TIMEOUT
+
+# HTTP status codes of failures worth retrying, i.e. the measurement was certainly not created: rate limited by Atlas
+# or service unavailable. other server errors may come after the measurement was created.
+RETRY_STATUS_CODES = {429, 503}
+
+
+def is_connect_error(error):
+    """
+    Check if a request failed before reaching the server, in which case it can safely be sent again.
+    Other errors (e.g. read timeouts) may happen after the server received the request.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # the underlying urllib3 error is wrapped in a MaxRetryError
+        reason = getattr(error.args[0], "reason", error.args[0])
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting the rate of outgoing requests.
+
+    The bucket holds up to `burst` tokens and refills at `rate` tokens per second. Each call to `acquire` takes one
+    token, sleeping until the token is available if the bucket is empty.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        assert rate > 0 and burst >= 1
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token from the bucket, waiting for it if necessary.
+
+        :return: number of seconds waited
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # reserve the token now, a negative balance is paid back by waiting outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class MeasurementCreateRequest(AtlasCreateRequest):
+    """
+    AtlasCreateRequest that keeps the HTTP status code of the response, reuses one HTTP session per thread, times out
+    hung requests, and supports plain HTTP servers (e.g. a local Atlas stub).
+    """
+
+    _local = threading.local()
+
+    def __init__(self, scheme="https", timeout=ATLAS_REQUEST_TIMEOUT, **kwargs):
+        super(MeasurementCreateRequest, self).__init__(**kwargs)
+        self.scheme = scheme
+        self.timeout = timeout
+        self.status_code = None
+        # whether the request failed before reaching the server
+        self.connect_failed = False
+
+    def build_url(self):
+        self.url = "{0}://{1}{2}".format(self.scheme, self.server, self.url_path)
+
+    def get_http_method(self, method):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        try:
+            response = session.request(method, self.url, timeout=self.timeout, **self.http_method_args)
+        except requests.exceptions.RequestException as e:
+            self.connect_failed = is_connect_error(e)
+            raise
+        self.status_code = response.status_code
+        return response
+
+
+class AtlasDispatcher:
+    """
+    Send RIPE Atlas measurement creation requests concurrently.
+
+    Requests are executed by a bounded pool of worker threads, throttled by a client-side rate limiter shared by all
+    workers. Measurement creation is not idempotent, so only the requests that certainly did not create a measurement
+    (connection error, rate limited, service unavailable) are retried, with exponential backoff and full jitter.
+    """
+
+    def __init__(self, key, max_workers=ATLAS_MAX_WORKERS,
+                 rate=ATLAS_MAX_REQUESTS_PER_SECOND, burst=ATLAS_REQUEST_BURST,
+                 max_retries=ATLAS_MAX_RETRIES, retry_backoff=ATLAS_RETRY_BACKOFF,
+                 server=None, scheme="https", timeout=ATLAS_REQUEST_TIMEOUT):
+        self.key = key
+        self.timeout = timeout
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.server = server
+        self.scheme = scheme
+        self.rate_limiter = RateLimiter(rate=rate, burst=burst)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="atlas-dispatcher")
+            return self._executor
+
+    def close(self):
+        """shutdown the worker pool"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    @staticmethod
+    def _is_transient(atlas_request):
+        if atlas_request.status_code is None:
+            # no response at all, only retry if the request did not reach the server
+            return atlas_request.connect_failed
+        return atlas_request.status_code in RETRY_STATUS_CODES
+
+    def create(self, measurements, sources):
+        """
+        Create one one-off measurement, retrying on transient failures.
+
+        :param measurements: list of cousteau measurement objects
+        :param sources: list of cousteau AtlasSource objects
+        :return: (is_success, response) tuple as returned by AtlasCreateRequest.create
+        """
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            atlas_request = MeasurementCreateRequest(
+                scheme=self.scheme,
+                timeout=self.timeout,
+                server=self.server,
+                key=self.key,
+                measurements=measurements,
+                sources=sources,
+                is_oneoff=True
+            )
+            (is_success, response) = atlas_request.create()
+            if is_success or attempt >= self.max_retries or not self._is_transient(atlas_request):
+                return is_success, response
+            # full jitter: spread the retries of concurrent workers over the whole backoff window
+            delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+            attempt += 1
+            logging.warning("measurement creation failed (status %s), retry %d/%d in %.2fs",
+                            atlas_request.status_code, attempt, self.max_retries, delay)
+            time.sleep(delay)
+
+    def dispatch(self, msm_requests):
+        """
+        Create measurements concurrently.
+
+        :param msm_requests: list of (measurements, sources) tuples
+        :return: list of (is_success, response) tuples, in the same order as msm_requests
+        """
+        if not msm_requests:
+            return []
+        if self.max_workers == 1 or len(msm_requests) == 1:
+            return [self.create(measurements, sources) for measurements, sources in msm_requests]
+        executor = self._get_executor()
+        futures = [executor.submit(self.create, measurements, sources) for measurements, sources in msm_requests]
+        return [future.result() for future in futures]
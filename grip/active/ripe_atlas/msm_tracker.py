@@ -0,0 +1,186 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import heapq
+import json
+import logging
+import os
+import time
+
+from .ripe_atlas_msm import AtlasMeasurement
+
+MSM_MIN_CHECK_INTERVAL = 30  # seconds to wait before checking a measurement's status again
+MSM_MAX_CHECK_INTERVAL = 600  # upper bound of the interval between two checks of the same measurement
+MSM_CHECK_BACKOFF = 0.5  # interval between checks as a fraction of the measurement's age
+MSM_MAX_AGE = 86400  # seconds after which a measurement that has not finished is given up
+
+
+class MeasurementTracker:
+    """
+    Keep track of the pending RIPE Atlas measurements and decide when to check their status next.
+
+    Measurements are kept in a priority queue keyed by their next check time. The interval between two checks of a
+    measurement grows with its age (backoff_factor * age, bounded by min_interval and max_interval): fresh
+    measurements are checked often while the ones taking long are checked less and less frequently.
+
+    When state_file is set, the pending measurements are saved to it by `save` and loaded back on creation, so that
+    in-flight measurements are not lost on restarts.
+    """
+
+    def __init__(self, state_file=None,
+                 min_interval=MSM_MIN_CHECK_INTERVAL, max_interval=MSM_MAX_CHECK_INTERVAL,
+                 backoff_factor=MSM_CHECK_BACKOFF, max_age=MSM_MAX_AGE, clock=time.time):
+        self.state_file = state_file
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.max_age = max_age
+        self._clock = clock
+        self._pending = {}  # msm_id -> [measurement, added time, next check time or None while being checked]
+        self._queue = []  # heap of (check time, msm_id), entries not matching _pending are stale
+        self._dirty = False
+
+        if state_file is not None and os.path.exists(state_file):
+            self.load()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, msm_id):
+        return msm_id in self._pending
+
+    def _schedule(self, msm_id, check_time):
+        self._pending[msm_id][2] = check_time
+        heapq.heappush(self._queue, (check_time, msm_id))
+
+    def add(self, msm, added_time=None, check_time=None):
+        """
+        Start tracking a measurement.
+
+        :param msm: AtlasMeasurement object
+        :param added_time: time the measurement started to be tracked, defaults to now
+        :param check_time: time of the first status check, defaults to min_interval after added_time
+        :return: False if the measurement was already tracked, True otherwise
+        """
+        assert isinstance(msm, AtlasMeasurement)
+        msm_id = int(msm.msm_id)
+        if msm_id in self._pending:
+            return False
+        if added_time is None:
+            added_time = self._clock()
+        if check_time is None:
+            check_time = added_time + self.min_interval
+        self._pending[msm_id] = [msm, added_time, None]
+        self._schedule(msm_id, check_time)
+        self._dirty = True
+        return True
+
+    def get(self, msm_id):
+        """return the tracked measurement with the given ID"""
+        return self._pending[msm_id][0]
+
+    def get_age(self, msm_id):
+        """return the number of seconds since the measurement started to be tracked"""
+        return self._clock() - self._pending[msm_id][1]
+
+    def is_expired(self, msm_id):
+        """check whether the measurement has been tracked for longer than max_age"""
+        return self.get_age(msm_id) > self.max_age
+
+    def get_check_interval(self, msm_id):
+        """return the number of seconds to wait before the next status check of the measurement"""
+        return min(self.max_interval, max(self.min_interval, self.get_age(msm_id) * self.backoff_factor))
+
+    def reschedule(self, msm_id):
+        """schedule the next status check of a measurement, backing off according to its age"""
+        self._schedule(msm_id, self._clock() + self.get_check_interval(msm_id))
+
+    def remove(self, msm_id):
+        """stop tracking a measurement"""
+        if self._pending.pop(msm_id, None) is not None:
+            self._dirty = True
+
+    def pop_due(self):
+        """
+        Get the measurements whose status check is due, in check time order.
+        They remain tracked and must be either rescheduled or removed once checked.
+
+        :return: list of AtlasMeasurement objects
+        """
+        now = self._clock()
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            check_time, msm_id = heapq.heappop(self._queue)
+            entry = self._pending.get(msm_id)
+            if entry is None or entry[2] != check_time:
+                # removed or rescheduled since
+                continue
+            entry[2] = None
+            due.append(entry[0])
+        return due
+
+    def get_next_check_time(self):
+        """return the time of the next due status check, None if there is nothing scheduled"""
+        while self._queue:
+            check_time, msm_id = self._queue[0]
+            entry = self._pending.get(msm_id)
+            if entry is not None and entry[2] == check_time:
+                return check_time
+            heapq.heappop(self._queue)
+        return None
+
+    def save(self):
+        """save the pending measurements to the state file, if they have changed since the last save"""
+        if self.state_file is None or not self._dirty:
+            return
+        state = {
+            "measurements": [
+                {"added_time": added_time, "msm": msm.as_dict()}
+                for msm, added_time, _ in self._pending.values()
+            ]
+        }
+        # write to a temporary file first so that a crash never leaves a truncated state file behind
+        tmp_file = "{}.tmp".format(self.state_file)
+        with open(tmp_file, "w") as fh:
+            json.dump(state, fh)
+        os.replace(tmp_file, self.state_file)
+        self._dirty = False
+
+    def load(self):
+        """load the pending measurements from the state file, their status is checked right away"""
+        with open(self.state_file) as fh:
+            state = json.load(fh)
+        now = self._clock()
+        for entry in state["measurements"]:
+            self.add(AtlasMeasurement.from_dict(entry["msm"]), added_time=entry["added_time"], check_time=now)
+        self._dirty = False
+        logging.info("loaded {} pending measurements from {}".format(len(state["measurements"]), self.state_file))
@@ -30,12 +30,14 @@
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
+import gzip
 import json
 import logging
 import os
-import pickle
 import random
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from ripe.atlas.cousteau import ProbeRequest
 from ripe.atlas.cousteau.exceptions import APIResponseError
@@ -44,6 +46,15 @@ from grip.utils.data.asrank import AsRankUtils
 
 DEBUG = False
 
+# ASes are looked up for probes in groups of at least this many ASes, or once all ASes of a hop are visited
+PROBE_GROUP_SIZE = 20
+# order in which the AS types of a group are looked up for probes
+PROBE_GROUP_TYPES = ["target", "customer", "peer", "provider"]
+# number of target ASes whose neighborhoods are kept in the index
+MAX_INDEXED_TARGETS = 10000
+# directory of the online probes snapshots
+PROBES_SNAPSHOT_DIR = "/tmp/grip-active/probes"
+
 
 class Probe(object):
 
@@ -64,75 +75,285 @@ class Probe(object):
 
 
 class ProbesCache:
-    """Atlas probes information cache server"""
+    """
+    Atlas probes information cache server
+
+    The connected probes are indexed by ASN and by country. The index is saved to a compact snapshot file after each
+    refresh that changed it, and loaded from the snapshot on first use, so that a restart serves the last known probes
+    right away. Stale probes are refreshed in the background, applying only the probes that appeared, disappeared or
+    moved to the index; the index is only fetched synchronously when there is no snapshot to start from.
+    """
 
     # cache will be valid for one hour
     CACHE_VALID_SECONDS = 3600
 
-    def __init__(self, event_type):
+    def __init__(self, event_type, snapshot_file=None):
+        # asn -> set of probes, country code -> set of probes, probe id -> probe
         self.asn_probes_map = {}
+        self.country_probes_map = {}
+        self.probes = {}
         self.updated_time = None
-        self.pickle_name = "/tmp/grip-active/probes/online-probes-{}.pickle".format(event_type)
+        if snapshot_file is None:
+            snapshot_file = os.path.join(PROBES_SNAPSHOT_DIR, "online-probes-{}.json.gz".format(event_type))
+        self.snapshot_file = snapshot_file
+        self._snapshot_loaded = False
+        self._executor = None
+        self._refresh = None
 
     def update_cache_if_needed(self):
-        if self.updated_time is None or int(time.time()) - self.updated_time > self.CACHE_VALID_SECONDS:
+        if self._refresh is not None and self._refresh.done():
+            # a background refresh has completed
+            refresh, self._refresh = self._refresh, None
+            self._apply_refresh(refresh.result())
+
+        if self.updated_time is None and not self._snapshot_loaded:
+            # first time, try to load the snapshot first
+            self._snapshot_loaded = True
+            self.load_snapshot()
+
+        if self._refresh is None and \
+                (self.updated_time is None or int(time.time()) - self.updated_time > self.CACHE_VALID_SECONDS):
             # if the cache is too old, update the cache again
             logging.info("updating online Atlas probes information at {}".format(time.time()))
-            self._collect_probes()
-
-    def _collect_probes(self):
-        tmp_asn_probes_map = {}
-
-        if self.updated_time is None:
-            # first time, try load pickle first
-            try:
-                pickle_file = open(self.pickle_name, "rb")
-                self.asn_probes_map = pickle.load(pickle_file)
-                self.updated_time = int(time.time())
-                pickle_file.close()
-                logging.info("online probes pickle loaded from {}".format(self.pickle_name))
-                return
-            except:
-                logging.info("online probes pickle file doesn't exist, do update now.")
-                pass
+            if self.updated_time is None:
+                # nothing to serve in the meantime
+                self._apply_refresh(self._fetch_probes())
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="atlas-probes")
+                self._refresh = self._executor.submit(self._fetch_probes)
+
+    @staticmethod
+    def _fetch_probes():
+        """
+        download the list of connected probes
 
+        :return: map of probe ID to (asn, country code), None if the download failed
+        """
+        probes = {}
         try:
             __version__ = "2.2.3"
             agent = "RIPE Atlas Tools (Magellan) {}".format(__version__)
-            probes = ProbeRequest(return_objects=True, user_agent=agent, **{"status": 1})
-            count = 0
-            for probe in probes:
+            request = ProbeRequest(return_objects=True, user_agent=agent, **{"status": 1})
+            for probe in request:
                 if probe.status != "Connected":
                     logging.info("probe is not connected %s!", probe)
-                count += 1
-                p = Probe(pid=probe.id, iso2=probe.country_code, asn=probe.asn_v4)
-                if p.asn not in tmp_asn_probes_map:
-                    tmp_asn_probes_map[p.asn] = set()
-                tmp_asn_probes_map[p.asn].add(p)
-                if DEBUG and count % 100 == 0:
-                    print("{}/{} {}".format(count, probes.total_count, p.as_json()))
+                probes[probe.id] = (probe.asn_v4, probe.country_code)
+                if DEBUG and len(probes) % 100 == 0:
+                    print("{}/{} {}".format(len(probes), request.total_count, probe.id))
         except APIResponseError as e:
             logging.warning("RIPE Atlas API response error: {}".format(e))
             logging.warning("stop collecting atlas probes due to previous error.")
+            return None
+        return probes
 
-        self.asn_probes_map = tmp_asn_probes_map
+    def _apply_refresh(self, probes):
+        """apply the downloaded probes to the index and save the snapshot if anything changed"""
         self.updated_time = int(time.time())
+        if probes is None:
+            # keep the current probes until the next refresh
+            return
+        changed = self.apply_probes(probes)
+        logging.info("{} online probes, {} changed".format(len(self.probes), changed))
+        if changed:
+            self.save_snapshot()
+
+    def _add_probe(self, probe):
+        self.probes[probe.probe_id] = probe
+        if probe.asn is not None:
+            self.asn_probes_map.setdefault(probe.asn, set()).add(probe)
+        self.country_probes_map.setdefault(probe.country_code, set()).add(probe)
+
+    def _remove_probe(self, probe_id):
+        probe = self.probes.pop(probe_id)
+        for index, key in [(self.asn_probes_map, probe.asn), (self.country_probes_map, probe.country_code)]:
+            if key in index:
+                index[key].discard(probe)
+                if not index[key]:
+                    del index[key]
+
+    def apply_probes(self, probes):
+        """
+        update the index to the given probes, touching only the probes that changed
 
-        self.dump_pickle()
+        :param probes: map of probe ID to (asn, country code) of all the connected probes
+        :return: number of probes added, removed or updated
+        """
+        changed = 0
+        for probe_id in [probe_id for probe_id in self.probes if probe_id not in probes]:
+            self._remove_probe(probe_id)
+            changed += 1
+        for probe_id, (asn, country_code) in probes.items():
+            probe = self.probes.get(probe_id)
+            if probe is not None:
+                if probe.asn == asn and probe.country_code == country_code:
+                    continue
+                self._remove_probe(probe_id)
+            self._add_probe(Probe(pid=probe_id, iso2=country_code, asn=asn))
+            changed += 1
+        return changed
 
     def get_online_probes(self, asns):
         self.update_cache_if_needed()
         online_asns = [asn for asn in asns if asn in self.asn_probes_map]
         return [(k, list(self.asn_probes_map[k])) for k in online_asns]
 
-    def dump_pickle(self):
-        logging.info("dump online probes pickle file to %s" % self.pickle_name)
-        tmp_dir = "/tmp/grip-active/probes"
+    def get_country_probes(self, country_code):
+        """return the online probes in the given country"""
+        self.update_cache_if_needed()
+        return list(self.country_probes_map.get(country_code, []))
+
+    def save_snapshot(self):
+        """save the probes and the time they were retrieved, replacing the snapshot file atomically"""
+        logging.info("dump online probes snapshot to %s" % self.snapshot_file)
+        snapshot = {
+            "updated_time": self.updated_time,
+            "probes": [[p.probe_id, p.asn, p.country_code] for p in self.probes.values()],
+        }
+        os.makedirs(os.path.dirname(self.snapshot_file) or ".", exist_ok=True)
+        # write to a temporary file first so that a crash never leaves a truncated snapshot behind
+        tmp_file = "{}.tmp".format(self.snapshot_file)
+        with gzip.open(tmp_file, "wt", encoding="utf-8") as fh:
+            json.dump(snapshot, fh, separators=(",", ":"))
+        os.replace(tmp_file, self.snapshot_file)
+
+    def load_snapshot(self):
+        """
+        load the probes from the snapshot file, if any. The snapshot keeps the time the probes were retrieved, so
+        that an old snapshot is refreshed right away.
+
+        :return: True if the snapshot was loaded
+        """
         try:
-            os.makedirs(tmp_dir)
-        except:
-            pass
-        pickle.dump(self.asn_probes_map, open(self.pickle_name, "wb"))
+            with gzip.open(self.snapshot_file, "rt", encoding="utf-8") as fh:
+                snapshot = json.load(fh)
+        except (OSError, ValueError):
+            logging.info("online probes snapshot {} cannot be loaded, do update now.".format(self.snapshot_file))
+            return False
+        self.apply_probes({probe_id: (asn, country_code) for probe_id, asn, country_code in snapshot["probes"]})
+        self.updated_time = snapshot["updated_time"]
+        logging.info("{} online probes loaded from {}".format(len(self.probes), self.snapshot_file))
+        return True
+
+
+class NeighborhoodIndex:
+    """
+    Hop-bounded neighborhoods of target ASes for one ASRank snapshot, joined with the online probes.
+
+    The neighborhood of a target AS is the sequence of AS groups visited by a breadth-first search over its customers,
+    peers and providers: customers of every visited AS, peers of the target and of its providers, and the providers of
+    the target. Each AS is looked up in ASRank once per snapshot, and the groups of each target are generated once,
+    as far as selections need them. The online probes of the groups are cached until the probes cache is refreshed.
+    """
+
+    # end of a hop in the search queue
+    HOP_END = None
+
+    def __init__(self, asrank, probes_cache):
+        self.asrank = asrank
+        self.snapshot = asrank.data_ts
+        self.probes_cache = probes_cache
+        # asn -> {"customers": [...], "peers": [...], "providers": [...]}
+        self.neighbors = {}
+        # (asn, max_hops) -> [groups generated so far, generator of the next groups]
+        self.targets = {}
+        # (asn, max_hops, group number) -> [(as type, [(asn, [probes])])]
+        self.probe_groups = {}
+        self.probes_updated_time = probes_cache.updated_time
+
+    def get_neighbors(self, asn):
+        if asn not in self.neighbors:
+            neighbors = self.asrank.get_neighbor_ases(asn)
+            self.neighbors[asn] = {rel: [a for a in neighbors[rel] if a != ""]
+                                   for rel in ["customers", "peers", "providers"]}
+        return self.neighbors[asn]
+
+    def _search_groups(self, asn, max_hops):
+        """
+        Breadth-first search from the target AS, yielding groups of (asn, type) tuples.
+        """
+        hops = 0
+        group = [(asn, "target")]
+        visited = set()
+        queue = deque([(asn, "target"), self.HOP_END])
+
+        while queue and hops < max_hops:
+            if queue[0] is self.HOP_END:
+                break
+
+            vertex, tag = queue.popleft()
+            if vertex not in visited:
+                # the target AS itself is expanded every time it is reached
+                if vertex != asn:
+                    visited.add(vertex)
+
+                neighbors = self.get_neighbors(vertex)
+                queue.extend((a, "customers") for a in neighbors["customers"])
+                group.extend((a, "customer") for a in neighbors["customers"])
+                if tag == "providers" or tag == "target":
+                    queue.extend((a, "peers") for a in neighbors["peers"])
+                    group.extend((a, "peer") for a in neighbors["peers"])
+                if tag == "target":
+                    queue.extend((a, "providers") for a in neighbors["providers"])
+                    group.extend((a, "provider") for a in neighbors["providers"])
+
+            if len(group) > PROBE_GROUP_SIZE or queue[0] is self.HOP_END:
+                yield group
+                group = []
+                if queue[0] is self.HOP_END:
+                    queue.popleft()
+                    hops += 1
+                    if queue:
+                        queue.append(self.HOP_END)
+
+    def iter_groups(self, asn, max_hops):
+        """
+        Iterate over the AS groups of the neighborhood of the target AS, generating them only once.
+        """
+        key = (asn, max_hops)
+        if key not in self.targets:
+            if len(self.targets) >= MAX_INDEXED_TARGETS:
+                self.targets.clear()
+                self.probe_groups.clear()
+            self.targets[key] = [[], self._search_groups(asn, max_hops)]
+        groups, search = self.targets[key]
+        i = 0
+        while True:
+            if i < len(groups):
+                yield groups[i]
+            else:
+                try:
+                    group = next(search, None)
+                except Exception:
+                    # e.g. ASRank failures, search the neighborhood again next time
+                    del self.targets[key]
+                    raise
+                if group is None:
+                    return
+                groups.append(group)
+                yield group
+            i += 1
+
+    def iter_probe_groups(self, asn, max_hops):
+        """
+        Iterate over the AS groups of the neighborhood of the target AS, as lists of (as type, [(asn, [probes])])
+        in PROBE_GROUP_TYPES order, omitting the types with no ASes in the group.
+        """
+        self.probes_cache.update_cache_if_needed()
+        if self.probes_cache.updated_time != self.probes_updated_time:
+            self.probe_groups.clear()
+            self.probes_updated_time = self.probes_cache.updated_time
+
+        for i, group in enumerate(self.iter_groups(asn, max_hops)):
+            key = (asn, max_hops, i)
+            if key not in self.probe_groups:
+                probe_group = []
+                for as_type in PROBE_GROUP_TYPES:
+                    ases = [int(a) for (a, t) in group if t == as_type and a.isdigit()]
+                    if ases:
+                        probe_group.append((as_type, self.probes_cache.get_online_probes(ases)))
+                self.probe_groups[key] = probe_group
+            yield self.probe_groups[key]
 
 
 class ProbeSelector(object):
@@ -142,6 +363,7 @@ class ProbeSelector(object):
         self.event_type = event_type
         self.timestamp = 0
         self.asrank = None
+        self.index = None
         self.probe_server = ProbesCache(event_type)
 
     def update_asrank(self, timestamp):
@@ -150,87 +372,40 @@ class ProbeSelector(object):
         if timestamp != self.timestamp:
             self.asrank = AsRankUtils(max_ts=timestamp)
             self.timestamp = timestamp
+            if self.index is None or self.index.snapshot != self.asrank.data_ts:
+                # the neighborhoods are only rebuilt for a new ASRank snapshot
+                self.index = NeighborhoodIndex(self.asrank, self.probe_server)
+            else:
+                self.index.asrank = self.asrank
         return True
 
     def pick_adjacent_probes(self, asn, threshold=None, max_hops=5):
         """
         pick probes from adjacent ASes
-        FIXME: the implementation seems too complicated for clarity and ease of understanding
+
+        The neighborhood of the AS is visited group by group (see NeighborhoodIndex), picking one random online probe
+        per AS, until the threshold is reached.
         """
 
-        if self.asrank is None:
+        if self.index is None:
             # it is possible that ASRank is not ready
             return None
 
-        hops = 0
         probes_selected = []
-        process_group = list()
-        process_group.append((asn, 'target'))
-        visited, queue = set(), [(asn, 'target'), '*']
-
-        while queue and (hops < max_hops):
-            if queue[0] == '*':
-                # reach the end of the queue
-                break
-
-            # pop the first item in queue
-            vertex, tag = queue.pop(0)
-
-            if vertex not in visited:
-                # First, check whether we visited the AS before for the same pfx_event
-                # Among target ASes, we would find the common adjacent ASes for them.
-                # If already ran measurements for the AS, we do not need to run again.
-                if vertex != asn:
-                    if vertex in visited:
-                        continue
-                    else:
-                        visited.add(vertex)
-
-                adjacent_ases = self.asrank.get_neighbor_ases(vertex)
-                queue.extend([(a, 'customers') for a in adjacent_ases['customers'] if a != ""])
-                process_group.extend([(a, 'customer') for a in adjacent_ases['customers'] if a != ""])
-                if tag == 'providers' or tag == 'target':
-                    queue.extend([(a, 'peers') for a in adjacent_ases['peers'] if a != ""])
-                    process_group.extend([(a, 'peer') for a in adjacent_ases['peers'] if a != ""])
-                if tag == 'target':
-                    queue.extend([(a, 'providers') for a in adjacent_ases['providers'] if a != ""])
-                    process_group.extend([(a, 'provider') for a in adjacent_ases['providers'] if a != ""])
-
-            if len(process_group) > 20 or queue[0] == '*':
-                # if the queue is the end of a probing group or enough ases in the list
-
-                finished = False
-                for as_type in ['target', 'customer', 'peer', 'provider']:
-                    # process ases in different groups with explicit order above
-                    ases = [int(asn) for (asn, t) in process_group if t == as_type and asn.isdigit()]
-                    if not ases:
-                        continue
-                    # NOTE: below is an older version of getting online probes.
-                    # This query is replaced with newer probe server implementation
-                    # probes_with_asn = self._get_online_probes(ases, threshold - len(probes_selected))
-                    probes_with_asn = self.probe_server.get_online_probes(ases)
-
-                    for _, probes in probes_with_asn:
-                        probes_selected.append(probes[random.randint(0, len(probes) - 1)])
-
-                    if len(probes_selected) >= threshold:
-                        # Stop when we reach the threshold for the number of probes per AS
-                        finished = True
-                        break
-                process_group = []
-
-                if finished:
+        for probe_group in self.index.iter_probe_groups(asn, max_hops):
+            finished = False
+            for _, probes_with_asn in probe_group:
+                for _, probes in probes_with_asn:
+                    probes_selected.append(probes[random.randint(0, len(probes) - 1)])
+
+                if len(probes_selected) >= threshold:
+                    # Stop when we reach the threshold for the number of probes per AS
+                    finished = True
                     break
-
-                if queue[0] == '*':
-                    queue.pop(0)
-                    hops += 1
-                    if queue:
-                        queue.append('*')
+            if finished:
+                break
 
         probes_selected = probes_selected[:threshold]
-        # probe_ids = list(set([x.probe_id for x in probes_selected]))
-        # probes_ripe_format = ','.join(str(x) for x in probe_ids)
 
         # NOTE: consider utilize other information from the probe
         return probes_selected
@@ -35,10 +35,11 @@ import socket
 
 from future.utils import iteritems
 from netaddr import IPAddress, IPNetwork
-from ripe.atlas.cousteau import (Traceroute, AtlasSource, AtlasCreateRequest, AtlasRequest)
+from ripe.atlas.cousteau import (Traceroute, AtlasSource, AtlasRequest)
 
 from grip.redis import Pfx2AsHistorical
 from grip.utils.data.ipmeta import get_ip_geo_location
+from .atlas_dispatcher import AtlasDispatcher
 from .ripe_atlas_msm import *
 
 
@@ -57,55 +58,82 @@ def check_ip_version(ip_addr):
 class RipeAtlasUtils:
     """RIPE Atlas traceroute class"""
 
-    def __init__(self, key, num_probes=10):
+    def __init__(self, key, num_probes=10, dispatcher=None):
         self.key = key
         self.num_probes = num_probes
+        if dispatcher is None:
+            dispatcher = AtlasDispatcher(key=key)
+        self.dispatcher = dispatcher
 
     def create_request(self, target_ip, target_pfx, asn_probes_mapping, event_id):
         """
         Main driver function. Gets RIPE Atlas probes and issues traceroute request
         """
+        return self.create_requests([(target_ip, target_pfx)], asn_probes_mapping, event_id)[0]
 
-        jobs_succeeded = []
-        jobs_failed = []
-
-        logging.info("sending {} traceroute requests to RIPE Atlas...".format(len(asn_probes_mapping)))
-
-        for asn, probes in iteritems(asn_probes_mapping):
-            # Pick the given number of adjacent probes according to the given ASN
-            probe_ids = [probe.probe_id for probe in probes]
-
-            # When no Ripe Atlas probe found
-            if not probe_ids:
-                logging.warning("None of Atlas probes are located in the adjacent networks.")
-                print("None of Atlas probes are located in the adjacent networks.")
-                # MW: continue to allow other probes to get through
-                continue
-
-            description = event_id + ':' + str(asn)
-
-            source = AtlasSource(type="probes",
-                                 value=','.join(str(x) for x in probe_ids),
-                                 requested=len(probe_ids))
-            traceroute = Traceroute(af=check_ip_version(target_ip),
-                                    target=target_ip,
-                                    description=description,
-                                    protocol="TCP", packets=1)
-            atlas_request = AtlasCreateRequest(
-                # NOTE: disable settting start_time, default to right-away
-                #       This is useful during debug where there can be some delay between the measurement's creation and
-                #       the actual request reaching Atlas. Error for requests with start_time in the past will be
-                #       triggered otherwise
-                # start_time=datetime.datetime.utcnow(),
-                key=self.key,
-                measurements=[traceroute],
-                sources=[source],
-                is_oneoff=True
-            )
-
-            # Making traceroute request to RIPE Atlas
-            (is_success, response) = atlas_request.create()
+    def create_requests(self, targets, asn_probes_mapping, event_id):
+        """
+        Issue traceroute requests towards multiple targets from the probes of each ASN in asn_probes_mapping.
+        All the requests are sent concurrently by the dispatcher.
+
+        :param targets: list of (target_ip, target_pfx) tuples
+        :param asn_probes_mapping: dict of ASN to list of probes
+        :param event_id: ID of the event the traceroutes are requested for
+        :return: list of (jobs_succeeded, jobs_failed) tuples, one per target in the same order as targets
+        """
+        return self.create_event_requests([(event_id, targets, asn_probes_mapping)])[0]
+
+    def create_event_requests(self, event_targets):
+        """
+        Same as `create_requests` for the targets of several events, all the requests of all the events are sent
+        concurrently by the dispatcher.
 
+        :param event_targets: list of (event_id, targets, asn_probes_mapping) tuples
+        :return: list of the `create_requests` results, one per event in the same order as event_targets
+        """
+
+        jobs = []  # (event index, target index, asn, probe_ids) for each request
+        msm_requests = []
+
+        for event_idx, (event_id, targets, asn_probes_mapping) in enumerate(event_targets):
+            for idx, (target_ip, target_pfx) in enumerate(targets):
+                for asn, probes in iteritems(asn_probes_mapping):
+                    # Pick the given number of adjacent probes according to the given ASN
+                    probe_ids = [probe.probe_id for probe in probes]
+
+                    # When no Ripe Atlas probe found
+                    if not probe_ids:
+                        logging.warning("None of Atlas probes are located in the adjacent networks.")
+                        print("None of Atlas probes are located in the adjacent networks.")
+                        # MW: continue to allow other probes to get through
+                        continue
+
+                    description = event_id + ':' + str(asn)
+
+                    source = AtlasSource(type="probes",
+                                         value=','.join(str(x) for x in probe_ids),
+                                         requested=len(probe_ids))
+                    traceroute = Traceroute(af=check_ip_version(target_ip),
+                                            target=target_ip,
+                                            description=description,
+                                            protocol="TCP", packets=1)
+                    # NOTE: start_time is not set, default to right-away
+                    #       This is useful during debug where there can be some delay between the measurement's
+                    #       creation and the actual request reaching Atlas. Error for requests with start_time in the
+                    #       past will be triggered otherwise
+                    jobs.append((event_idx, idx, asn, probe_ids))
+                    msm_requests.append(([traceroute], [source]))
+
+        logging.info("sending {} traceroute requests to RIPE Atlas...".format(len(msm_requests)))
+
+        # Making traceroute requests to RIPE Atlas
+        responses = self.dispatcher.dispatch(msm_requests)
+
+        results = [[([], []) for _ in targets] for _, targets, _ in event_targets]
+        for (event_idx, idx, asn, probe_ids), (is_success, response) in zip(jobs, responses):
+            event_id, targets, _ = event_targets[event_idx]
+            target_ip, target_pfx = targets[idx]
+            jobs_succeeded, jobs_failed = results[event_idx][idx]
             if is_success:
                 jobs_succeeded.append(AtlasMeasurement(msm_id=response["measurements"][0],
                                                        probe_ids=probe_ids,
@@ -116,33 +144,35 @@ class RipeAtlasUtils:
                                                        event_id=event_id
                                                        ))
             else:
-                try:
-                    logging.error("Can't create measurement: %s", response)
-                    error = []
-                    if 'errors' in response['error']:
-                        error = [e['detail'] for e in response['error']['errors'] if 'detail' in e]
-                    # When the RIPE request was failed, we would try again later.
-                    # Let's keep the information for requesting
-                    jobs_failed.append(AtlasMeasurement(msm_id=-1,
-                                                        probe_ids=probe_ids,
-                                                        target_ip=target_ip,
-                                                        target_asn=asn,
-                                                        target_pfx=target_pfx,
-                                                        request_error=error,
-                                                        event_id=event_id
-                                                        ))
-                except TypeError as e:
-                    # capture "TypeError: string indices must be integers" error for `if 'errors' in response['error']:`
-                    # print out the response message
-                    logging.error("TypeError, response = {}".format(response))
-                    raise e
-            
-
-        logging.info("\t{} requests succeeded, {} requests failed".format(len(jobs_succeeded), len(jobs_failed)))
-        return jobs_succeeded, jobs_failed
-
-
-def get_traceroute_status_map(msm_ids):
+                logging.error("Can't create measurement: %s", response)
+                # When the RIPE request was failed, we would try again later.
+                # Let's keep the information for requesting
+                jobs_failed.append(AtlasMeasurement(msm_id=-1,
+                                                    probe_ids=probe_ids,
+                                                    target_ip=target_ip,
+                                                    target_asn=asn,
+                                                    target_pfx=target_pfx,
+                                                    request_error=extract_request_errors(response),
+                                                    event_id=event_id
+                                                    ))
+
+        logging.info("\t{} requests succeeded, {} requests failed".format(
+            sum(len(succeeded) for event_results in results for succeeded, _ in event_results),
+            sum(len(failed) for event_results in results for _, failed in event_results)))
+        return results
+
+
+def extract_request_errors(response):
+    """
+    Extract the error details from a failed measurement creation response.
+    Responses of requests that did not reach Atlas (e.g. connection errors) carry no details.
+    """
+    if not isinstance(response, dict) or not isinstance(response.get("error"), dict):
+        return []
+    return [e['detail'] for e in response['error'].get('errors', []) if 'detail' in e]
+
+
+def get_traceroute_status_map(msm_ids, executor=None):
     """
     return traceroute status:
         id (integer): measurement ID
@@ -150,18 +180,24 @@ def get_traceroute_status_map(msm_ids):
             4: Stopped, 5: Forced to stop, 6: No suitable probes, 7: Failed, 8: Archived),
         name (string): Human-readable description of this status,
         when (string): When the measurement entered this status (not available for all statuses)
+
+    If an executor is given, the requests for the chunks of measurements are sent concurrently.
     """
 
     def divide_chunks(l, n):
         for idx in range(0, len(l), n):
             yield l[idx:idx + n]
 
-    msm_map = {}
-    for msm_lst in divide_chunks(msm_ids, 10):
-        # 10 measurement per request
+    def request_status(msm_lst):
         request = AtlasRequest()
         request.url_path = "/api/v2/measurements/?id__in={0}".format(','.join([str(i) for i in msm_lst]))
-        response = request.get()
+        return request.get()
+
+    msm_map = {}
+    # 10 measurement per request
+    chunks = list(divide_chunks(msm_ids, 10))
+    responses = executor.map(request_status, chunks) if executor is not None else map(request_status, chunks)
+    for response in responses:
         if response[0]:
             for result in response[1]["results"]:
                 msm_map[result["id"]] = result["status"]
@@ -169,6 +205,20 @@ def get_traceroute_status_map(msm_ids):
     return msm_map
 
 
+def get_hop_ips(responses):
+    """return the set of IP addresses that replied in the given traceroute responses"""
+    hop_ips = set()
+    for response in responses:
+        try:
+            for hop in response["result"]:
+                if "from" in hop["result"][0]:
+                    hop_ips.add(hop["result"][0]["from"])
+        except (KeyError, IndexError, TypeError):
+            # malformed responses are reported by extract_atlas_response
+            continue
+    return hop_ips
+
+
 def extract_atlas_response(responses, pfx_origin_db=None, target_pfx=None):
     """get response json for each job"""
 
@@ -31,9 +31,123 @@
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
 import logging
+import socket
 
 import radix
-from netaddr import IPNetwork, IPAddress
+from netaddr import IPAddress
+
+
+def pfx_to_interval(pfx):
+    """
+    Convert a prefix string to an integer interval.
+
+    :param pfx: prefix string, e.g. "10.0.0.0/8"
+    :return: (IP version, first address, last address) tuple
+    """
+    version, _, first, last, _ = _parse_pfx(pfx)
+    return version, first, last
+
+
+def _parse_pfx(pfx):
+    """parse a prefix string into (IP version, address, first address, last address, mask length)"""
+    address, mask = pfx.split("/")
+    if ":" in address:
+        version, num_bits, packed = 6, 128, socket.inet_pton(socket.AF_INET6, address)
+    else:
+        version, num_bits, packed = 4, 32, socket.inet_aton(address)
+    mask = int(mask)
+    size = 1 << (num_bits - mask)
+    address = int.from_bytes(packed, "big")
+    first = address & ~(size - 1)
+    return version, address, first, first + size - 1, mask
+
+
+def int_to_ip(value, version):
+    """format an integer address as string"""
+    if version == 4:
+        return socket.inet_ntoa(value.to_bytes(4, "big"))
+    return str(IPAddress(value, version))
+
+
+def pfx_sort_key(pfx):
+    """
+    Sort key of the prefix streams processed by `sweep_probe_ips`: prefixes are sorted by IP version, first address
+    and decreasing size, so that every prefix comes right after its super-prefixes. Host bits are ignored, so a
+    non-canonical prefix such as "1.2.3.4/16" has the key of "1.2.0.0/16".
+    """
+    version, first, last = pfx_to_interval(pfx)
+    return version, first, -last
+
+
+class UnsortedPrefixesError(ValueError):
+    """raised when a prefix stream is not sorted by `pfx_sort_key`"""
+
+
+def sweep_probe_ips(pfxs):
+    """
+    Find the probe IP of each prefix of a sorted prefix stream, see `TargetIpGenerator.get_probe_pfx_ip_map`.
+
+    A single sweep keeps the chain of enclosing prefixes on a stack and finds, for each prefix, the first address not
+    covered by its direct sub-prefixes. A prefix is yielded as soon as the stream has moved past it, after its
+    sub-prefixes, so memory is bounded by the nesting depth of the prefixes.
+
+    Prefixes are normalised as done by the radix tree: host bits are cleared, so "1.2.3.4/16" is yielded as
+    "1.2.0.0/16", and prefixes that only differ in host bits are duplicates.
+
+    :param pfxs: iterable of prefix strings sorted by `pfx_sort_key`, duplicates are skipped
+    :return: generator of (canonical prefix, IP) tuples, prefixes fully covered by their sub-prefixes are omitted
+    :raises UnsortedPrefixesError: if a prefix comes before the previous one in `pfx_sort_key` order
+    """
+    return _sweep_intervals(_keyed_pfx(pfx) for pfx in pfxs)
+
+
+def _keyed_pfx(pfx):
+    """(`pfx_sort_key` key, canonical prefix string) tuple of a prefix"""
+    version, address, first, last, mask = _parse_pfx(pfx)
+    if address != first:
+        pfx = "%s/%d" % (int_to_ip(first, version), mask)
+    return (version, first, -last), pfx
+
+
+def _sweep_intervals(keyed_pfxs):
+    """sweep over (`pfx_sort_key` key, prefix) tuples, see `sweep_probe_ips`"""
+
+    def assign(entry):
+        version, _, last, pfx, cursor, found = entry
+        if found is None and cursor <= last:
+            found = cursor
+        if found is not None:
+            return pfx, int_to_ip(found + 1, version)
+        return None
+
+    # enclosing prefixes: [version, first, last, prefix, first candidate address, first uncovered address]
+    stack = []
+    prev_key, prev_pfx = None, None
+    for key, pfx in keyed_pfxs:
+        if prev_key is not None and key <= prev_key:
+            if key == prev_key:
+                continue
+            raise UnsortedPrefixesError("prefixes are not sorted: {} comes after {}".format(pfx, prev_pfx))
+        prev_key, prev_pfx = key, pfx
+        version, first, neg_last = key
+        last = -neg_last
+        while stack and (stack[-1][0] != version or stack[-1][2] < first):
+            result = assign(stack.pop())
+            if result is not None:
+                yield result
+        if stack:
+            parent = stack[-1]
+            if parent[5] is None:
+                if first > parent[4]:
+                    # there is a gap before this sub-prefix
+                    parent[5] = parent[4]
+                else:
+                    parent[4] = last + 1
+        stack.append([version, first, last, pfx, first, None])
+    while stack:
+        result = assign(stack.pop())
+        if result is not None:
+            yield result
 
 
 class TargetIpGenerator:
@@ -72,28 +186,49 @@ class TargetIpGenerator:
         for pfx in self.NO_PROBE_PFXS:
             self.special_rtree.add(pfx)
 
-    def add_pfx(self, pfx):
+    def is_probe_pfx(self, pfx):
         """
-        add prefix to the prefix tree, ignoring very long or short prefixes, also ignore special prefixes
+        check whether a probe IP should be generated for the prefix, ignoring very long or short prefixes, and special
+        prefixes
 
-        :param pfx: the prefix to be added to the tree
-        :return: nothing
+        :param pfx: the prefix to check
+        :return: True if the prefix should be probed
         """
         if pfx == "":
             logging.warning("empty string for prefix")
-            return
+            return False
 
         if self.special_rtree.search_best(pfx) is not None:
             # if the prefix is in the special prefix range
-            # return without adding the prefix into tree
-            return
+            return False
 
         # ignore prefixes with short or long mask
         mask = int(pfx.split("/")[1])
         if mask < 7 or mask > 24:
-            return
+            return False
+
+        return True
 
-        self.pfxs_rtree.add(pfx)
+    def add_pfx(self, pfx):
+        """
+        add prefix to the prefix tree, ignoring very long or short prefixes, also ignore special prefixes
+
+        :param pfx: the prefix to be added to the tree
+        :return: nothing
+        """
+        if self.is_probe_pfx(pfx):
+            self.pfxs_rtree.add(pfx)
+
+    def iter_probe_pfx_ips(self, pfxs):
+        """
+        Streaming version of `get_probe_pfx_ip_map` for prefixes sorted by `pfx_sort_key`, without adding them to the
+        prefix tree. The prefixes to ignore are filtered as done by `add_pfx`.
+
+        :param pfxs: iterable of prefix strings sorted by `pfx_sort_key`
+        :return: generator of (prefix, IP) tuples
+        :raises UnsortedPrefixesError: if the prefixes are not sorted
+        """
+        return sweep_probe_ips(pfx for pfx in pfxs if self.is_probe_pfx(pfx))
 
     def get_probe_pfx_ip_map(self):
         """
@@ -105,50 +240,11 @@ class TargetIpGenerator:
         NOTE: if multiple-sub prefixes that fully cover a super-prefix, then the super-prefix will not be in the
         return dictionary
 
+        The IP of a prefix is the first host IP of the first address block not covered by any of its sub-prefixes.
+        Prefixes are sorted by (first address, decreasing size) as integer intervals, so that every prefix comes right
+        after its super-prefixes and its direct sub-prefixes come in address order, and then swept once (see
+        `sweep_probe_ips`).
+
         :return: a prefix-to-ip map
         """
-        pfx_ip_map = {}
-
-        for node in self.pfxs_rtree:
-            # loop through all the prefixes in the tree
-            pfx = node.prefix
-
-            # if an entry exists already, then
-            # an IP has been already assigned
-            if pfx in pfx_ip_map:
-                continue
-
-            # get the first and last ip of the network
-            network = IPNetwork(pfx)
-            ip_first = int(network.first)
-            ip_last = int(network.last)
-            assigned_ip = ip_first
-            while assigned_ip <= ip_last:
-                assigned_ip_str = str(IPAddress(assigned_ip+1))
-                # Best-match search will return the longest matching prefix
-                # for the current assigned_ip  (routing-style lookup)
-                best_match_pfx = self.pfxs_rtree.search_best(assigned_ip_str).prefix
-
-                # If the best match for the first IP is the same prefix, then
-                # we have found an IP
-                if best_match_pfx == pfx:
-                    pfx_ip_map[pfx] = assigned_ip_str
-                    break
-
-                # if the best_match_pfx has not been assigned
-                # an ip yet, then do it
-                if best_match_pfx not in pfx_ip_map:
-                    pfx_ip_map[best_match_pfx] = assigned_ip_str
-
-                # in any case move the assigned_ip further:
-                # move to the next prefix (having the same length as the
-                # more specific found): the next network begins with
-                # broadcast_long()) + 1 and has the same netmask
-                # (note that the first host ip may not be broadcast + 1)
-                matching_network = IPNetwork(best_match_pfx)
-                mask = best_match_pfx.split("/")[1]
-                next_network = IPNetwork(str(IPAddress(int(matching_network.broadcast) + 1)) + "/" + mask)
-                assigned_ip = int(next_network.first)
-
-        return pfx_ip_map
-
+        return dict(_sweep_intervals(sorted((pfx_sort_key(node.prefix), node.prefix) for node in self.pfxs_rtree)))
@@ -0,0 +1,287 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import itertools
+import json
+import socket
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+from ripe.atlas.cousteau import AtlasSource, Traceroute
+
+from grip.active.ripe_atlas.atlas_dispatcher import AtlasDispatcher, MeasurementCreateRequest, RateLimiter
+from grip.active.ripe_atlas.ripe_atlas_utils import RipeAtlasUtils
+
+FakeProbe = namedtuple("FakeProbe", ["probe_id"])
+
+
+class AtlasStubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the RIPE Atlas measurement creation API.
+
+    Measurements whose description ends with one of the server's bad ASNs are refused with a 400 error, the first
+    `throttled` requests are rejected with a 429 error, and the next `server_errors` requests fail with a 500 error.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.path != "/api/v2/measurements/":
+            self._reply(404, {"error": {"status": 404, "errors": [{"detail": "Not found."}]}})
+            return
+        self._reply(*self.server.create(body, self.headers.get("Authorization")))
+
+
+class AtlasStub(ThreadingHTTPServer):
+    """stand-in RIPE Atlas server answering measurement creation requests after a fixed latency"""
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", 0), AtlasStubHandler)
+        self.latency = latency
+        self.throttled = 0
+        self.server_errors = 0
+        self.bad_asns = set()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.measurements = {}  # msm_id -> request body
+        self.authorizations = set()
+        self.msm_ids = itertools.count(1000)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def server(self):
+        return "127.0.0.1:{}".format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def create(self, body, authorization):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.authorizations.add(authorization)
+            throttled = self.throttled > 0
+            if throttled:
+                self.throttled -= 1
+            server_error = not throttled and self.server_errors > 0
+            if server_error:
+                self.server_errors -= 1
+        time.sleep(self.latency)
+        with self.lock:
+            self.in_flight -= 1
+            if throttled:
+                return 429, {"error": {"status": 429, "errors": [{"detail": "Too many requests"}]}}
+            if server_error:
+                return 500, {"error": {"status": 500, "errors": [{"detail": "Internal server error"}]}}
+            if body["definitions"][0]["description"].split(":")[-1] in self.bad_asns:
+                return 400, {"error": {"status": 400, "errors": [{"detail": "Your selected probes are not usable"}]}}
+            msm_id = next(self.msm_ids)
+            self.measurements[msm_id] = body
+            return 201, {"measurements": [msm_id]}
+
+
+def msm_request(target, description):
+    return (
+        [Traceroute(af=4, target=target, description=description, protocol="TCP", packets=1)],
+        [AtlasSource(type="probes", value="1,2", requested=2)],
+    )
+
+
+class TestRateLimiter(TestCase):
+
+    def test_token_bucket(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        limiter = RateLimiter(rate=2, burst=3, clock=lambda: now[0], sleep=sleep)
+        # the burst goes through without waiting, then one request every 1/rate seconds
+        self.assertEqual([0, 0, 0, 0.5, 0.5], [limiter.acquire() for _ in range(5)])
+        # idle time refills the bucket up to the burst size only
+        now[0] += 10
+        self.assertEqual([0, 0, 0, 0.5], [limiter.acquire() for _ in range(4)])
+
+    def test_concurrent_reservations(self):
+        # waiters that do not wake up in time must not get the same token
+        limiter = RateLimiter(rate=1, burst=1, clock=lambda: 0.0, sleep=lambda seconds: None)
+        self.assertEqual([0, 1, 2, 3], [limiter.acquire() for _ in range(4)])
+
+
+class TestAtlasDispatcher(TestCase):
+
+    def test_dispatch_concurrently_in_order(self):
+        with AtlasStub(latency=0.05) as stub:
+            dispatcher = AtlasDispatcher(key="secret", max_workers=8, rate=1000, burst=100,
+                                         server=stub.server, scheme="http")
+            requests = [msm_request("10.0.{}.1".format(i), "event:{}".format(i)) for i in range(32)]
+            results = dispatcher.dispatch(requests)
+            dispatcher.close()
+
+            self.assertEqual(32, stub.requests)
+            self.assertGreater(stub.max_in_flight, 1)
+            self.assertLessEqual(stub.max_in_flight, 8)
+            self.assertEqual({"Key secret"}, stub.authorizations)
+            for i, (is_success, response) in enumerate(results):
+                self.assertTrue(is_success)
+                body = stub.measurements[response["measurements"][0]]
+                self.assertEqual("event:{}".format(i), body["definitions"][0]["description"])
+                self.assertTrue(body["is_oneoff"])
+
+    def test_rate_limit(self):
+        with AtlasStub() as stub:
+            dispatcher = AtlasDispatcher(key="secret", max_workers=4, rate=20, burst=1,
+                                         server=stub.server, scheme="http")
+            start = time.time()
+            dispatcher.dispatch([msm_request("10.0.0.1", "event:{}".format(i)) for i in range(6)])
+            dispatcher.close()
+            self.assertGreaterEqual(time.time() - start, 5 / 20.0)
+
+    def test_retry_transient_failures(self):
+        with AtlasStub() as stub:
+            stub.throttled = 2
+            dispatcher = AtlasDispatcher(key="secret", max_workers=1, rate=1000, burst=100, max_retries=3,
+                                         retry_backoff=0.01, server=stub.server, scheme="http")
+            is_success, response = dispatcher.create(*msm_request("10.0.0.1", "event:1"))
+            self.assertTrue(is_success)
+            self.assertEqual(3, stub.requests)
+
+            # give up once the retries are exhausted
+            stub.throttled = 5
+            is_success, response = dispatcher.create(*msm_request("10.0.0.1", "event:1"))
+            self.assertFalse(is_success)
+            self.assertEqual(429, response["error"]["status"])
+            self.assertEqual(7, stub.requests)
+
+    def test_no_retry_on_refused_requests(self):
+        with AtlasStub() as stub:
+            stub.bad_asns = {"1"}
+            dispatcher = AtlasDispatcher(key="secret", max_workers=1, rate=1000, burst=100, max_retries=3,
+                                         retry_backoff=0.01, server=stub.server, scheme="http")
+            is_success, response = dispatcher.create(*msm_request("10.0.0.1", "event:1"))
+            self.assertFalse(is_success)
+            self.assertEqual(1, stub.requests)
+
+    def test_no_retry_after_server_received_request(self):
+        # the measurement may have been created, retrying could create a duplicate
+        with AtlasStub(latency=0.3) as stub:
+            stub.server_errors = 1
+            dispatcher = AtlasDispatcher(key="secret", max_workers=1, rate=1000, burst=100, max_retries=3,
+                                         retry_backoff=0.01, server=stub.server, scheme="http")
+            is_success, response = dispatcher.create(*msm_request("10.0.0.1", "event:1"))
+            self.assertFalse(is_success)
+            self.assertEqual(1, stub.requests)
+
+            # read timeout
+            dispatcher.timeout = (1, 0.05)
+            is_success, response = dispatcher.create(*msm_request("10.0.0.1", "event:1"))
+            self.assertFalse(is_success)
+            self.assertEqual(2, stub.requests)
+
+    def test_connection_error(self):
+        # find a port nobody is listening on
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        server = "127.0.0.1:{}".format(sock.getsockname()[1])
+        sock.close()
+        dispatcher = AtlasDispatcher(key="secret", max_workers=1, max_retries=1, retry_backoff=0.01,
+                                     server=server, scheme="http")
+        with mock.patch.object(MeasurementCreateRequest, "get_http_method",
+                               autospec=True, side_effect=MeasurementCreateRequest.get_http_method) as get_http_method:
+            is_success, response = dispatcher.create(*msm_request("10.0.0.1", "event:1"))
+        self.assertFalse(is_success)
+        # the request did not reach the server, it is retried
+        self.assertEqual(2, get_http_method.call_count)
+
+
+class TestRipeAtlasUtils(TestCase):
+
+    def test_create_requests(self):
+        with AtlasStub(latency=0.01) as stub:
+            stub.bad_asns = {"200"}
+            dispatcher = AtlasDispatcher(key="secret", max_workers=4, rate=1000, burst=100,
+                                         server=stub.server, scheme="http")
+            atlas = RipeAtlasUtils(key="secret", dispatcher=dispatcher)
+            asn_probes_mapping = {
+                "100": [FakeProbe(1), FakeProbe(2)],
+                "200": [FakeProbe(3)],
+                "300": [],
+                "400": [FakeProbe(4), FakeProbe(5), FakeProbe(6)],
+            }
+            targets = [("10.0.0.1", "10.0.0.0/24"), ("10.0.1.1", "10.0.1.0/24"), ("10.0.2.1", "10.0.2.0/24")]
+            results = atlas.create_requests(targets, asn_probes_mapping, "moas-1-2")
+            dispatcher.close()
+
+            # ASes without probes are skipped
+            self.assertEqual(9, stub.requests)
+            self.assertEqual(3, len(results))
+            for (target_ip, target_pfx), (jobs_succeeded, jobs_failed) in zip(targets, results):
+                self.assertEqual(["100", "400"], [job.target_asn for job in jobs_succeeded])
+                self.assertEqual([[1, 2], [4, 5, 6]], [job.probe_ids for job in jobs_succeeded])
+                self.assertEqual(["200"], [job.target_asn for job in jobs_failed])
+                self.assertEqual(-1, jobs_failed[0].msm_id)
+                self.assertEqual(["Your selected probes are not usable"], jobs_failed[0].request_error)
+                for job in jobs_succeeded + jobs_failed:
+                    self.assertEqual((target_ip, target_pfx, "moas-1-2"), (job.target_ip, job.target_pfx, job.event_id))
+                for job in jobs_succeeded:
+                    definition = stub.measurements[job.msm_id]["definitions"][0]
+                    self.assertEqual((target_ip, "moas-1-2:" + job.target_asn),
+                                     (definition["target"], definition["description"]))
+
+            # single-target interface
+            jobs_succeeded, jobs_failed = atlas.create_request("10.0.0.1", "10.0.0.0/24", asn_probes_mapping, "moas-1-2")
+            self.assertEqual((2, 1), (len(jobs_succeeded), len(jobs_failed)))
@@ -0,0 +1,258 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+from unittest import TestCase, mock
+
+from elasticsearch import Elasticsearch
+
+from grip.active.as_traceroute import AsTracerouteDriver
+from grip.active.collector import ActiveProbingCollector
+from grip.active.ip_to_as import IpToAsResolver
+from grip.active.ripe_atlas.ripe_atlas_msm import AtlasMeasurement
+from grip.active.ripe_atlas.ripe_atlas_utils import get_hop_ips
+from grip.redis import Pfx2AsHistorical, RedisHelper
+from grip.redis.pfx2as_historical import DAYS_KEY, PFX_KEY_TMPL
+from grip.utils.data.elastic import ElasticConn
+from grip.utils.data import ipmeta
+from grip.utils.data.elastic_bulk import ElasticBulkWriter
+from grip.utils.event_utils import create_dummy_event
+from grip.utils.messages import EventOnElasticMsg
+from grip.utils.tests.test_elastic_bulk import ElasticStub
+
+
+class FakePipeline:
+    def __init__(self, rh):
+        self.rh = rh
+        self.queued = []
+
+    def zrangebyscore(self, *args, **kwargs):
+        self.queued.append((args, kwargs))
+
+    def execute(self):
+        self.rh.round_trips += 1
+        results = [self.rh.query(*args, **kwargs) for args, kwargs in self.queued]
+        self.queued = []
+        return results
+
+
+class FakeRedisHelper:
+    """in-memory stand-in for the sorted sets of the historical prefix-to-AS database"""
+
+    get_bin_pfx = staticmethod(RedisHelper.get_bin_pfx)
+    get_str_pfx = staticmethod(RedisHelper.get_str_pfx)
+
+    def __init__(self, records):
+        self.round_trips = 0
+        self.sets = {}
+        self.days = []  # days promoted into the database
+        for record in records:
+            self.add_record(*record)
+        self.pipe = FakePipeline(self)
+
+    def add_record(self, prefix, start_ts, end_ts, asns):
+        key = PFX_KEY_TMPL % RedisHelper.get_bin_pfx(prefix)
+        self.sets.setdefault(key, []).append(("{}:{}".format(start_ts, asns), float(end_ts)))
+
+    def zrange(self, key, start, end, withscores=False):
+        assert key == DAYS_KEY
+        days = [(str(day), float(day)) for day in sorted(self.days)]
+        return days[start:end + 1 if end != -1 else None]
+
+    def query(self, key, min_score, max_score, withscores=False):
+        min_score = float(min_score)
+        return [(member, score) for member, score in sorted(self.sets.get(key, []), key=lambda r: r[1])
+                if score >= min_score]
+
+    def zrangebyscore(self, *args, **kwargs):
+        self.round_trips += 1
+        return self.query(*args, **kwargs)
+
+    def get_pipeline(self):
+        return self.pipe
+
+
+def build_msm(msm_id, event_id, results=None):
+    return AtlasMeasurement(msm_id=msm_id, probe_ids=[1, 2], target_ip="8.8.8.1", target_pfx="8.8.8.0/24",
+                            target_asn="100", request_error=[], event_id=event_id, results=results)
+
+
+class FakeKafkaHelper:
+    def __init__(self):
+        self.produced = []
+        self.flushed = 0
+
+    def produce(self, value_str):
+        self.produced.append(value_str)
+
+    def flush(self):
+        self.flushed += 1
+        return []
+
+    def deliver(self):
+        self.flush()
+
+
+class TestProcessFinishedMeasurements(TestCase):
+
+    index = "observatory-v3-events-moas-2020-01"
+
+    def setUp(self):
+        self.stub = ElasticStub().__enter__()
+        self.es = Elasticsearch(self.stub.url)
+        with mock.patch("grip.utils.data.elastic.Elasticsearch", return_value=self.es):
+            es_conn = ElasticConn()
+        self.collector = ActiveProbingCollector.__new__(ActiveProbingCollector)
+        self.collector.es_conn = es_conn
+        self.collector.es_bulk = es_conn.bulk_writer()
+        self.collector.kafka_helper = FakeKafkaHelper()
+
+        writer = ElasticBulkWriter(self.es)
+        for i in range(5):
+            event = create_dummy_event("moas", ts=1577836800, tr_worthy=True)
+            event.event_id = "moas-1577836800-{}".format(i)
+            event.pfx_events[0].traceroutes["msms"] = [build_msm(i * 10 + j, event.event_id) for j in range(3)]
+            writer.add_event(event, self.index)
+        writer.flush()
+        self.stub.requests.clear()
+
+    def tearDown(self):
+        self.es.close()
+        self.stub.__exit__(None, None, None)
+
+    def test_batch_update(self):
+        finished = [build_msm(msm_id, "moas-1577836800-{}".format(msm_id // 10), results=[{"msm_id": msm_id}])
+                    for msm_id in [1, 2, 21, 42]]
+        finished.append(build_msm(51, "moas-1577836800-5"))  # event not on ElasticSearch
+        self.collector._process_finished_measurements(finished)
+
+        # one multi-get and one bulk request for all the events
+        self.assertEqual(1, self.stub.requests["_mget"])
+        self.assertEqual(1, self.stub.requests["_bulk"])
+        self.assertEqual(0, self.collector.kafka_helper.flushed)
+
+        notified = [EventOnElasticMsg.from_str(msg) for msg in self.collector.kafka_helper.produced]
+        self.assertEqual(["moas-1577836800-0", "moas-1577836800-2", "moas-1577836800-4"],
+                         [msg.es_id for msg in notified])
+        self.assertEqual({self.index}, {msg.es_index for msg in notified})
+
+        events = self.collector.es_conn.get_events_by_ids(["moas-1577836800-{}".format(i) for i in range(5)])
+        results = {msm.msm_id: msm.results
+                   for event in events.values() for msm in event.pfx_events[0].traceroutes["msms"]}
+        self.assertEqual(15, len(results))
+        for msm_id, msm_results in results.items():
+            self.assertEqual([{"msm_id": msm_id}] if msm_id in {1, 2, 21, 42} else {}, msm_results)
+
+    def test_uncommitted_events(self):
+        writer = ElasticBulkWriter(self.es, initial_backoff=0)
+        event = create_dummy_event("moas", ts=1577836800, tr_worthy=True)
+        event.event_id = "moas-1577836800-reject"
+        event.pfx_events[0].traceroutes["msms"] = [build_msm(100, event.event_id)]
+        writer.add_event(event, self.index)
+        writer.flush()
+        self.stub.rejected.clear()
+
+        # events rejected with a transient error are reported, and downstream is not notified of them
+        self.collector.es_bulk = self.collector.es_conn.bulk_writer(max_retries=0)
+        finished = [build_msm(1, "moas-1577836800-0", results=[]), build_msm(100, event.event_id, results=[])]
+        self.assertEqual({event.event_id}, self.collector._process_finished_measurements(finished))
+        self.assertEqual(["moas-1577836800-0"],
+                         [EventOnElasticMsg.from_str(msg).es_id for msg in self.collector.kafka_helper.produced])
+        self.assertEqual(set(), self.collector._process_finished_measurements(finished[:1]))
+
+    def test_ip_to_as_metrics(self):
+        finished = [build_msm(msm_id, "moas-1577836800-{}".format(msm_id // 10), results=[])
+                    for msm_id in [1, 2, 21]]
+        stats = {"moas-1577836800-0": (10, 4), "moas-1577836800-2": (3, 3)}
+        self.collector._process_finished_measurements(finished, stats)
+        self.collector._process_finished_measurements(finished[:1], {"moas-1577836800-0": (2, 2)})
+
+        events = self.collector.es_conn.get_events_by_ids(["moas-1577836800-{}".format(i) for i in range(3)])
+        self.assertEqual({"moas-1577836800-0": (12, 6), "moas-1577836800-1": (0, 0), "moas-1577836800-2": (3, 3)},
+                         {event_id: (event.tr_metrics.ip_to_as_lookup_cnt, event.tr_metrics.ip_to_as_cache_hit_cnt)
+                          for event_id, event in events.items()})
+
+
+def build_response(msm_id, prb_id, hop_ips, timestamp=1577836800):
+    return {"msm_id": msm_id, "prb_id": prb_id, "timestamp": timestamp, "endtime": timestamp + 10, "from": "1.2.3.4",
+            "dst_addr": "8.8.8.1", "result": [{"hop": i + 1, "result": [{"from": ip, "rtt": 1.0, "ttl": 250}]}
+                                              for i, ip in enumerate(hop_ips)]}
+
+
+class TestExtractResults(TestCase):
+
+    def setUp(self):
+        pfx2as = Pfx2AsHistorical.__new__(Pfx2AsHistorical)
+        pfx2as.rh = FakeRedisHelper([
+            ("8.8.8.0/24", 1500000000, 1577836800, "15169"),
+            ("4.0.0.0/9", 1400000000, 1577836800, "3356"),
+        ])
+        self.collector = ActiveProbingCollector.__new__(ActiveProbingCollector)
+        self.collector._pfx_origin_db = IpToAsResolver(pfx2as)
+        ipmeta.set_default_db(ipmeta.IpMetaDb(fallback=None))
+
+    def tearDown(self):
+        ipmeta.set_default_db(None)
+
+    def test_shared_resolver(self):
+        resolver = self.collector._pfx_origin_db
+        driver = AsTracerouteDriver(resolver)
+        stopped = [
+            (build_msm(1, "moas-1577836800-a"),
+             [build_response(1, prb_id, ["4.0.0.1", "8.8.8.1"]) for prb_id in [1, 2]]),
+            (build_msm(2, "moas-1577836800-b"), [build_response(2, 3, ["4.0.0.1", "4.0.0.2", "8.8.8.1"])]),
+        ]
+        stats = self.collector._extract_results(stopped, driver)
+
+        # origins of all the hops are fetched in one request, and then answered from the cache
+        self.assertEqual(1, resolver.rh.round_trips)
+        msm, _ = stopped[0]
+        self.assertEqual(["3356", "15169"], msm.results[0]["as_traceroute"])
+        self.assertEqual("3356", msm.results[0]["hops"][1]["asn"])
+        # the three prefetched IPs are the only misses
+        self.assertEqual({"moas-1577836800-a": (8, 6), "moas-1577836800-b": (6, 5)}, stats)
+        self.assertEqual((14, 11), (resolver.lookup_cnt, resolver.hit_cnt))
+
+        # measurements of a later loop find the hops in the cache
+        stopped = [(build_msm(3, "moas-1577836800-a"), [build_response(3, 4, ["4.0.0.2", "8.8.8.1"])])]
+        self.assertEqual({"moas-1577836800-a": (4, 4)}, self.collector._extract_results(stopped, driver))
+        self.assertEqual(1, resolver.rh.round_trips)
+
+
+class TestHopIps(TestCase):
+
+    def test_get_hop_ips(self):
+        responses = [
+            {"result": [{"hop": 1, "result": [{"from": "10.0.0.1"}]}, {"hop": 2, "result": [{"x": "*"}]},
+                        {"hop": 3, "result": [{"from": "8.8.8.8"}]}]},
+            {"result": [{"hop": 1, "result": [{"from": "10.0.0.1"}]}]},
+            {"error": "malformed"},
+        ]
+        self.assertEqual({"10.0.0.1", "8.8.8.8"}, get_hop_ips(responses))
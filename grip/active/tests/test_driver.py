@@ -30,12 +30,26 @@
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 import time
-from unittest import TestCase
+from collections import Counter, namedtuple
+from unittest import TestCase, mock
 
-from grip.active.driver import ActiveProbingDriver
+from elasticsearch import Elasticsearch
 
+from grip.active.driver import ActiveProbingDriver
+from grip.active.ripe_atlas.atlas_dispatcher import AtlasDispatcher
+from grip.active.ripe_atlas.ripe_atlas_utils import RipeAtlasUtils
 from grip.active.ripe_atlas.target_ip_generator import TargetIpGenerator
+from grip.active.tests.test_atlas_dispatcher import AtlasStub
+from grip.active.tests.test_collector import FakeKafkaHelper
+from grip.common import ACTIVE_COMMIT_RETRY_BACKOFF, ACTIVE_MAX_EVENTS_PER_BIN
+from grip.inference.test_inference import KafkaMessage
+from grip.utils.data.elastic import ElasticConn
+from grip.utils.data.elastic_bulk import BulkWriteError, ElasticBulkWriter
 from grip.utils.event_utils import create_dummy_event
+from grip.utils.messages import EventOnElasticMsg, MeasurementsRequestedMsg
+from grip.utils.tests.test_elastic_bulk import ElasticStub
+
+FakeProbe = namedtuple("FakeProbe", ["probe_id", "asn"])
 
 
 class TestActiveDriver(TestCase):
@@ -51,6 +65,197 @@ class TestActiveDriver(TestCase):
         self.driver.listen()
 
 
+class FakeProbeSelector:
+    """picks two probes located in the given AS, counting the picks per AS"""
+
+    def __init__(self):
+        self.picks = Counter()
+
+    def update_asrank(self, view_ts):
+        pass
+
+    def pick_adjacent_probes(self, asn, num_probes):
+        self.picks[asn] += 1
+        return [FakeProbe(int(asn) * 10 + i, int(asn)) for i in range(2)]
+
+
+class TestBatchedDriver(TestCase):
+
+    view_ts = 1577836800
+
+    def setUp(self):
+        self.es_stub = ElasticStub().__enter__()
+        self.atlas_stub = AtlasStub().__enter__()
+        self.es = Elasticsearch(self.es_stub.url)
+
+    def tearDown(self):
+        self.es.close()
+        self.es_stub.__exit__(None, None, None)
+        self.atlas_stub.__exit__(None, None, None)
+
+    def build_driver(self):
+        driver = ActiveProbingDriver.__new__(ActiveProbingDriver)
+        driver.DEBUG = False
+        driver.event_type = "moas"
+        dispatcher = AtlasDispatcher(key="secret", max_workers=4, rate=1000, burst=100,
+                                     server=self.atlas_stub.server, scheme="http")
+        self.addCleanup(dispatcher.close)
+        driver.traceroute = RipeAtlasUtils(key="secret", dispatcher=dispatcher)
+        driver.probe_selector = FakeProbeSelector()
+        driver.target_ip_generator = TargetIpGenerator()
+        driver.tr_event_count = {}
+        driver.kafka_helper = FakeKafkaHelper()
+        with mock.patch("grip.utils.data.elastic.Elasticsearch", return_value=self.es):
+            driver.es_conn = ElasticConn()
+        driver.es_bulk = driver.es_conn.bulk_writer()
+        return driver
+
+    def build_events(self):
+        events = []
+        for i in range(ACTIVE_MAX_EVENTS_PER_BIN + 2):
+            event = create_dummy_event("moas", ts=self.view_ts, tr_worthy=True, prefix="11.0.{}.0/24".format(i))
+            event.event_id = "moas-{}-{}".format(self.view_ts, i)
+            events.append(event)
+        return events
+
+    @staticmethod
+    def requested(events):
+        return [[(msm.target_ip, msm.target_pfx, msm.target_asn, msm.probe_ids)
+                 for msm in event.pfx_events[0].traceroutes["msms"]] for event in events]
+
+    def test_same_requests_as_single_events(self):
+        single_driver = self.build_driver()
+        single_events = self.build_events()
+        for event in single_events:
+            single_driver.request_measurements(event)
+        single_requests = self.atlas_stub.requests
+
+        batch_driver = self.build_driver()
+        events = self.build_events()
+        succeeded = batch_driver.request_measurements_batch(events)
+
+        self.assertEqual(single_requests * 2, self.atlas_stub.requests)
+        self.assertEqual(self.requested(single_events), self.requested(events))
+        self.assertEqual([event.tr_metrics.as_dict() for event in single_events],
+                         [event.tr_metrics.as_dict() for event in events])
+
+        # events over the per-bin rate limit are skipped
+        self.assertEqual([2] * ACTIVE_MAX_EVENTS_PER_BIN + [0, 0], [len(jobs) for jobs in succeeded])
+        for event in events[ACTIVE_MAX_EVENTS_PER_BIN:]:
+            self.assertTrue(event.tr_metrics.tr_skipped)
+            self.assertIn("rate limit", event.tr_metrics.tr_skip_reason)
+        self.assertEqual(["11.0.0.1"], [msm.target_ip for msm in succeeded[0] if msm.target_asn == "12345"])
+
+        # probes of the event ASes are picked once per batch rather than once per event
+        self.assertEqual({"15169": ACTIVE_MAX_EVENTS_PER_BIN, "12345": ACTIVE_MAX_EVENTS_PER_BIN},
+                         dict(single_driver.probe_selector.picks))
+        self.assertEqual({"15169": 1, "12345": 1}, dict(batch_driver.probe_selector.picks))
+
+    def test_process_events(self):
+        driver = self.build_driver()
+        events = self.build_events()
+        driver.process_events(events)
+
+        # all events are committed with one bulk request
+        self.assertEqual(1, self.es_stub.requests["_bulk"])
+        stored = driver.es_conn.get_events_by_ids([event.event_id for event in events])
+        self.assertEqual(len(events), len(stored))
+        self.assertEqual(2, len(stored[events[0].event_id].pfx_events[0].traceroutes["msms"]))
+        self.assertTrue(stored[events[-1].event_id].tr_metrics.tr_skipped)
+
+        # the collector is notified of the events with requested measurements
+        notified = [MeasurementsRequestedMsg.from_str(msg) for msg in driver.kafka_helper.produced]
+        self.assertEqual([event.event_id for event in events[:ACTIVE_MAX_EVENTS_PER_BIN]],
+                         [msg.event_id for msg in notified])
+        self.assertEqual([2] * ACTIVE_MAX_EVENTS_PER_BIN, [len(msg.measurements) for msg in notified])
+
+    def test_process_time(self):
+        driver = self.build_driver()
+        self.atlas_stub.latency = 0.2
+        events = self.build_events()
+        driver.process_events(events)
+        # the events with requested measurements waited for the requests of the batch, skipped events did not
+        for event in events[:ACTIVE_MAX_EVENTS_PER_BIN]:
+            self.assertGreaterEqual(event.event_metrics.proc_time_driver, 0.2)
+        for event in events[ACTIVE_MAX_EVENTS_PER_BIN:]:
+            self.assertLess(event.event_metrics.proc_time_driver, 0.2)
+
+    def test_commit_failures(self):
+        driver = self.build_driver()
+        driver.es_bulk = driver.es_conn.bulk_writer(max_retries=0)
+        events = self.build_events()
+        events[0].event_id = "moas-{}-fail".format(self.view_ts)
+        # events refused by ElasticSearch are only logged
+        with self.assertLogs(level="ERROR"):
+            driver.process_events(events)
+        self.assertEqual(ACTIVE_MAX_EVENTS_PER_BIN - 1, len(driver.kafka_helper.produced))
+
+        # events that could be committed by retrying raise, with the bulk items to write again
+        driver = self.build_driver()
+        driver.es_bulk = driver.es_conn.bulk_writer(max_retries=0)
+        events = self.build_events()
+        events[1].event_id = "moas-{}-reject".format(self.view_ts)
+        with self.assertRaises(BulkWriteError) as ctx:
+            driver.process_events(events)
+        self.assertEqual([events[1].event_id], [item.doc_id for item in ctx.exception.failed])
+
+    def test_listen_retries_commits(self):
+        driver = self.build_driver()
+        driver.es_bulk = driver.es_conn.bulk_writer(max_retries=0)
+        events = self.build_events()
+        events[1].event_id = "moas-{}-reject".format(self.view_ts)
+        retries = []
+
+        def sleep(seconds):
+            if seconds == ACTIVE_COMMIT_RETRY_BACKOFF:
+                retries.append((driver.kafka_helper.flushed, len(driver.kafka_helper.produced)))
+
+        with mock.patch.object(driver, "process_messages", side_effect=lambda _: driver.process_events(events)), \
+                mock.patch.object(driver, "request_measurements_batch",
+                                  wraps=driver.request_measurements_batch) as request_measurements_batch, \
+                mock.patch.object(driver.kafka_helper, "consume", create=True, return_value=[KafkaMessage(b"", 0)]), \
+                mock.patch.object(driver.kafka_helper, "commit_offset", create=True) as commit_offset, \
+                mock.patch("grip.active.driver.time.sleep", side_effect=sleep):
+            driver.listen(limit=1, batch_size=10)
+
+        # the notifications of the committed events are delivered before the failed event is written again
+        self.assertEqual([(1, ACTIVE_MAX_EVENTS_PER_BIN - 1)], retries)
+        # the batch is committed once all its events are, measurements are requested once
+        self.assertEqual(1, request_measurements_batch.call_count)
+        commit_offset.assert_called_once_with()
+        notified = [MeasurementsRequestedMsg.from_str(msg).event_id for msg in driver.kafka_helper.produced]
+        self.assertEqual(events[1].event_id, notified[-1])
+        self.assertEqual(sorted(event.event_id for event in events[:ACTIVE_MAX_EVENTS_PER_BIN]), sorted(notified))
+        self.assertIsNotNone(driver.es_conn.get_events_by_ids([events[1].event_id]).get(events[1].event_id))
+
+    def test_process_messages(self):
+        driver = self.build_driver()
+        view_ts = int(time.time()) // 300 * 300
+        index = "observatory-v2-events-moas"
+        writer = ElasticBulkWriter(self.es)
+        stored = create_dummy_event("moas", ts=view_ts, tr_worthy=True, prefix="11.0.5.0/24")
+        stored.event_id = "moas-{}-0".format(view_ts)
+        writer.add_event(stored, index)
+        writer.flush()
+
+        messages = []
+        for event_id, ts in [(stored.event_id, view_ts), ("moas-{}-1".format(self.view_ts), self.view_ts)]:
+            msg = EventOnElasticMsg(sender="tagger", es_index=index, es_id=event_id, tr_worthy=True)
+            snapshot = create_dummy_event("moas", ts=ts, tr_worthy=True, prefix="11.0.0.0/24")
+            snapshot.event_id = event_id
+            msg.attach_event(snapshot)
+            messages.append(KafkaMessage(msg.to_bytes(), len(messages)))
+
+        with mock.patch.object(driver.es_conn, "get_events_by_ids", wraps=driver.es_conn.get_events_by_ids) as mget, \
+                mock.patch.object(driver, "process_events") as process_events:
+            driver.process_messages(messages)
+        # the embedded snapshots only skip old events, the other events are read from ElasticSearch
+        self.assertEqual([stored.event_id], list(mget.call_args[0][0]))
+        events = process_events.call_args[0][0]
+        self.assertEqual([stored.event_id], [event.event_id for event in events])
+        self.assertEqual("11.0.5.0/24", events[0].pfx_events[0].details.get_prefix_of_interest())
+
+
 class TestProbeIpGenerator(TestCase):
     def setUp(self):
         self.generator = TargetIpGenerator()
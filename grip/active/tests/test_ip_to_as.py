@@ -0,0 +1,121 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+from unittest import TestCase
+
+from grip.active.ip_to_as import IpToAsResolver
+from grip.redis import Pfx2AsHistorical
+from grip.active.tests.test_collector import FakeRedisHelper
+
+
+class TestIpToAsResolver(TestCase):
+
+    def setUp(self):
+        self.pfx2as = Pfx2AsHistorical.__new__(Pfx2AsHistorical)
+        self.pfx2as.rh = FakeRedisHelper([
+            ("8.8.8.0/24", 1500000000, 1577836800, "15169"),
+            ("8.0.0.0/9", 1400000000, 1577836800, "3356"),
+            ("8.0.0.0/9", 1577836800, 1580000000, "3356 174"),
+            ("1.1.1.0/24", 1577836000, 1577836800, "13335"),
+        ])
+
+    def test_same_as_lookup(self):
+        prefixes = ["8.8.8.8/32", "8.8.4.4/32", "1.1.1.1/32", "200.0.0.1/32", "8.8.8.0/24"]
+        tses = [None, 1500000000, 1577836800]
+        resolver = IpToAsResolver(self.pfx2as)
+        resolver.prefetch([(prefix, ts) for prefix in prefixes for ts in tses] + [("2001:db8::1/128", None)])
+        self.assertEqual(1, self.pfx2as.rh.round_trips)
+
+        for prefix in prefixes:
+            for max_ts in tses:
+                self.assertEqual(self.pfx2as.lookup(prefix, max_ts=max_ts), resolver.lookup(prefix, max_ts=max_ts))
+        self.assertEqual(("8.0.0.0/9", [("1400000000", "1577836800", ["3356"])]),
+                         resolver.lookup("8.8.4.4/32", max_ts=1500000000))
+        self.assertEqual(("8.0.0.0/9", [("1400000000", "1577836800", ["3356"])]),
+                         resolver.lookup("8.8.4.4/32", max_ts=1500000000, min_ts=1500000000))
+
+    def test_promoted_day(self):
+        rh = self.pfx2as.rh
+        rh.days = [1577750400]
+        resolver = IpToAsResolver(self.pfx2as, days_check_interval=0)
+        self.assertEqual(self.pfx2as.lookup("1.1.1.1/32", max_ts=1577923200),
+                         resolver.lookup("1.1.1.1/32", max_ts=1577923200))
+
+        # records only change when a new day is promoted, the cache is cleared then
+        rh.add_record("1.1.1.0/24", 1577836800, 1577923200, "64512")
+        self.assertEqual(1, len(resolver.lookup("1.1.1.1/32", max_ts=1577923200)[1]))
+        rh.days.append(1577836800)
+        self.assertEqual(self.pfx2as.lookup("1.1.1.1/32", max_ts=1577923200),
+                         resolver.lookup("1.1.1.1/32", max_ts=1577923200))
+        self.assertEqual(2, len(resolver.lookup("1.1.1.1/32", max_ts=1577923200)[1]))
+
+    def test_coalescing(self):
+        resolver = IpToAsResolver(self.pfx2as)
+        # one query per prefix and super-prefix, whatever the number of duplicates and days
+        resolver.prefetch([("8.8.8.8/32", ts) for ts in [1500000000, 1500000001, 1577836800]] * 10)
+        self.assertEqual(1, self.pfx2as.rh.round_trips)
+        self.assertEqual(2, len(resolver))
+
+        # cached queries are not fetched again
+        resolver.prefetch([("8.8.8.8/32", 1500000000)])
+        self.assertEqual(1, self.pfx2as.rh.round_trips)
+
+    def test_hit_rate(self):
+        resolver = IpToAsResolver(self.pfx2as)
+        resolver.prefetch([("8.8.8.8/32", 1500000000)])
+        # the first lookup of a prefetched entry is a miss
+        resolver.lookup("8.8.8.8/32", max_ts=1500000000)
+        resolver.lookup("8.8.8.8/32", max_ts=1500000001)
+        self.assertEqual((2, 1), (resolver.lookup_cnt, resolver.hit_cnt))
+
+        # entries are kept per day, lookups of another day query Redis
+        resolver.lookup("8.8.8.8/32", max_ts=1577836800)
+        self.assertEqual(2, self.pfx2as.rh.round_trips)
+        resolver.lookup("8.8.8.8/32", max_ts=1577836801)
+        self.assertEqual((4, 2), (resolver.lookup_cnt, resolver.hit_cnt))
+        self.assertEqual(0.5, resolver.get_hit_rate())
+
+        # lookups not served by the cache are not counted
+        resolver.lookup("8.8.8.8/32", exact_match=True)
+        self.assertEqual(4, resolver.lookup_cnt)
+
+    def test_bounded(self):
+        resolver = IpToAsResolver(self.pfx2as, cache_size=2)
+        for prefix in ["8.8.8.8/32", "8.8.4.4/32", "8.8.8.8/32", "1.1.1.1/32"]:
+            resolver.lookup(prefix)
+        self.assertEqual(2, len(resolver))
+        # the least recently used entry has been evicted
+        round_trips = self.pfx2as.rh.round_trips
+        resolver.lookup("8.8.8.8/32")
+        self.assertEqual(round_trips, self.pfx2as.rh.round_trips)
+        resolver.lookup("8.8.4.4/32")
+        self.assertEqual(round_trips + 1, self.pfx2as.rh.round_trips)
+        self.assertEqual(2, resolver.hit_cnt)
@@ -0,0 +1,200 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from grip.active.collector import ActiveProbingCollector, TRACEROUTE_STATUS
+from grip.active.ripe_atlas.msm_tracker import MeasurementTracker
+from grip.active.ripe_atlas.ripe_atlas_msm import AtlasMeasurement
+from grip.active.ripe_atlas.ripe_atlas_utils import get_traceroute_status_map
+
+
+def build_msm(msm_id):
+    return AtlasMeasurement(msm_id=msm_id, probe_ids=[1, 2], target_ip="11.0.0.1", target_pfx="11.0.0.0/24",
+                            target_asn="100", request_error=[], event_id="moas-1577836800-100_200")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMeasurementTracker(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracker = MeasurementTracker(min_interval=30, max_interval=600, backoff_factor=0.5, max_age=3600,
+                                          clock=self.clock)
+
+    def test_backoff(self):
+        self.assertTrue(self.tracker.add(build_msm(1)))
+        self.assertFalse(self.tracker.add(build_msm(1)))
+        self.assertEqual(1030, self.tracker.get_next_check_time())
+        self.assertEqual([], self.tracker.pop_due())
+
+        check_times = []
+        for _ in range(10):
+            self.clock.now = self.tracker.get_next_check_time()
+            check_times.append(self.clock.now - 1000)
+            self.assertEqual([1], [msm.msm_id for msm in self.tracker.pop_due()])
+            # a measurement being checked is not scheduled until it is rescheduled
+            self.assertIsNone(self.tracker.get_next_check_time())
+            self.tracker.reschedule(1)
+        # checks every min_interval first, then every age * backoff_factor, up to max_interval
+        self.assertEqual([30, 60, 90, 135, 202.5, 303.75, 455.625, 683.4375, 1025.15625, 1537.734375], check_times)
+        self.clock.now += 10000
+        self.tracker.pop_due()
+        self.tracker.reschedule(1)
+        self.assertEqual(self.clock.now + 600, self.tracker.get_next_check_time())
+        self.assertTrue(self.tracker.is_expired(1))
+
+    def test_pop_due_in_order(self):
+        for msm_id, delay in [(1, 50), (2, 10), (3, 30), (4, 100)]:
+            self.tracker.add(build_msm(msm_id), check_time=1000 + delay)
+        self.tracker.remove(3)
+        self.clock.now = 1060
+        self.assertEqual([2, 1], [msm.msm_id for msm in self.tracker.pop_due()])
+        self.assertEqual(1100, self.tracker.get_next_check_time())
+        self.assertEqual(3, len(self.tracker))
+        self.assertIn(2, self.tracker)
+        self.assertNotIn(3, self.tracker)
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            state_file = os.path.join(tmp_dir, "pending.json")
+            tracker = MeasurementTracker(state_file=state_file, clock=self.clock)
+            tracker.add(build_msm(1))
+            self.clock.now += 100
+            tracker.add(build_msm(2))
+            tracker.add(build_msm(3))
+            tracker.remove(3)
+            tracker.save()
+
+            self.clock.now += 100
+            restarted = MeasurementTracker(state_file=state_file, clock=self.clock)
+            self.assertEqual(2, len(restarted))
+            self.assertEqual(build_msm(1).as_dict(), restarted.get(1).as_dict())
+            # ages are kept and measurements are checked right away after a restart
+            self.assertEqual(200, restarted.get_age(1))
+            self.assertEqual(100, restarted.get_age(2))
+            self.assertEqual([1, 2], sorted(msm.msm_id for msm in restarted.pop_due()))
+
+
+class TestRetrieveResults(TestCase):
+
+    @staticmethod
+    def fake_status_request(msm_lst):
+        statuses = {1: 2, 2: 4, 3: 7, 4: 5}
+        return True, {"results": [{"id": msm_id, "status": {"id": statuses[msm_id]}}
+                                  for msm_id in msm_lst if msm_id in statuses]}
+
+    def test_retrieve_results_map(self):
+        threads = set()
+
+        class FakeAtlasRequest:
+            def __init__(self):
+                self.url_path = ""
+
+            def get(self):
+                ids = [int(i) for i in self.url_path.split("=")[1].split(",")]
+                return TestRetrieveResults.fake_status_request(ids)
+
+        class FakeResultsRequest:
+            def __init__(self, msm_id):
+                self.msm_id = msm_id
+
+            def create(self):
+                threads.add(threading.current_thread().name)
+                return True, [{"msm_id": self.msm_id}]
+
+        collector = ActiveProbingCollector.__new__(ActiveProbingCollector)
+        with mock.patch("grip.active.ripe_atlas.ripe_atlas_utils.AtlasRequest", FakeAtlasRequest), \
+                mock.patch("grip.active.collector.AtlasResultsRequest", FakeResultsRequest):
+            self.assertEqual([2, 4], sorted(get_traceroute_status_map([2, 4])))
+            with ThreadPoolExecutor(max_workers=4, thread_name_prefix="test-collector") as executor:
+                results = list(collector._retrieve_results_map(list(range(1, 26)), executor=executor))
+
+        self.assertEqual(list(range(1, 26)), [msm_id for msm_id, _ in results])
+        self.assertEqual([
+            (1, (TRACEROUTE_STATUS.Ongoing, [])),
+            (2, (TRACEROUTE_STATUS.Finished, [{"msm_id": 2}])),
+            (3, (TRACEROUTE_STATUS.Failed, [])),
+            (4, (TRACEROUTE_STATUS.Finished, [{"msm_id": 4}])),
+            (5, (TRACEROUTE_STATUS.RetrievalError, [])),
+        ], results[:5])
+        self.assertTrue(all(name.startswith("test-collector") for name in threads))
+
+
+class TestCheckMeasurements(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.collector = ActiveProbingCollector.__new__(ActiveProbingCollector)
+        self.collector.executor = None
+        self.collector.tracker = MeasurementTracker(min_interval=30, max_interval=600, backoff_factor=0.5,
+                                                    max_age=3600, clock=self.clock)
+        for msm_id in range(1, 16):
+            self.collector.tracker.add(build_msm(msm_id))
+
+    def test_failed_status_chunk(self):
+        class FakeAtlasRequest:
+            def __init__(self):
+                self.url_path = ""
+
+            def get(self):
+                ids = [int(i) for i in self.url_path.split("=")[1].split(",")]
+                if 1 in ids:
+                    # the status request of the first chunk of 10 measurements fails
+                    return False, {}
+                return True, {"results": [{"id": msm_id, "status": {"id": 2}} for msm_id in ids]}
+
+        tracker = self.collector.tracker
+        with mock.patch("grip.active.ripe_atlas.ripe_atlas_utils.AtlasRequest", FakeAtlasRequest):
+            self.clock.now = tracker.get_next_check_time()
+            finished, stopped = self.collector._check_measurements(tracker.pop_due())
+            # measurements of the failed chunk are checked again later, like the on-going ones
+            self.assertEqual(([], []), (finished, stopped))
+            self.assertEqual(15, len(tracker))
+
+            # they are given up once expired, and still written to their events
+            self.clock.now = 1000 + 3600 + 1
+            finished, stopped = self.collector._check_measurements(tracker.pop_due())
+        self.assertEqual([], stopped)
+        self.assertEqual(list(range(1, 16)), [msm.msm_id for msm in finished])
+        self.assertEqual([["cannot retrieve measurement status"]] * 10 + [["measurement did not finish in time"]] * 5,
+                         [msm.request_error for msm in finished])
@@ -0,0 +1,303 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from ripe.atlas.cousteau import Probe as AtlasProbe
+from ripe.atlas.cousteau.exceptions import APIResponseError
+
+from grip.active.ripe_atlas.ripe_atlas_probe import Probe, ProbesCache, ProbeSelector
+
+PROBES_FIXTURE = os.path.join(os.path.dirname(__file__), "data", "atlas_probes_2020-01-01.json")
+
+
+def load_probes_fixture():
+    """connected probes listed by the Atlas API"""
+    with open(PROBES_FIXTURE) as fh:
+        return json.load(fh)["results"]
+
+
+class RecordedProbeRequest:
+    """ProbeRequest replaying the given probe list, optionally waiting for an event before the first probe"""
+
+    def __init__(self, probes, wait=None):
+        self.probes = probes
+        self.wait = wait
+        self.requests = 0
+
+    def __call__(self, **kwargs):
+        self.requests += 1
+        if self.wait is not None:
+            self.wait.wait(10)
+        return iter([AtlasProbe(meta_data=probe) for probe in self.probes])
+
+
+class FakeAsRank:
+    """ASRank neighbors of a small synthetic AS graph"""
+
+    data_ts = "2020-01-01"
+
+    def __init__(self, rand, num_ases=300):
+        self.queries = 0
+        self.links = {str(asn): {"providers": [], "customers": [], "peers": []} for asn in range(1, num_ases + 1)}
+        for asn in range(2, num_ases + 1):
+            # every AS has one or two providers with a lower number, and some peers
+            for provider in rand.sample(range(1, asn), min(asn - 1, rand.randint(1, 2))):
+                self.links[str(asn)]["providers"].append(str(provider))
+                self.links[str(provider)]["customers"].append(str(asn))
+            if rand.random() < 0.3:
+                peer = str(rand.randint(1, num_ases))
+                if peer != str(asn):
+                    self.links[str(asn)]["peers"].append(peer)
+                    self.links[peer]["peers"].append(str(asn))
+        self.links["1"]["customers"].append("")
+
+    def get_neighbor_ases(self, asn):
+        self.queries += 1
+        return self.links.get(asn, {"providers": [], "customers": [], "peers": []})
+
+
+def legacy_pick_adjacent_probes(asrank, probe_server, asn, threshold=None, max_hops=5):
+    """probe selection before the neighborhood index"""
+    hops = 0
+    probes_selected = []
+    process_group = list()
+    process_group.append((asn, 'target'))
+    visited, queue = set(), [(asn, 'target'), '*']
+
+    while queue and (hops < max_hops):
+        if queue[0] == '*':
+            break
+        vertex, tag = queue.pop(0)
+        if vertex not in visited:
+            if vertex != asn:
+                if vertex in visited:
+                    continue
+                else:
+                    visited.add(vertex)
+            adjacent_ases = asrank.get_neighbor_ases(vertex)
+            queue.extend([(a, 'customers') for a in adjacent_ases['customers'] if a != ""])
+            process_group.extend([(a, 'customer') for a in adjacent_ases['customers'] if a != ""])
+            if tag == 'providers' or tag == 'target':
+                queue.extend([(a, 'peers') for a in adjacent_ases['peers'] if a != ""])
+                process_group.extend([(a, 'peer') for a in adjacent_ases['peers'] if a != ""])
+            if tag == 'target':
+                queue.extend([(a, 'providers') for a in adjacent_ases['providers'] if a != ""])
+                process_group.extend([(a, 'provider') for a in adjacent_ases['providers'] if a != ""])
+
+        if len(process_group) > 20 or queue[0] == '*':
+            finished = False
+            for as_type in ['target', 'customer', 'peer', 'provider']:
+                ases = [int(asn) for (asn, t) in process_group if t == as_type and asn.isdigit()]
+                if not ases:
+                    continue
+                probes_with_asn = probe_server.get_online_probes(ases)
+                for _, probes in probes_with_asn:
+                    probes_selected.append(probes[random.randint(0, len(probes) - 1)])
+                if len(probes_selected) >= threshold:
+                    finished = True
+                    break
+            process_group = []
+            if finished:
+                break
+            if queue[0] == '*':
+                queue.pop(0)
+                hops += 1
+                if queue:
+                    queue.append('*')
+
+    return probes_selected[:threshold]
+
+
+class TestProbeSelector(TestCase):
+
+    def setUp(self):
+        rand = random.Random(1)
+        self.asrank = FakeAsRank(rand)
+        probes_cache = ProbesCache("moas")
+        # a third of the ASes host one to three probes
+        probes_cache.asn_probes_map = {
+            asn: {Probe(pid=asn * 10 + i, iso2="US", asn=asn) for i in range(rand.randint(1, 3))}
+            for asn in range(1, 301) if rand.random() < 0.3
+        }
+        probes_cache.updated_time = 2 ** 40
+        with mock.patch("grip.active.ripe_atlas.ripe_atlas_probe.AsRankUtils", return_value=self.asrank):
+            self.selector = ProbeSelector("moas")
+            self.selector.probe_server = probes_cache
+            self.selector.update_asrank(1577836800)
+
+    def test_same_probes(self):
+        for threshold in [1, 5, 30, 1000]:
+            for asn in ["1", "2", "17", "150", "300", "1000"]:
+                random.seed(threshold)
+                expected = legacy_pick_adjacent_probes(self.asrank, self.selector.probe_server, asn, threshold)
+                random.seed(threshold)
+                self.assertEqual([p.probe_id for p in expected],
+                                 [p.probe_id for p in self.selector.pick_adjacent_probes(asn, threshold)])
+
+    def test_lookups_once_per_snapshot(self):
+        self.selector.pick_adjacent_probes("150", 1000)
+        queries = self.asrank.queries
+        self.assertGreater(queries, 0)
+        self.selector.pick_adjacent_probes("150", 1000)
+        self.selector.pick_adjacent_probes("150", 5)
+        # a new view of the same ASRank snapshot keeps the index
+        with mock.patch("grip.active.ripe_atlas.ripe_atlas_probe.AsRankUtils", return_value=self.asrank):
+            self.selector.update_asrank(1577837100)
+        self.selector.pick_adjacent_probes("150", 1000)
+        self.assertEqual(queries, self.asrank.queries)
+
+    def test_probes_refresh(self):
+        self.selector.pick_adjacent_probes("150", 1000)
+        self.selector.probe_server.asn_probes_map = {150: {Probe(pid=1, iso2="US", asn=150)}}
+        self.selector.probe_server.updated_time += 1
+        probes = self.selector.pick_adjacent_probes("150", 1000)
+        self.assertEqual({1}, {p.probe_id for p in probes})
+        expected = legacy_pick_adjacent_probes(self.asrank, self.selector.probe_server, "150", 1000)
+        self.assertEqual(len(expected), len(probes))
+
+
+class TestProbesCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.snapshot_file = os.path.join(self.tmp_dir, "probes", "online-probes-moas.json.gz")
+        self.fixture = load_probes_fixture()
+        self.cache = ProbesCache("moas", snapshot_file=self.snapshot_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def refresh(self, cache, probes):
+        request = RecordedProbeRequest(probes)
+        with mock.patch("grip.active.ripe_atlas.ripe_atlas_probe.ProbeRequest", side_effect=request):
+            cache.update_cache_if_needed()
+        return request
+
+    def assert_index(self, cache, probes):
+        by_asn = {}
+        by_country = {}
+        for probe in probes:
+            if probe["asn_v4"] is not None:
+                by_asn.setdefault(probe["asn_v4"], set()).add(probe["id"])
+            by_country.setdefault(probe["country_code"], set()).add(probe["id"])
+        self.assertEqual(by_asn, {asn: {p.probe_id for p in ps} for asn, ps in cache.asn_probes_map.items()})
+        self.assertEqual(by_country, {cc: {p.probe_id for p in ps} for cc, ps in cache.country_probes_map.items()})
+        for probe in probes:
+            indexed = cache.probes[probe["id"]]
+            self.assertEqual((probe["asn_v4"], probe["country_code"]), (indexed.asn, indexed.country_code))
+
+    def test_index(self):
+        request = self.refresh(self.cache, self.fixture)
+        self.assertEqual(1, request.requests)
+        self.assertEqual(len(self.fixture), len(self.cache.probes))
+        self.assert_index(self.cache, self.fixture)
+
+        expected = sorted(p["id"] for p in self.fixture if p["asn_v4"] == 13335)
+        self.assertGreater(len(expected), 1)
+        online = self.cache.get_online_probes([13335, 64512])
+        self.assertEqual([13335], [asn for asn, _ in online])
+        self.assertEqual(expected, sorted(p.probe_id for p in online[0][1]))
+        self.assertEqual(sorted(p["id"] for p in self.fixture if p["country_code"] == "FR"),
+                         sorted(p.probe_id for p in self.cache.get_country_probes("FR")))
+        self.assertEqual([], self.cache.get_country_probes("AQ"))
+        # the cache is fresh, no more requests
+        self.assertEqual(1, request.requests)
+
+    def test_incremental_refresh(self):
+        self.refresh(self.cache, self.fixture)
+        kept = self.cache.probes[self.fixture[0]["id"]]
+
+        probes = [dict(p) for p in self.fixture[:-2]]  # two probes disconnected
+        probes[1]["asn_v4"] = 64512  # one probe moved
+        probes.append(dict(self.fixture[0], id=999999, country_code="BR"))  # one new probe
+        self.assertEqual(4, self.cache.apply_probes({p["id"]: (p["asn_v4"], p["country_code"]) for p in probes}))
+        self.assert_index(self.cache, probes)
+        self.assertNotIn(self.fixture[-1]["id"], self.cache.probes)
+        # unchanged probes are kept as they are
+        self.assertIs(kept, self.cache.probes[self.fixture[0]["id"]])
+        self.assertEqual(0, self.cache.apply_probes({p["id"]: (p["asn_v4"], p["country_code"]) for p in probes}))
+
+    def test_snapshot(self):
+        self.refresh(self.cache, self.fixture)
+        self.assertTrue(os.path.exists(self.snapshot_file))
+        self.assertFalse(os.path.exists(self.snapshot_file + ".tmp"))
+
+        # a restart loads the snapshot without requesting the probes
+        cache = ProbesCache("moas", snapshot_file=self.snapshot_file)
+        request = self.refresh(cache, [])
+        self.assertEqual(0, request.requests)
+        self.assertEqual(self.cache.updated_time, cache.updated_time)
+        self.assert_index(cache, self.fixture)
+
+    def test_stale_snapshot(self):
+        self.refresh(self.cache, self.fixture)
+        self.cache.updated_time -= ProbesCache.CACHE_VALID_SECONDS + 1
+        self.cache.save_snapshot()
+
+        # the stale snapshot is served while the probes are requested in the background
+        cache = ProbesCache("moas", snapshot_file=self.snapshot_file)
+        release = threading.Event()
+        request = RecordedProbeRequest(self.fixture[1:], wait=release)
+        with mock.patch("grip.active.ripe_atlas.ripe_atlas_probe.ProbeRequest", side_effect=request):
+            self.assertEqual(sorted(p["id"] for p in self.fixture if p["country_code"] == "US"),
+                             sorted(p.probe_id for p in cache.get_country_probes("US")))
+            self.assertEqual(1, request.requests)
+            self.assertEqual(len(self.fixture), len(cache.probes))
+
+            release.set()
+            deadline = time.time() + 10
+            while not cache._refresh.done() and time.time() < deadline:
+                time.sleep(0.01)
+            cache.update_cache_if_needed()
+        self.assertEqual(1, request.requests)
+        self.assert_index(cache, self.fixture[1:])
+        self.assertGreater(cache.updated_time, self.cache.updated_time)
+
+    def test_api_error(self):
+        self.refresh(self.cache, self.fixture)
+        self.cache.updated_time -= ProbesCache.CACHE_VALID_SECONDS + 1
+        with mock.patch("grip.active.ripe_atlas.ripe_atlas_probe.ProbeRequest",
+                        side_effect=APIResponseError("unavailable")):
+            self.cache.update_cache_if_needed()
+            self.cache._refresh.result()
+            self.cache.update_cache_if_needed()
+        # the probes are kept until the next refresh
+        self.assert_index(self.cache, self.fixture)
+        self.assertGreater(self.cache.updated_time, int(time.time()) - 10)
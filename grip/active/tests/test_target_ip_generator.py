@@ -0,0 +1,171 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import random
+from unittest import TestCase
+
+from netaddr import IPNetwork, IPAddress
+
+from grip.active.ripe_atlas.target_ip_generator import TargetIpGenerator, UnsortedPrefixesError, pfx_sort_key
+
+
+def legacy_probe_pfx_ip_map(pfxs_rtree):
+    """target IP selection walking the address space with the radix tree, before the interval sweep"""
+    pfx_ip_map = {}
+
+    for node in pfxs_rtree:
+        pfx = node.prefix
+        if pfx in pfx_ip_map:
+            continue
+
+        network = IPNetwork(pfx)
+        ip_first = int(network.first)
+        ip_last = int(network.last)
+        assigned_ip = ip_first
+        while assigned_ip <= ip_last:
+            assigned_ip_str = str(IPAddress(assigned_ip+1))
+            best_match_pfx = pfxs_rtree.search_best(assigned_ip_str).prefix
+
+            if best_match_pfx == pfx:
+                pfx_ip_map[pfx] = assigned_ip_str
+                break
+
+            if best_match_pfx not in pfx_ip_map:
+                pfx_ip_map[best_match_pfx] = assigned_ip_str
+
+            matching_network = IPNetwork(best_match_pfx)
+            mask = best_match_pfx.split("/")[1]
+            next_network = IPNetwork(str(IPAddress(int(matching_network.broadcast) + 1)) + "/" + mask)
+            assigned_ip = int(next_network.first)
+
+    return pfx_ip_map
+
+
+def random_prefixes(rand, base, base_len, num_pfxs, max_len):
+    """random, heavily nested prefixes within the base network, including some fully covered ones"""
+    base_net = IPNetwork("{}/{}".format(base, base_len))
+    pfxs = {str(base_net)}
+    # there are no more than 2 ** (max_len - base_len + 1) - 1 prefixes to pick from
+    num_pfxs = min(num_pfxs, 2 ** (max_len - base_len + 1) - 1)
+    while len(pfxs) < num_pfxs:
+        parent = IPNetwork(rand.choice(sorted(pfxs)))
+        if parent.prefixlen >= max_len:
+            continue
+        sub_len = rand.randint(parent.prefixlen + 1, max_len)
+        subnets = list(parent.subnet(sub_len, count=min(64, 2 ** (sub_len - parent.prefixlen))))
+        if rand.random() < 0.2 and sub_len == parent.prefixlen + 1:
+            # cover the parent entirely
+            pfxs.update(str(subnet) for subnet in subnets)
+        else:
+            pfxs.add(str(rand.choice(subnets)))
+    return sorted(pfxs)
+
+
+class TestTargetIpGenerator(TestCase):
+
+    def check_same_as_legacy(self, pfxs):
+        generator = TargetIpGenerator()
+        for pfx in pfxs:
+            generator.add_pfx(pfx)
+        expected = legacy_probe_pfx_ip_map(generator.pfxs_rtree)
+        self.assertEqual(expected, generator.get_probe_pfx_ip_map(), "prefixes: {}".format(pfxs))
+
+        # streaming the sorted prefixes (in canonical form), with duplicates and prefixes to ignore
+        canonical_pfxs = [node.prefix for node in generator.pfxs_rtree]
+        stream = sorted(canonical_pfxs + canonical_pfxs[:5] + ["10.1.0.0/16", "11.0.0.0/25"], key=pfx_sort_key)
+        streamed = list(TargetIpGenerator().iter_probe_pfx_ips(stream))
+        self.assertEqual(len(expected), len(streamed))
+        self.assertEqual(expected, dict(streamed))
+
+    def test_nested_prefixes(self):
+        generator = TargetIpGenerator()
+        for pfx in ["11.0.0.0/22", "11.0.0.0/23", "11.0.1.0/24", "11.0.2.0/24", "11.0.3.0/24",
+                    "12.0.0.0/16", "12.0.0.0/17", "12.0.128.0/17", "13.0.0.0/24", "10.0.0.0/24", "14.0.0.0/25"]:
+            generator.add_pfx(pfx)
+        self.assertEqual({
+            "11.0.0.0/23": "11.0.0.1",
+            "11.0.1.0/24": "11.0.1.1",
+            "11.0.2.0/24": "11.0.2.1",
+            "11.0.3.0/24": "11.0.3.1",
+            # 12.0.0.0/16 is fully covered by its two halves
+            "12.0.0.0/17": "12.0.0.1",
+            "12.0.128.0/17": "12.0.128.1",
+            "13.0.0.0/24": "13.0.0.1",
+        }, generator.get_probe_pfx_ip_map())
+
+    def test_stream(self):
+        generator = TargetIpGenerator()
+        stream = generator.iter_probe_pfx_ips(["11.0.0.0/22", "11.0.0.0/23", "11.0.1.0/24", "11.0.2.0/24",
+                                               "12.0.0.0/16", "12.0.0.0/17", "12.0.128.0/17", "13.0.0.0/24"])
+        # prefixes are returned as soon as the stream moves past them
+        self.assertEqual(("11.0.1.0/24", "11.0.1.1"), next(stream))
+        self.assertEqual(("11.0.0.0/23", "11.0.0.1"), next(stream))
+        self.assertEqual([("11.0.2.0/24", "11.0.2.1"), ("11.0.0.0/22", "11.0.3.1"), ("12.0.0.0/17", "12.0.0.1"),
+                          ("12.0.128.0/17", "12.0.128.1"), ("13.0.0.0/24", "13.0.0.1")], list(stream))
+
+        with self.assertRaises(UnsortedPrefixesError):
+            list(generator.iter_probe_pfx_ips(["11.0.0.0/24", "11.0.0.0/22"]))
+        with self.assertRaises(UnsortedPrefixesError):
+            list(generator.iter_probe_pfx_ips(["12.0.0.0/24", "11.0.0.0/24"]))
+
+    def test_non_canonical_prefixes(self):
+        pfxs = ["11.0.0.5/22", "11.0.0.0/23", "11.0.1.9/24", "11.0.1.0/24", "12.0.0.7/16"]
+        generator = TargetIpGenerator()
+        for pfx in pfxs:
+            generator.add_pfx(pfx)
+        expected = {
+            "11.0.0.0/23": "11.0.0.1",
+            "11.0.1.0/24": "11.0.1.1",
+            "11.0.0.0/22": "11.0.2.1",
+            "12.0.0.0/16": "12.0.0.1",
+        }
+        self.assertEqual(expected, generator.get_probe_pfx_ip_map())
+        # the stream returns the prefixes normalised as the radix tree does, and skips host-bit variants
+        streamed = list(TargetIpGenerator().iter_probe_pfx_ips(sorted(pfxs, key=pfx_sort_key)))
+        self.assertEqual(len(expected), len(streamed))
+        self.assertEqual(expected, dict(streamed))
+
+    def test_same_as_legacy_ipv4(self):
+        rand = random.Random(42)
+        for _ in range(300):
+            pfxs = []
+            for _ in range(rand.randint(1, 3)):
+                base_len = rand.randint(7, 20)
+                base = "{}.{}.0.0".format(rand.choice([11, 20, 45, 80, 130, 200]), rand.randint(0, 255))
+                pfxs.extend(random_prefixes(rand, base, base_len, rand.randint(1, 40), 24))
+            self.check_same_as_legacy(pfxs)
+
+    def test_same_as_legacy_ipv6(self):
+        rand = random.Random(7)
+        for _ in range(100):
+            pfxs = random_prefixes(rand, "2400::", rand.randint(7, 16), rand.randint(1, 30), 24)
+            pfxs.extend(random_prefixes(rand, "11.0.0.0", 16, rand.randint(1, 10), 24))
+            self.check_same_as_legacy(pfxs)
@@ -58,6 +58,16 @@ ACTIVE_MAX_EVENT_ASES = 3  # max num ASes (involved in the event) from whose pro
 ACTIVE_MAX_PROBES_PER_TARGET = 10  # max num of VPs per event_AS
 ACTIVE_MAX_EVENTS_PER_BIN = 10  # how many events do we do traceroutes for in every 5 minutes bin
 ACTIVE_MAX_TIME_DELTA = 7200  # maximum seconds time (2 hour) difference between now and the event time
+ACTIVE_COMMIT_RETRY_BACKOFF = 30  # base delay (seconds) between retries of events failed to commit after requests
+ACTIVE_COMMIT_MAX_BACKOFF = 600  # max delay (seconds) between retries of events failed to commit after requests
+
+# RIPE Atlas measurement creation
+ATLAS_MAX_WORKERS = 8  # max number of concurrent measurement creation requests
+ATLAS_MAX_REQUESTS_PER_SECOND = 5  # client-side rate limit for measurement creation requests
+ATLAS_REQUEST_BURST = 10  # max number of requests sent back-to-back before the rate limit kicks in
+ATLAS_MAX_RETRIES = 3  # max number of retries for a request failed with a transient error
+ATLAS_RETRY_BACKOFF = 1.0  # base delay (seconds) of the exponential backoff between retries
+ATLAS_REQUEST_TIMEOUT = (10, 60)  # (connect, read) timeouts (seconds) of measurement creation requests
 
 load_dotenv(find_dotenv(".limbo-cred"), override=True)
 SWIFT_AUTH_OPTIONS = {
@@ -44,6 +44,7 @@ import grip.common
 
 DEFAULT_KAFKA_TOPIC = "grip-production.announcements"
 DEFAULT_TOPIC_OFFSET = "latest"
+DEFAULT_BATCH_SIZE = 100
 
 
 class Announcement(object):
@@ -262,7 +263,46 @@ class Listener:
     def commit_offset(self):
         self.kc.commit()
 
-    def listen(self, limit=None):
+    def _parse_messages(self, msgs):
+        """build the announcements matching the filters out of a batch of kafka messages"""
+        anns = []
+        for msg in msgs:
+            if not msg.error():
+                text = msg.value().decode("utf-8")
+                print(text)
+                ann = build_from_json(text)
+                if not self._match_filters(ann):
+                    continue
+                anns.append(ann)
+            elif msg.error().code() != confluent_kafka.KafkaError._PARTITION_EOF:
+                logging.error("Unhandled Kafka error: %s" % msg.error())
+        return anns
+
+    @staticmethod
+    def coalesce(anns):
+        """
+        Keep only the newest announcement of each dataset, i.e. of each announcement type, sender type and sender
+        name, for datasets where each new file supersedes the previous ones.
+        :param anns: list of announcements
+        :return: list of announcements sorted by timestamp
+        """
+        newest = {}
+        for ann in anns:
+            key = (ann.ann_type, ann.sender_type, ann.sender_name)
+            if key not in newest or float(ann.timestamp) >= float(newest[key].timestamp):
+                newest[key] = ann
+        return sorted(newest.values(), key=lambda a: float(a.timestamp))
+
+    def listen_batches(self, batch_size=DEFAULT_BATCH_SIZE, coalesce=False, limit=None, timeout=5):
+        """
+        Listen for announcements and yield them in batches of up to batch_size announcements, i.e. all the ones
+        already available when catching up with the topic.
+
+        :param batch_size: maximum number of kafka messages to consume at once
+        :param coalesce: whether to keep only the newest announcement of each dataset in a batch
+        :param limit: stop after yielding this number of announcements
+        :param timeout: seconds to wait for a batch to fill up
+        """
         shutdown = {"count": 0}
 
         def _stop_handler(_signo, _stack_frame):
@@ -277,24 +317,25 @@ class Listener:
 
         count = 0
         while True:
-            if limit is not None and count == limit:
+            if limit is not None and count >= limit:
                 return
             if shutdown["count"] > 0:
                 logging.info("Shutting down")
                 break
-            msg = self.kc.poll(5)
-            if msg is None:
+            anns = self._parse_messages(self.kc.consume(num_messages=batch_size, timeout=timeout))
+            if coalesce:
+                anns = self.coalesce(anns)
+            if limit is not None:
+                anns = anns[:limit - count]
+            if not anns:
                 continue
-            if not msg.error():
-                text = msg.value().decode("utf-8")
-                print(text)
-                ann = build_from_json(text)
-                if not self._match_filters(ann):
-                    continue
-                count += 1
+            count += len(anns)
+            yield anns
+
+    def listen(self, limit=None):
+        for anns in self.listen_batches(batch_size=1, limit=limit):
+            for ann in anns:
                 yield ann
-            elif msg.error().code() != confluent_kafka.KafkaError._PARTITION_EOF:
-                logging.error("Unhandled Kafka error: %s" % msg.error())
 
 
 class Announcer:
@@ -325,11 +366,24 @@ class Announcer:
         self.kc.flush()
 
 
-def listen_and_announce(callback, listener):
+def listen_and_announce(callback, listener, batch_size=None, coalesce=False):
+    """
+    Call callback for incoming announcements and announce the announcements it returns.
+
+    :param callback: function taking an announcement, or a list of announcements if batch_size is set, and returning
+                     a list of announcements to send, or None
+    :param listener: Listener object
+    :param batch_size: if set, pass batches of up to batch_size announcements to the callback
+    :param coalesce: whether to keep only the newest announcement of each dataset in a batch
+    """
     assert (isinstance(listener, Listener))
     announcer = Announcer()
-    for in_ann in listener.listen():
-        out_anns = callback(in_ann)
+    if batch_size is None:
+        in_batches = ([ann] for ann in listener.listen())
+    else:
+        in_batches = listener.listen_batches(batch_size=batch_size, coalesce=coalesce)
+    for in_anns in in_batches:
+        out_anns = callback(in_anns if batch_size is not None else in_anns[0])
         if out_anns is None:
             out_anns = []
         for ann in out_anns:
@@ -0,0 +1,99 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+from unittest import TestCase
+
+from grip.coodinator.announce import FileAnnouncement, Listener
+
+
+class KafkaMessage:
+    """consumed kafka message"""
+
+    def __init__(self, ann):
+        self._value = ann.as_json().encode()
+
+    def error(self):
+        return None
+
+    def value(self):
+        return self._value
+
+
+class KafkaConsumer:
+    """replays batches of announcements"""
+
+    def __init__(self, batches):
+        self.batches = [[KafkaMessage(ann) for ann in batch] for batch in batches]
+        self.consumed = []
+
+    def consume(self, num_messages, timeout):
+        if not self.batches:
+            return []
+        batch = self.batches.pop(0)
+        self.consumed.append(num_messages)
+        return batch[:num_messages]
+
+
+def file_ann(sender_name, timestamp, sender_type="consumer"):
+    return FileAnnouncement(sender_type=sender_type, sender_name=sender_name,
+                            path="/data/{}.{}.gz".format(sender_name, timestamp), timestamp=timestamp)
+
+
+class TestListener(TestCase):
+
+    def setUp(self):
+        self.listener = Listener(group="grip-test", sender_type="consumer", brokers="127.0.0.1:1")
+        self.listener.kc.close()
+
+    def test_listen_batches(self):
+        self.listener.kc = KafkaConsumer([
+            [file_ann("pfx-origins", 300), file_ann("pfx-origins", 600), file_ann("moas", 600, sender_type="tagger")],
+            [file_ann("triplets-weekly", 600), file_ann("triplets-weekly", 0), file_ann("pfx-origins", 900)],
+        ])
+        batches = list(self.listener.listen_batches(batch_size=10, limit=5))
+        self.assertEqual([[300, 600], [600, 0, 900]], [[ann.timestamp for ann in anns] for anns in batches])
+        self.assertEqual([10, 10], self.listener.kc.consumed)
+
+    def test_coalesce(self):
+        self.listener.kc = KafkaConsumer([
+            [file_ann("pfx-origins", 600), file_ann("pfx-origins", 300), file_ann("triplets-weekly", 0),
+             file_ann("triplets-weekly", 600), file_ann("pfx-origins", 900)],
+        ])
+        anns = next(self.listener.listen_batches(coalesce=True))
+        self.assertEqual([("triplets-weekly", 600), ("pfx-origins", 900)],
+                         [(ann.sender_name, ann.timestamp) for ann in anns])
+        self.assertEqual("/data/pfx-origins.900.gz", anns[-1].path)
+
+    def test_listen(self):
+        self.listener.kc = KafkaConsumer([[file_ann("pfx-origins", 300)], [file_ann("pfx-origins", 600)]])
+        self.assertEqual([300, 600], [ann.timestamp for ann in self.listener.listen(limit=2)])
+        self.assertEqual([1, 1], self.listener.kc.consumed)
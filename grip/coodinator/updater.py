@@ -85,18 +85,23 @@ def update_pfx2as_historical(ann):
     # TODO: can more easily patch small holes?
 
 
+# coalesce: only the newest announcement of a batch needs to be processed, update_adj inserts all the missing
+# timestamps up to the announced one, while pfx2as files are inserted one by one
 DB_TYPES = {
     "adjacencies": {
         "consumer-name": "triplets-weekly",
         "update": update_adj,
+        "coalesce": True,
     },
     "pfx2as-newcomer": {
         "consumer-name": "pfx-origins",
         "update": update_pfx2as_newcomer,
+        "coalesce": False,
     },
     "pfx2as-historical": {
         "consumer-name": "pfx-origins",
         "update": update_pfx2as_historical,
+        "coalesce": False,
     }
 }
 DEFAULT_GROUP_TMPL = "grip-redis-production-%s"
@@ -174,12 +179,15 @@ def main():
         sender_type="consumer",
         sender_name=cfg["consumer-name"]
     )
-    for announcement in listener.listen():
-        logging.debug(announcement)
-        delay = time.time() - int(announcement.timestamp)
-        if delay > 45 * 60:
-            logging.warning("Inserting outdated info (%d)" % int(announcement.timestamp))
-        cfg["update"](announcement)
+    for announcements in listener.listen_batches(coalesce=cfg["coalesce"]):
+        for announcement in announcements:
+            logging.debug(announcement)
+            delay = time.time() - int(announcement.timestamp)
+            if delay > 45 * 60:
+                logging.warning("Inserting outdated info (%d)" % int(announcement.timestamp))
+            cfg["update"](announcement)
+            if shutdown["count"] > 0:
+                break
         if shutdown["count"] > 0:
             logging.info("Shutting down")
             break
@@ -32,6 +32,8 @@
 
 
 class PfxEventDetails:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
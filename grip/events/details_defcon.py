@@ -35,6 +35,8 @@ from .details import PfxEventDetails
 
 
 class DefconDetails(PfxEventDetails):
+    __slots__ = ("_super_pfx", "_sub_pfx", "_origins_set", "_old_origins_set", "_super_aspaths", "_sub_aspaths",
+                 "_new_origins_set")
 
     def get_prefix_of_interest(self):
         return self._sub_pfx
@@ -36,6 +36,8 @@ from .details import PfxEventDetails
 
 
 class EdgesDetails(PfxEventDetails):
+    __slots__ = ("_as1", "_as2", "_edgeid", "_prefix", "_origins", "_aspaths_compressed")
+
     def get_previous_origins(self):
         pass
 
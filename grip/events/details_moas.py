@@ -35,6 +35,7 @@ from .details import PfxEventDetails
 
 
 class MoasDetails(PfxEventDetails):
+    __slots__ = ("_prefix", "_origins", "_old_origins", "_aspaths", "_new_origins")
 
     def extract_attackers_victims(self):
         return self._new_origins, self._old_origins
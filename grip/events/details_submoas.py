@@ -35,6 +35,9 @@ from .details import PfxEventDetails
 
 
 class SubmoasDetails(PfxEventDetails):
+    __slots__ = ("_super_pfx", "_sub_pfx", "_super_origins", "_sub_origins", "_super_old_origins", "_sub_old_origins",
+                 "_super_aspaths", "_sub_aspaths", "_all_origins_set", "_old_origins_set", "_new_origins_set",
+                 "_newcomer_pfxs")
 
     def get_origin_fingerprint(self):
         return "%s=%s" % (
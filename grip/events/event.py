@@ -40,7 +40,8 @@ from grip.events.event_summary import EventSummary
 from grip.events.pfxevent import PfxEvent
 from grip.metrics.event_metrics import EventMetrics
 from grip.metrics.traceroute_metrics import TracerouteMetrics
-from grip.utils.general import to_dict, parse_ts
+from grip.utils import serialization
+from grip.utils.general import parse_ts
 
 MAX_PFX_EVENTS = 1000  # only output AS path info for the first 1k pfx events
 
@@ -50,6 +51,9 @@ class Event:
     Event definition.
     """
 
+    __slots__ = ("event_type", "pfx_events", "position", "event_id", "view_ts", "finished_ts", "insert_ts",
+                 "last_modified_ts", "asinfo", "tr_metrics", "event_metrics", "debug", "summary")
+
     def __init__(
             self,
             # core fields
@@ -110,6 +114,8 @@ class Event:
             self.debug = debug
 
         self.summary = EventSummary(self)
+        for pfx_event in self.pfx_events:
+            self.summary.add_pfx_event(pfx_event)
 
     def add_pfx_event(self, pfx_event):
         """
@@ -123,8 +129,9 @@ class Event:
                                   "event_type": self.event_type,
                                   "view_ts": self.view_ts,
                               })))
-        # update summary stats
         self.pfx_events.append(pfx_event)
+        # the summary stats are updated incrementally
+        self.summary.add_pfx_event(pfx_event)
 
     def set_pfx_events(self, pfx_events):
         """
@@ -168,9 +175,9 @@ class Event:
             "last_modified_ts": self.last_modified_ts,
 
             # metrics and summary
-            "tr_metrics": to_dict(self.tr_metrics),
-            "event_metrics": to_dict(self.event_metrics),
-            "summary": to_dict(self.summary),
+            "tr_metrics": self.tr_metrics.as_dict(),
+            "event_metrics": self.event_metrics.as_dict(),
+            "summary": self.summary.as_dict(),
             "duration": duration,
 
             "asinfo": self.asinfo,
@@ -235,12 +242,23 @@ class Event:
         event.summary.update()
         return event
 
-    def as_json(self):
+    def as_json(self, compact=False):
         """
         Convert the Event object to a single-line JSON string.
+
+        :param compact: produce compact JSON (see serialization.dumps_compact), e.g. for ElasticSearch requests
         """
         d = self.as_dict()
-        return json.dumps(d)
+        if compact:
+            return serialization.dumps_compact(d)
+        return serialization.dumps(d)
+
+    @staticmethod
+    def from_json(value):
+        """
+        Extract a Event object from a JSON string.
+        """
+        return Event.from_dict(serialization.loads(value))
 
     def has_inference(self, inference_id: str):
         """
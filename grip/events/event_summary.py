@@ -30,6 +30,9 @@
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
+import logging
+from collections import Counter
+
 import grip.inference
 from grip.tagger.tags.tag import Tag
 
@@ -46,8 +49,20 @@ class EventSummary:
     - newcomers
     - tags: names of the tags, values and other properties are ignored for briviety. see pfx event for detailed tags
     - inference_result (inferences, primary_inference)
+
+    The summary is maintained incrementally: prefix events register with the summary when they are added to the event,
+    and notify it when their tags, inferences or traceroute worthiness change. update() then only processes the prefix
+    events added or modified since the previous call, and inferences are reference-counted so that removing one from a
+    prefix event does not require re-scanning the others. Changes that can shrink the summary (the origins of a
+    prefix event, or a prefix event no longer traceroute worthy) make update() recompute the affected fields from all
+    the prefix events. update(verify=True) also rebuilds the summary from all the
+    prefix events and logs any difference with the incremental state.
     """
 
+    __slots__ = ("_event", "prefixes", "ases", "newcomers", "tags", "tr_worthy", "inference_result", "attackers",
+                 "victims", "_new", "_changed", "_inference_cnt", "_stale_details",
+                 "_stale_tr_worthy")
+
     def __init__(self, event):
         # NOTE: _event will not be exported
         self._event = event
@@ -61,10 +76,67 @@ class EventSummary:
         self.attackers = set()
         self.victims = set()
 
+        # prefix events not summarized yet, and summarized prefix events modified since, by object id
+        self._new = {}
+        self._changed = {}
+        # number of prefix events carrying each inference
+        self._inference_cnt = Counter()
+        # set when the details of summarized prefix events changed, the fields derived from them must be recomputed
+        self._stale_details = False
+        # set when the traceroute worthiness of summarized prefix events changed
+        self._stale_tr_worthy = False
+
+    def add_pfx_event(self, pfx_event):
+        """
+        Register a prefix event added to the event, it is summarized by the next update call.
+        """
+        pfx_event._summary = self
+        self._new[id(pfx_event)] = pfx_event
+        if pfx_event.has_inferences():
+            self._inference_cnt.update(pfx_event.inferences)
+
+    def pfx_event_changed(self, pfx_event, details_changed=False, tr_worthy_changed=False):
+        """
+        Notify that the tags, traceroute worthiness or details of a prefix event of the event changed.
+
+        :param pfx_event: the modified prefix event
+        :param details_changed: whether the origins of the prefix event changed (e.g. previous origins set by taggers)
+        :param tr_worthy_changed: whether the traceroute worthiness of the prefix event was set
+        """
+        key = id(pfx_event)
+        if key in self._new:
+            # not summarized yet
+            return
+        self._changed[key] = pfx_event
+        if details_changed:
+            self._stale_details = True
+        if tr_worthy_changed:
+            self._stale_tr_worthy = True
+
+    def inferences_added(self, inferences):
+        """
+        Notify that inferences were added to a prefix event of the event.
+
+        :param inferences: inferences the prefix event did not have before
+        """
+        self._inference_cnt.update(inferences)
+
+    def inferences_removed(self, inferences):
+        """
+        Notify that inferences were removed from a prefix event of the event.
+
+        :param inferences: inferences the prefix event had before
+        """
+        for inference in inferences:
+            self._inference_cnt[inference] -= 1
+            if self._inference_cnt[inference] <= 0:
+                del self._inference_cnt[inference]
+
     def clear_inference(self):
         self.inference_result = None
         for pfx_event in self._event.pfx_events:
-            pfx_event.inferences = set()
+            pfx_event.inferences = None
+        self._inference_cnt.clear()
 
     def as_dict(self):
         return {
@@ -78,23 +150,94 @@ class EventSummary:
             "victims": list(self.victims),
         }
 
-    def update(self):
+    def update(self, verify=False):
         """
         Generate a summary for the event
+
+        :param verify: rebuild the summary from all prefix events and log differences with the incremental summary
         """
         assert self._event is not None
 
-        inference_set = set()
+        modified = list(self._new.values()) + list(self._changed.values())
+        if self._stale_details:
+            # origins may have been removed from the summarized prefix events, summarize all of them again
+            self.prefixes = set()
+            self.ases = set()
+            self.newcomers = set()
+            self.tags = set()
+            self.tr_worthy = False
+            for pfx_event in self._event.pfx_events:
+                self._summarize(pfx_event)
+            self.attackers, self.victims = self._extract_attackers_victims(self._event.pfx_events)
+        else:
+            for pfx_event in modified:
+                self._summarize(pfx_event)
+            if self._stale_tr_worthy:
+                self.tr_worthy = any(pfx_event.traceroutes["worthy"] for pfx_event in self._event.pfx_events)
+            attackers, victims = self._extract_attackers_victims(modified)
+            self.attackers.update(attackers)
+            self.victims.update(victims)
+        self._new.clear()
+        self._changed.clear()
+        self._stale_details = False
+        self._stale_tr_worthy = False
+
+        self.inference_result = grip.inference.InferenceResult(inferences=set(self._inference_cnt))
+
+        if verify:
+            self.verify()
+
+    def rebuild(self):
+        """
+        Regenerate the summary from all the prefix events of the event.
+        """
+        assert self._event is not None
+
+        self.prefixes = set()
+        self.ases = set()
+        self.newcomers = set()
+        self.tags = set()
+        self.tr_worthy = False
+        self._inference_cnt = Counter()
         for pfx_event in self._event.pfx_events:
-            self.ases.update(pfx_event.details.get_current_origins())
-            self.tags.update(pfx_event.tags)
-            self.newcomers.update(pfx_event.details.get_new_origins())
-            self.prefixes.update(pfx_event.details.get_prefixes())
-            self.tr_worthy = self.tr_worthy | pfx_event.traceroutes["worthy"]
-            inference_set.update(pfx_event.inferences)
+            self._summarize(pfx_event)
+            if pfx_event.has_inferences():
+                self._inference_cnt.update(pfx_event.inferences)
+        self.attackers, self.victims = self._extract_attackers_victims(self._event.pfx_events)
+        self._new.clear()
+        self._changed.clear()
+        self._stale_details = False
+        self._stale_tr_worthy = False
+        self.inference_result = grip.inference.InferenceResult(inferences=set(self._inference_cnt))
+
+    def verify(self):
+        """
+        Compare the summary against a full rebuild, and keep the rebuilt summary if they differ.
+
+        :return: names of the fields that differed
+        """
+        fields = ("prefixes", "ases", "newcomers", "tags", "tr_worthy", "attackers", "victims")
+        incremental = {field: getattr(self, field) for field in fields}
+        incremental_inferences = set(self._inference_cnt)
+        self.rebuild()
 
-        self.attackers, self.victims = self._extract_attackers_victims()
-        self.inference_result = grip.inference.InferenceResult(inferences=inference_set)
+        mismatches = [field for field in fields if incremental[field] != getattr(self, field)]
+        if incremental_inferences != set(self._inference_cnt):
+            mismatches.append("inference_result")
+        if mismatches:
+            logging.error("incremental summary of event {} differs from rebuilt summary: {}".format(
+                self._event.event_id, ", ".join(mismatches)))
+        return mismatches
+
+    def _summarize(self, pfx_event):
+        """
+        Add a prefix event's origins, prefixes, tags and traceroute worthiness to the summary.
+        """
+        self.ases.update(pfx_event.details.get_current_origins())
+        self.tags.update(pfx_event.tags)
+        self.newcomers.update(pfx_event.details.get_new_origins())
+        self.prefixes.update(pfx_event.details.get_prefixes())
+        self.tr_worthy = self.tr_worthy | pfx_event.traceroutes["worthy"]
 
     def has_tag(self, tag: Tag, match_name_only=True):
         """
@@ -105,16 +248,17 @@ class EventSummary:
         else:
             return tag in self.tags
 
-    def _extract_attackers_victims(self):
+    @staticmethod
+    def _extract_attackers_victims(pfx_events):
         """
-        Infer the attackers and victims for an Event
+        Infer the attackers and victims for the given prefix events
         :return:
         """
 
         attackers = set()
         victims = set()
 
-        for pfx_event in self._event.pfx_events:
+        for pfx_event in pfx_events:
             a, v = pfx_event.details.extract_attackers_victims()
             attackers.update(a)
             victims.update(v)
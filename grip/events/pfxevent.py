@@ -53,8 +53,14 @@ DETAILS_DICT = {
 class PfxEvent:
     """
     Prefix-event class.
+
+    A view can have hundreds of thousands of prefix events, so the class uses __slots__, and the extra and inferences
+    fields, empty for most prefix events, are only created when first accessed.
     """
 
+    __slots__ = ("event_type", "position", "view_ts", "finished_ts", "details", "traceroutes", "tags",
+                 "_extra", "_inferences", "_summary")
+
     def __init__(
             self,
             # basic info, also contained in event object
@@ -77,12 +83,10 @@ class PfxEvent:
                 "worthy_tags": [],
                 "msms": [],
             }
-        if extra is None:
-            extra = {}
         if tags is None:
             tags = set()
         if inferences is None:
-            inferences = set()
+            inferences = ()
 
         # convert from dict to objects if necessary
         if isinstance(details, dict):
@@ -109,7 +113,7 @@ class PfxEvent:
         assert event_type in ["moas", "submoas", "defcon", "edges"]
         assert isinstance(view_ts, int)
         assert isinstance(details, PfxEventDetails)
-        assert isinstance(extra, dict)
+        assert extra is None or isinstance(extra, dict)
         assert isinstance(tags, set)
         assert all([isinstance(item, AtlasMeasurement) for item in traceroutes["msms"]])
 
@@ -119,9 +123,42 @@ class PfxEvent:
         self.finished_ts = finished_ts
         self.details = details
         self.traceroutes = traceroutes
-        self.extra = extra
+        self._extra = extra if extra else None
         self.tags = tags
-        self.inferences = set(inferences)
+        self._inferences = set(inferences) if inferences else None
+        # summary of the event this prefix event belongs to, notified of changes (see EventSummary)
+        self._summary = None
+
+    @property
+    def extra(self):
+        if self._extra is None:
+            self._extra = {}
+        return self._extra
+
+    @extra.setter
+    def extra(self, extra):
+        self._extra = extra
+
+    @property
+    def inferences(self):
+        if self._inferences is None:
+            self._inferences = set()
+        return self._inferences
+
+    @inferences.setter
+    def inferences(self, inferences):
+        if self._summary is not None:
+            if self._inferences:
+                self._summary.inferences_removed(self._inferences)
+            if inferences:
+                self._summary.inferences_added(inferences)
+        self._inferences = inferences
+
+    def has_inferences(self):
+        """
+        Check whether the prefix event has any inferences, without creating the inferences set
+        """
+        return bool(self._inferences)
 
     def __repr__(self):
         return json.dumps(self.as_dict())
@@ -166,8 +203,8 @@ class PfxEvent:
             "attackers": list(attackers),
             "victims": list(victims),
             "tags": [t.as_dict() for t in self.tags],
-            "inferences": [i.as_dict() for i in self.inferences],
-            "extra": self.extra,
+            "inferences": [i.as_dict() for i in self._inferences] if self._inferences else [],
+            "extra": self._extra if self._extra is not None else {},
         }
         return d
 
@@ -191,6 +228,21 @@ class PfxEvent:
         if any(not isinstance(tag, Tag) for tag in tags):
             tags = {tagshelper.parse_tag(tag) for tag in tags}
         self.tags.update(tags)
+        if self._summary is not None:
+            self._summary.pfx_event_changed(self)
+
+    def set_tr_worthy(self, worthy, worthy_tags=None):
+        """
+        Set the traceroute-worthiness of the prefix event
+
+        :param worthy: whether the prefix event is worth traceroutes
+        :param worthy_tags: the tags that made the prefix event traceroute-worthy
+        """
+        self.traceroutes["worthy"] = worthy
+        if worthy_tags is not None:
+            self.traceroutes["worthy_tags"] = worthy_tags
+        if self._summary is not None:
+            self._summary.pfx_event_changed(self, tr_worthy_changed=True)
 
     def has_tag(self, tag):
         """
@@ -208,12 +260,18 @@ class PfxEvent:
         """
         if not inferences:
             return
-        self.inferences.update(set(inferences))
+        new_inferences = set(inferences) - self.inferences
+        self.inferences.update(new_inferences)
+        if self._summary is not None and new_inferences:
+            self._summary.inferences_added(new_inferences)
 
     def remove_inferences(self, inferences):
         """
         Add the given set of inferences into the current prefix event
         """
-        if not inferences:
+        if not inferences or not self._inferences:
             return
-        self.inferences -= set(inferences)
+        removed = self._inferences & set(inferences)
+        self._inferences -= removed
+        if self._summary is not None and removed:
+            self._summary.inferences_removed(removed)
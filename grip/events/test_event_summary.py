@@ -0,0 +1,133 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+from unittest import TestCase, mock
+
+from grip.events.details_moas import MoasDetails
+from grip.events.event import Event
+from grip.events.event_summary import EventSummary
+from grip.events.pfxevent import PfxEvent
+from grip.inference.inference import Inference
+from grip.tagger.tags import tagshelper
+
+VIEW_TS = 1577836800
+
+
+def build_pfx_event(i):
+    details = MoasDetails(prefix="10.0.{}.0/24".format(i), origins_set={100, 200 + i}, aspaths=[])
+    return PfxEvent(event_type="moas", position="NEW", view_ts=VIEW_TS, details=details)
+
+
+class TestEventSummary(TestCase):
+
+    def setUp(self):
+        self.event = Event(event_type="moas", position="NEW", event_id="moas-{}-100".format(VIEW_TS),
+                           view_ts=VIEW_TS)
+        for i in range(10):
+            self.event.add_pfx_event(build_pfx_event(i))
+        self.summary = self.event.summary
+        self.summary.update()
+
+    def test_incremental_update(self):
+        self.assertEqual({100} | {200 + i for i in range(10)}, self.summary.ases)
+        self.assertEqual(10, len(self.summary.prefixes))
+
+        # only the modified prefix events are summarized again
+        pfx_event = self.event.pfx_events[3]
+        pfx_event.add_tags([tagshelper.get_tag("all-newcomers")])
+        pfx_event.set_tr_worthy(True, ["all-newcomers"])
+        self.event.add_pfx_event(build_pfx_event(10))
+        with mock.patch.object(EventSummary, "_summarize", autospec=True,
+                               side_effect=EventSummary._summarize) as summarize:
+            self.summary.update()
+        self.assertEqual(2, summarize.call_count)
+        self.assertTrue(self.summary.tr_worthy)
+        self.assertTrue(self.summary.has_tag(tagshelper.get_tag("all-newcomers")))
+        self.assertIn(210, self.summary.ases)
+        self.assertEqual([], self.summary.verify())
+
+    def test_inferences(self):
+        inference_a = Inference(inference_id="a", confidence=10)
+        inference_b = Inference(inference_id="b", confidence=20)
+        self.event.pfx_events[0].add_inferences([inference_a, inference_b])
+        self.event.pfx_events[1].add_inferences([inference_a])
+        self.summary.update()
+        self.assertEqual([inference_b, inference_a], self.summary.inference_result.inferences)
+
+        # an inference is dropped once no prefix event carries it any more
+        self.event.pfx_events[0].remove_inferences({inference_a})
+        self.summary.update()
+        self.assertEqual([inference_b, inference_a], self.summary.inference_result.inferences)
+        self.event.pfx_events[1].inferences = None
+        self.summary.update()
+        self.assertEqual([inference_b], self.summary.inference_result.inferences)
+        self.assertEqual([], self.summary.verify())
+
+        self.summary.clear_inference()
+        self.summary.update()
+        self.assertEqual([], self.summary.inference_result.inferences)
+
+    def test_details_changed(self):
+        # previous origins are set by the taggers once the prefix events are added to the event
+        for pfx_event in self.event.pfx_events:
+            pfx_event.details.set_old_origins({100})
+            self.summary.pfx_event_changed(pfx_event, details_changed=True)
+        self.summary.update()
+        self.assertEqual({100}, self.summary.victims)
+        self.assertEqual({200 + i for i in range(10)}, self.summary.attackers)
+        # the origins that were already there are no longer newcomers
+        self.assertEqual({200 + i for i in range(10)}, self.summary.newcomers)
+        self.assertEqual([], self.summary.verify())
+
+    def test_tr_worthy_changed(self):
+        pfx_events = self.event.pfx_events
+        pfx_events[0].set_tr_worthy(True)
+        pfx_events[1].set_tr_worthy(True)
+        self.summary.update()
+        self.assertTrue(self.summary.tr_worthy)
+        pfx_events[0].set_tr_worthy(False)
+        self.summary.update()
+        self.assertTrue(self.summary.tr_worthy)
+        pfx_events[1].set_tr_worthy(False)
+        self.summary.update()
+        self.assertFalse(self.summary.tr_worthy)
+        self.assertEqual([], self.summary.verify())
+
+    def test_verify(self):
+        self.assertEqual([], self.summary.verify())
+        self.summary.ases.add(300)
+        self.summary.tr_worthy = True
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(["ases", "tr_worthy"], self.summary.verify())
+        # the rebuilt summary is kept
+        self.assertNotIn(300, self.summary.ases)
+        self.assertFalse(self.summary.tr_worthy)
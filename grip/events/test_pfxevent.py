@@ -29,11 +29,12 @@
 #  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
-
+import json
 from unittest import TestCase
 
 from grip.events.pfxevent import PfxEvent
 from grip.events.pfxevent_parser import PfxEventParser
+from grip.inference.inference import Inference
 from grip.tagger.tags import tagshelper
 
 EDGES_LINE = "1588205400|136620-8551|NEW|79.180.229.0/24|48571 8708 8551:31313 6830 6762 8551:56430 8708 8551:11039 6461 8551:6830 6762 8551:293 6939 8551:2914 6762 8551:19151 174 6762 8551:5769 6453 6762 8551:41095 8551:6079 3356 6762 8551:6939 8551:37468 8551:20080 6762 8551:51185 3356 6762 8551:393950 6939 8551:57695 3223 8551:52320 6461 8551:8220 1299 6762 8551:3257 6762 8551:6830 6762 8551:47692 8551:35369 8218 8551:47147 8551:8218 8551:6720 8447 8551:13237 8551:7195 3549 3356 6762 8551:42473 9002 8551:49515 174 6762 8551:6667 8551:9002 8551:20764 8551:24482 8551:13030 8551:19151 2914 6762 8551:51185 3356 6762 8551:9002 8551:24482 8551:9304 174 6762 8551:2497 2914 6762 8551:397143 3257 6762 8551:2497 2914 6762 8551:37697 8551:25152 6939 8551:3491 6762 8551:4777 2516 6762 8551:37497 8551:37239 8551:37640 8551:37468 8551:57695 35487 328383 327782 37100 8551:37271 8551:64271 8551:42473 8551:14630 6461 8551:8607 8551:2914 6762 8551:13030 8551:286 6762 8551:25160 8551:6908 2914 6762 8551:62167 8551:8896 8551:7489 8551:12779 8551:60501 8551:39122 8551:207044 8551:57695 8551:60945 8551:51185 8551:8218 8551:6894 8551:6908 2914 6762 8551:31742 8551:35266 8551:15605 8551:57111 6762 8551:5602 6762 8551:51185 8551:49605 8551:24482 8551:50877 8551:5396 6762 8551:5392 3356 6762 8551:12779 8551:12637 3257 6762 8551:20811 8551:41327 8551:20912 3257 6762 8551:8660 1267 8551:14907 1299 6762 8551:25227 9002 8551:18106 8551:9002 8551:20764 8551:24482 8551:42275 25091 8551:49434 35280 8551:35600 30781 8551:34019 8551:41157 29075 8551:50628 3356 6762 8551:2914 6762 8551:63956 3491 6762 8551:41722 20764 8551:28917 8551:39821 9002 8551:14061 6453 6762 8551:19151 174 6762 8551:51873 6939 8551:7575 6762 8551:34019 8551:49605 8551:14907 6461 8551:58308 29075 8551:53070 2914 6762 8551:28634 37468 8551:28634 37468 8551:13786 8551:64271 262287 16735 3356 6762 8551:24482 8551:41095 8551 64635:196621 8758 8551:8218 8551:198385 8551:8218 8551:198290 6661 8551:51405 206610 6661 8551:204355 174 6762 8551:15547 8551:58308 29075 8551:12779 8551:59689 30781 8551:20766 8551:29075 8551:24482 8551:2613 6893 6730 8551:57199 35280 8551:34177 8551:16347 8551:8426 8551:205344 3356 6762 8551:8218 8551:2895 8732 8551:51907 8551:25091 8551:29479 9002 8551:20612 9044 8551:25091 8551:20612 9044 8551:39533 6762 8551:58299 6939 8551:56665 8551:1916 2914 6762 8551:22548 6939 8551:16735 3356 6762 8551:23106 28329 6762 8551:52863 3356 6762 8551:28186 8551:57695 262287 16735 3356 6762 8551:52873 8551:267613 8551:28260 26615 6762 8551:263152 28329 6762 8551:262757 4230 6762 8551:28186 8551:59891 136620 8551:15547 8551:31424 13030 8551:58057 3303 8551:62167 8551:24482 8551:51786 15623 43531 8551:21232 13030 8551:47147 8551:8758 8551:202194 198385 8551:12307 29691 13030 8551:29691 13030 8551:59414 13030 8551:25091 8551:24516 1299 6762 8551:14061 4637 8551:205206 1299 6762 8551:3280 8551:513 21320 8551:29222 3303 8551:29680 8220 8551:43578 1299 6762 8551:24482 8551:6939 8551:6082 2914 6762 8551:20932 8551:12350 174 6762 8551:2497 2914 6762 8551:7575 6762 8551:27446 27446 6939 8551:37497 8551:8220 6453 6762 8551:328145 8551:3491 6762 8551:137831 4657 8551:37468 8551:58511 8551:17639 8551:15547 8551:32354 174 6762 8551:34019 8551:47692 8551:25091 8551:14061 6453 6762 8551:26073 6939 8551:6939 8551:36351 8551:14361 3257 6762 8551:19151 174 6762 8551:4181 1299 6762 8551:61955 8551:51088 6453 6762 8551:39120 3356 6762 8551:1103 8551:293 6939 8551:6830 6762 8551:267613 8551:5394 8551:12859 8551:64475 8551:13030 8551:6939 8551:28329 6762 8551:2497 2914 6762 8551:19653 6461 8551:395570 6939 8551:293 6939 8551:53828 2914 6762 8551:32709 6939 8551:19151 2914 6762 8551:19016 3257 6762 8551:14630 3356 6762 8551:852 3356 6762 8551:14630 3356 6762 8551:47692 8551:51088 6453 6762 8551:34019 8551:50673 9002 8551:64271 3214 3356 6762 8551:42541 3356 6762 8551:209650 209844 56381 205614 8551:30132 20562 8551:15435 3257 6762 8551:12859 8551:1103 8551:6423 6461 8551:53828 2914 6762 8551:15008 40805 6939 8551:3491 6762 8551:58511 8551:55222 6939 8551:19653 6461 8551:38001 3491 6762 8551:23367 6461 8551:39120 8551:39120 8551:39120 8551:3402 3356 6762 8551:29479 9002 8551:39351 8551:3257 6762 8551:3561 209 3356 6762 8551:3292 6762 8551:6939 8551:42541 3356 6762 8551:23367 6461 8551:45352 8551:61568 6762 8551:14840 8551:46450 2914 6762 8551:63927 8551:286 6762 8551:5650 3356 6762 8551:209 3356 6762 8551:209 3356 6762 8551:209 3356 6762 8551:40387 23473 6939 8551:40630 6939 8551:202365 50673 9002 8551:5645 1299 6762 8551:52320 6461 8551:61832 2914 6762 8551:1916 2914 6762 8551:262757 4230 6762 8551:52863 3356 6762 8551:28571 1916 2914 6762 8551:58511 8551:7500 2516 6762 8551:27678 27986 6762 8551:1798 6461 8551:20953 174 6762 8551:39591 174 6762 8551:58511 8551:34968 8455 8551:12779 8551:1103 8551:31019 8551:19151 2914 6762 8551:8218 8551:29686 8551:24961 8551:553 8551:6762 8551:680 1299 1299 6762 8551:57695 8551:6908 2914 6762 8551:2914 6762 8551:48919 8551:34288 8551:20811 8551:25220 8551:29140 8551:8222 8551:60501 8551:47147 8551:206356 8551:58057 8551:49697 8551:47950 8551:34927 8551:39533 6453 6762 8551:7713 8551:7713 8551:137831 4657 8551:3491 6762 8551:63956 3491 6762 8551:18106 8551:58511 8551:38726 6939 8551:45177 4637 8551:58511 8551:2497 2914 6762 8551:1280 6762 8551:6762 8551:6908 2914 6762 8551:6453 6762 8551:14907 6762 8551:8218 8551:29467 8551:59605 8551:8283 6762 8551:8455 8551:199938 8551:47147 8551:60501 8551:204708 20766 8551:58511 8551:58511 8551:58511 8551:58511 8551:24482 8551:4739 7545 6939 8551:3267 2603 8551:39120 3356 6762 8551:39120 8551:19754 1299 6762 8551:1299 6762 8551:34288 8551:133950 9790 4826 15412 8551:38726 9957 4766 6762 8551:36236 8551:2914 6762 8551:2518 6453 6762 8551:63956 1299 6762 8551:42541 3356 6762 8551:61568 6762 8551:59469 1299 6762 8551:38883 6939 8551:56665 8551:204028 6830 6762 8551:1351 6939 8551:38880 8551:7575 6762 8551:58511 8551:3491 6762 8551:24516 1299 6762 8551:4826 15412 8551:38880 8551:6939 8551:34224 8551:53767 3257 6762 8551:54728 20130 6939 8551:18106 8551:49788 12552 8551:3277 3267 2603 8551:3130 2914 6762 8551:20912 3257 6762 8551:23673 3491 6762 8551:852 3356 6762 8551:3130 2914 6762 8551:2914 6762 8551:8492 8551:31019 8551:24441 3491 3491 6762 8551:1239 6762 8551:57866 6762 8551:57463 8551:3257 6762 8551:7018 6762 8551:22652 6453 6762 8551:3741 8551:1403 6461 8551:1299 6762 8551:286 6762 8551:2152 3356 6762 8551:293 6939 8551:1403 6461 8551:701 6762 8551:11686 6939 8551:6939 8551:3549 3356 6762 8551:3549 3356 6762 8551:2497 2914 6762 8551:3561 209 3356 6762 8551:1221 4637 8551:3303 8551:5413 8551:37100 8551:7660 2516 6762 8551:"
@@ -42,6 +43,18 @@ SUBMOAS_LINE = "1588205400|202.45.96.0/19|202.45.108.182/32|NEW|4802|4739|42473
 DEFCON_LINE = "1588205400|190.61.128.0/17|190.61.250.0/24|NEW|18747|18747|47692 3356 174 18747:35369 2914 174 18747:25227 57724 20485 174 18747:29680 174 18747:9002 3257 18747 18747:43578 1299 174 18747:47147 1299 174 18747:8218 6461 174 18747:6720 1853 1764 174 18747:13237 2914 174 18747:513 6830 6830 174 18747:20764 20485 174 18747:24482 174 18747:41722 20764 174 18747:28917 6762 52468 18747 18747 18747 18747 18747:39821 9002 3257 18747 18747:41095 3356 174 18747:2895 3267 174 18747:51907 31133 174 18747:42473 1299 174 18747:64271 62240 3257 18747 18747:29222 174 18747:20932 174 18747:42473 1299 174 18747:12350 174 18747:14630 6461 174 18747:49515 174 18747:29479 9002 3257 18747 18747:6667 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:25091 1299 1299 174 18747:9002 3257 18747 18747:8607 2914 174 18747:2914 174 18747:15547 174 18747:20764 174 18747:24482 174 18747:25091 1299 174 18747:13030 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:286 174 18747:25160 174 18747:6908 1239 174 18747:62167 174 18747:8896 174 18747:7489 62240 3257 18747 18747:12779 3257 18747 18747:60501 57264 174 18747:39122 174 18747:207044 3356 174 18747:57695 58313 25369 174 18747:60945 174 18747:51185 174 18747:8218 6461 174 18747:6894 174 18747:6908 1239 174 18747:31742 174 18747:35266 2914 174 18747:32354 174 18747:14061 2914 174 18747:26073 6939 52468 18747 18747 18747 18747 18747:42275 25091 2914 174 18747:49434 174 18747:35600 35625 174 18747:34019 200780 174 18747:7195 3549 3356 174 18747:41157 41157 41157 174 18747:50628 6453 174 18747:13030 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:58308 29075 174 18747:55222 6461 174 18747:8218 6461 174 18747:19653 174 18747:8218 6461 174 18747:38001 2914 174 18747:37497 174 18747:328145 37271 174 18747:3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:37468 174 18747:6939 52468 18747 18747 18747 18747 18747:6423 6461 174 18747:24516 1299 174 18747:198290 174 18747:19151 52468 18747 18747 18747 18747 18747:51405 206610 1299 174 18747:51185 174 18747:204355 174 18747:9002 3257 18747 18747:15547 174 18747:24482 174 18747:58308 29075 174 18747:9304 174 18747:12779 3257 18747 18747:2497 3257 18747 18747:59689 30781 3356 174 18747:20766 6453 174 18747:29075 174 18747:24482 174 18747:2613 6893 25091 1299 174 18747:57199 35280 3356 174 18747:34177 3356 174 18747:16347 3356 174 18747:8426 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:39533 6762 52468 18747 18747 18747 18747 18747:6082 2914 174 18747:56665 174 18747:27446 27446 174 18747:25091 2914 174 18747:4181 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:23367 6461 174 18747:4739 7545 1299 174 18747:7575 6762 52468 18747 18747 18747 18747 18747:58511 1299 174 18747:3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:24516 1299 174 18747:4826 174 18747:39120 174 18747:397143 3257 18747 18747:14061 2914 174 18747:24482 174 18747:8220 6453 174 18747:137831 1299 174 18747:58511 1299 174 18747:17639 174 18747:7713 3257 18747 18747:7713 3257 18747 18747:137831 1299 174 18747:3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:63956 1299 174 18747:18106 174 18747:2497 3257 18747 18747:53828 2914 174 18747:15008 174 18747:7500 2516 3257 18747 18747:39120 174 18747:39120 174 18747:3402 174 18747:29479 9002 3257 18747 18747:39351 174 18747:3257 18747 18747:3561 209 3356 174 18747:3292 3257 18747 18747:1798 174 18747:6939 52468 18747 18747 18747 18747 18747:42541 174 18747:23367 6461 174 18747:45352 174 18747:61568 37468 174 18747:14840 3356 174 18747:46450 2914 174 18747:63927 1299 174 18747:286 174 18747:3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:19151 52468 18747 18747 18747 18747 18747:11039 4901 11164 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:6830 174 18747:293 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:37497 174 18747:3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:37239 37468 174 18747:37640 37468 174 18747:37468 174 18747:57695 35487 328383 327782 37100 174 18747:37271 174 18747:37697 37497 174 18747:5650 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:209 3356 174 18747:209 3356 174 18747:209 3356 174 18747:40387 11164 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:40630 2914 174 18747:202365 50673 174 18747:5645 1299 174 18747:2914 174 18747:20080 52468 18747 18747 18747 18747 18747:51185 174 18747:393950 6939 52468 18747 18747 18747 18747 18747:52320 52468 18747 18747 18747 18747 18747:19151 52468 18747 18747 18747 18747 18747:5769 174 18747:41095 3356 174 18747:6079 1299 174 18747:6939 52468 18747 18747 18747 18747 18747:58511 1299 174 18747:37468 174 18747:57695 3223 2914 174 18747:8220 1299 174 18747:3257 18747 18747:6830 174 18747:48571 6830 174 18747:31313 174 18747:56430 12310 174 18747:15605 41327 1299 174 18747:57111 174 18747:5602 1299 174 18747:2497 3257 18747 18747:25152 2914 174 18747:4777 2516 3257 18747 18747:51185 6762 52468 18747 18747 18747 18747 18747:49605 174 18747:24482 174 18747:50877 174 18747:5396 3257 18747 18747:5392 3356 174 18747:12779 3257 18747 18747:12637 3257 18747 18747:20811 3356 174 18747:41327 3257 18747 18747:14907 1299 174 18747:18106 174 18747:63956 1299 174 18747:20912 174 18747:2914 174 18747:205206 1299 174 18747:51873 6830 174 18747:34019 3303 174 18747:47692 3356 174 18747:64475 50629 174 18747:34019 3303 174 18747:14061 2914 174 18747:3280 43376 174 18747:47692 3356 174 18747:49605 174 18747:19151 52468 18747 18747 18747 18747 18747:7575 6762 52468 18747 18747 18747 18747 18747:196621 15576 174 18747:14907 2914 174 18747:198385 174 18747:2497 3257 18747 18747:8218 6461 174 18747:1280 5511 52468 18747 18747 18747 18747 18747:25091 1299 174 18747:51088 3257 18747 18747:6762 52468 18747 18747 18747 18747 18747:2497 3257 18747 18747:7575 6762 52468 18747 18747 18747 18747 18747:6939 52468 18747 18747 18747 18747 18747:36351 52468 18747 18747 18747 18747 18747:61955 174 18747:14361 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:53070 2914 174 18747:51088 3257 18747 18747:19151 52468 18747 18747 18747 18747 18747:39120 174 18747:19653 174 18747:28634 37468 174 18747:28634 37468 174 18747:395570 40028 1299 174 18747:13786 12956 174 18747:293 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:64271 262287 6762 52468 18747 18747 18747 18747 18747:53828 2914 174 18747:32709 32703 174 18747:19151 52468 18747 18747 18747 18747 18747:14630 3356 174 18747:852 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:14630 1299 174 18747:24482 174 18747:34019 200780 174 18747:50673 174 18747:1916 52468 18747 18747 18747 18747 18747:64271 3214 3257 18747 18747:22548 3549 3356 174 18747:42541 174 18747:20612 1836 174 18747:209650 209844 56381 3257 18747 18747:30132 6762 52468 18747 18747 18747 18747 18747:20612 1836 174 18747:24875 1299 174 18747:16735 52468 18747 18747 18747 18747 18747:58511 1299 174 18747:58511 1299 174 18747:38726 9304 15412 174 18747:45177 174 18747:58511 3257 18747 18747:58511 1299 174 18747:58511 1299 174 18747:58511 1299 174 18747:58511 3257 18747 18747:24482 174 18747:3267 174 18747:39120 174 18747:39120 174 18747:19754 1299 174 18747:1299 174 18747:34288 174 18747:133950 9790 4826 174 18747:38726 9957 174 18747:36236 174 18747:2914 174 18747:2518 174 18747:63956 1299 174 18747:42541 174 18747:61568 37468 174 18747:59469 1299 174 18747:38883 4826 174 18747:56665 174 18747:204028 6830 174 18747:1351 6939 52468 18747 18747 18747 18747 18747:13030 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:6939 52468 18747 18747 18747 18747 18747:52320 52468 18747 18747 18747 18747 18747:61832 2914 174 18747:23106 174 18747:52863 3356 174 18747:28186 174 18747:1103 2603 6762 52468 18747 18747 18747 18747 18747:34224 6453 174 18747:293 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:53767 3257 18747 18747:6830 174 18747:54728 20130 23352 3257 18747 18747:267613 174 18747:18106 174 18747:5394 3257 18747 18747:49788 174 18747:12859 2914 174 18747:3277 3267 174 18747:1140 24785 1299 174 18747:57695 262287 6762 52468 18747 18747 18747 18747 18747:20953 174 18747:39591 174 18747:58511 3257 18747 18747:34968 8455 1299 174 18747:52873 12956 174 18747:3130 1239 174 18747:20912 174 18747:23673 174 18747:852 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:3130 2914 174 18747:2914 174 18747:8492 20764 174 18747:267613 174 18747:28260 12956 174 18747:263152 28329 3356 174 18747:262757 4230 174 18747:28186 174 18747:31019 39326 1299 174 18747:58299 174 18747:59891 51395 1299 174 18747:15547 174 18747:31424 3257 18747 18747:58057 174 18747:62167 174 18747:24482 174 18747:51786 15623 174 18747:8218 6461 174 18747:29686 6453 174 18747:21232 15576 174 18747:24961 3356 174 18747:553 174 18747:47147 1299 174 18747:6762 52468 18747 18747 18747 18747 18747:680 1299 1299 174 18747:8758 174 18747:12779 3257 18747 18747:1103 2603 6762 52468 18747 18747 18747 18747 18747:50763 8943 1299 174 18747:24875 1299 174 18747:31019 39326 1299 174 18747:202194 198385 174 18747:12307 29691 6830 174 18747:29691 6830 174 18747:59414 6830 174 18747:8660 1267 3356 174 18747:57695 3223 2914 174 18747:6908 1239 174 18747:2914 174 18747:48919 174 18747:34288 174 18747:20811 3356 174 18747:25220 2914 174 18747:29140 174 174 18747:8222 1299 174 18747:60501 57264 174 18747:47147 1299 174 18747:206356 50629 174 18747:58057 39533 6453 174 18747:49697 39912 1299 174 18747:47950 1299 174 18747:34927 58299 174 18747:39533 6453 174 18747:15435 174 18747:12859 2914 174 18747:1103 2603 6762 52468 18747 18747 18747 18747 18747:1140 24785 1299 174 18747:6908 1239 174 18747:6453 174 18747:14907 38930 174 18747:8218 6461 174 18747:29467 2914 174 18747:59605 174 18747:50763 8943 1299 174 18747:8283 38930 174 18747:8455 1299 174 18747:199938 201709 8881 174 18747:47147 1299 174 18747:60501 57264 174 18747:24441 1299 1299 1299 174 18747:1239 174 18747:57866 2914 174 18747:3257 18747 18747:7018 174 18747:22652 174 18747:3741 174 18747:1403 174 18747:1299 174 18747:286 174 18747:2152 11164 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:293 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:1403 174 18747:701 174 18747:11686 52468 18747 18747 18747 18747 18747:6939 52468 18747 18747 18747 18747 18747:3549 3356 174 18747:3549 3356 174 18747:2497 3257 18747 18747:3561 209 3356 174 18747:1221 4637 3257 18747 18747:3303 174 18747:5413 3491 52468 52468 52468 52468 18747 18747 18747 18747 18747:37100 174 18747:7660 2516 3257 18747 18747:28329 3356 174 18747:1916 52468 18747 18747 18747 18747 18747:262757 4230 174 18747:52863 3356 174 18747:28571 1916 52468 18747 18747 18747 18747 18747:6939 52468 18747 18747 18747 18747 18747:27678 18747:205344 3356 174 18747:57463 6762 52468 18747 18747 18747 18747 18747:204708 20766 6453 174 18747|27678 18747"
 
 
+def canonical(obj):
+    """sort lists of plain values, i.e. serialized sets, to compare dicts regardless of set order"""
+    if isinstance(obj, dict):
+        return {key: canonical(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        items = [canonical(item) for item in obj]
+        if all(isinstance(item, (str, int)) for item in items):
+            return sorted(items, key=str)
+        return items
+    return obj
+
+
 class TestPfxEvent(TestCase):
     def setUp(self):
         parsers = {
@@ -167,3 +180,24 @@ class TestPfxEvent(TestCase):
         self.moas_pfx_event = PfxEventParser("moas").parse_line(MOAS_LINE)
         self.moas_pfx_event.add_tags([tag.name for tag in tags_set])
         self.assertEqual(self.moas_pfx_event.tags, tags_set)
+
+    def assertRoundTrip(self, pfx_event):
+        d = pfx_event.as_dict()
+        loaded = PfxEvent.from_dict(json.loads(json.dumps(d))).as_dict()
+        # origin sets may be listed in a different order once reloaded
+        self.assertEqual(json.dumps(canonical(d)), json.dumps(canonical(loaded)))
+
+    def test_round_trip(self):
+        for pfx_event in [self.moas_pfx_event, self.submoas_pfx_event, self.defcon_pfx_event, self.edges_pfx_event]:
+            self.assertFalse(hasattr(pfx_event, "__dict__"))
+            self.assertFalse(hasattr(pfx_event.details, "__dict__"))
+            self.assertRoundTrip(pfx_event)
+
+        # extra and inferences are created lazily
+        self.assertFalse(self.moas_pfx_event.has_inferences())
+        self.moas_pfx_event.extra["key"] = "value"
+        self.moas_pfx_event.add_inferences({Inference(inference_id="test")})
+        self.assertTrue(self.moas_pfx_event.has_inferences())
+        d = self.moas_pfx_event.as_dict()
+        self.assertEqual({"key": "value"}, d["extra"])
+        self.assertRoundTrip(self.moas_pfx_event)
@@ -58,6 +58,8 @@ class Inference:
     (90, 20) > (90,10) # same confidence, higher suspicion_level
     """
 
+    __slots__ = ("inference_id", "explanation", "suspicion_level", "confidence", "labels")
+
     def __init__(self,
                  inference_id, explanation="",
                  suspicion_level=-1, confidence=-1, labels=None):
@@ -42,6 +42,7 @@ from grip.inference import InferenceEngine
 from grip.utils.data.asrank import AsRankUtils
 from grip.utils.data.elastic import ElasticConn
 from grip.utils.data.hegemony import HegemonyUtils
+from grip.utils.data.hegemony_store import HegemonyStore
 from grip.utils.kafka import KafkaHelper
 from grip.utils.messages import EventOnElasticMsg
 
@@ -59,17 +60,18 @@ DEBUG = False
 
 class InferenceCollector:
 
-    def __init__(self, event_type=None, debug=False):
+    def __init__(self, event_type=None, debug=False, hegemony_db=None):
         self.event_type = event_type
         self.DEBUG = debug
 
         # ElasticSearch
         self.es_conn = ElasticConn()
+        self.es_bulk = self.es_conn.bulk_writer()
         self.kafka_helper = KafkaHelper()
         self.inference_engine = InferenceEngine()
 
         # External data sources
-        self.hegemony = HegemonyUtils()
+        self.hegemony = HegemonyUtils(store=HegemonyStore(hegemony_db) if hegemony_db else None)
         self.asrank = AsRankUtils()
 
     def _init_kafka_consumer(self, event_type):
@@ -141,8 +143,60 @@ class InferenceCollector:
         # log inference processing time
         event.event_metrics.proc_time_inference = time.time() - start_time
 
-    def listen(self):
-        """listen for traceroute request IDs from driver and retrieve results"""
+    def infer_messages(self, messages):
+        """
+        Conduct inference for a batch of event ready messages.
+
+        Events announced more than once in the batch are processed once. All events are retrieved with one multi-get
+        request and committed back with bulk requests.
+
+        :param messages: list of kafka messages
+        :return: False if some events could not be committed because of transient errors, True otherwise
+        """
+        event_ready_msgs = {}
+        for msg in messages:
+            if msg.error():
+                print(msg.error())
+                continue
+            event_ready_msg = EventOnElasticMsg.from_wire(msg.value())
+            logging.debug("received new event ready message: {}".format(event_ready_msg.to_str()))
+
+            if "v3" not in event_ready_msg.es_index:
+                logging.info("skipping inference for wrong index: {}".format(event_ready_msg.es_index))
+                continue
+            event_ready_msgs[event_ready_msg.es_id] = event_ready_msg
+
+        # events are always read back from ElasticSearch, rather than using the snapshots embedded in the messages:
+        # the whole event is written back, which would overwrite what other stages wrote after the snapshot was taken
+        events = {}
+        if event_ready_msgs:
+            events = self.es_conn.get_events_by_ids(event_ready_msgs.keys(),
+                                                    indices={es_id: msg.es_index
+                                                             for es_id, msg in event_ready_msgs.items()})
+
+        for es_id, event_ready_msg in event_ready_msgs.items():
+            event = events.get(es_id)
+            if event is None:
+                logging.warning(
+                    "Failed to retrieve event: {}/{}".format(event_ready_msg.es_index, event_ready_msg.es_id))
+                continue
+
+            # conduct inference, the event object will be updated by the function
+            self.infer_event(event)
+            self.es_bulk.add_event(event, index=event_ready_msg.es_index, update=True)
+
+        # commit updated events back to ES
+        failed = self.es_bulk.flush()
+        if failed:
+            logging.error("Failed to commit {} events after inference".format(len(failed)))
+        return not any(item.retriable for item in failed)
+
+    def listen(self, batch_size=1):
+        """
+        listen for traceroute request IDs from driver and retrieve results
+
+        :param batch_size: number of messages to process at once, kafka offsets are committed once per batch
+        """
         shutdown = {"count": 0}
 
         def _stop_handler(_signo, _stack_frame):
@@ -163,6 +217,18 @@ class InferenceCollector:
                 logging.info("Shutting down")
                 break
 
+            if batch_size > 1:
+                messages = self.kafka_helper.consume(batch_size, KAFKA_POOLING_INTERVAL)
+                if not messages:
+                    continue
+                if self.infer_messages(messages):
+                    self.kafka_helper.commit_offset()
+                else:
+                    # consume the batch again rather than committing offsets past events not yet committed to ES
+                    self.kafka_helper.rewind(messages)
+                    time.sleep(KAFKA_POOLING_INTERVAL)
+                continue
+
             # quickly polling all pending messages from kafka before processing results
             msg = self.kafka_helper.poll(KAFKA_POOLING_INTERVAL)
             if msg is None:
@@ -170,16 +236,15 @@ class InferenceCollector:
             if msg.error():
                 print(msg.error())
                 continue
-            msg_str = msg.value().decode("utf-8")
-            event_ready_msg = EventOnElasticMsg.from_str(msg_str)
-            logging.debug("received new event ready message: {}".format(msg_str))
+            event_ready_msg = EventOnElasticMsg.from_wire(msg.value())
+            logging.debug("received new event ready message: {}".format(event_ready_msg.to_str()))
 
             if "v3" not in event_ready_msg.es_index:
                 logging.info("skipping inference for wrong index: {}".format(event_ready_msg.es_index))
                 self.kafka_helper.commit_offset()
                 continue
 
-            # retrieve event object from ElasticSearch
+            # retrieve the event from ElasticSearch, the snapshot embedded in the message may be outdated
             event = self.es_conn.get_event_by_id(index=event_ready_msg.es_index, event_id=event_ready_msg.es_id)
             if event is None:
                 logging.warning(
@@ -204,6 +269,10 @@ def main():
                         help="Event type to listen for")
     parser.add_argument("-d", "--debug", action="store_true", default=False,
                         help="Whether to enable debug mode")
+    parser.add_argument("-H", "--hegemony-db", default=None,
+                        help="Local hegemony database file (see grip-hegemony-ingest)")
+    parser.add_argument("-b", "--batch-size", type=int, default=1,
+                        help="Number of messages to process at once, e.g. 500 to drain backlogs")
 
     opts = parser.parse_args()
 
@@ -211,7 +280,8 @@ def main():
     # use the following line to reduce log messages produced by elasticsearch
     # logging.getLogger('elasticsearch').setLevel(logging.WARN)
 
-    InferenceCollector(event_type=opts.type, debug=opts.debug).listen()
+    InferenceCollector(event_type=opts.type, debug=opts.debug, hegemony_db=opts.hegemony_db).listen(
+        batch_size=opts.batch_size)
 
 
 if __name__ == "__main__":
@@ -35,9 +35,9 @@ import json
 import logging
 import multiprocessing as mp
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
-import elasticsearch
 import filelock as filelock
 
 from grip.events.event import Event
@@ -45,6 +45,47 @@ from grip.inference.inference_collector import InferenceCollector
 from grip.utils.data.elastic import ElasticConn
 from grip.utils.data.elastic_queries import query_in_range, query_no_inference
 
+# seconds between two progress reports
+PROGRESS_INTERVAL = 60
+
+
+class RerunProgress:
+    """
+    Log re-inference throughput and estimated time to completion.
+    """
+
+    def __init__(self, total, name="", interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.name = name
+        self.interval = interval
+        self.done = 0
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def update(self, count=1):
+        self.done += count
+        now = time.time()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def rate(self):
+        elapsed = time.time() - self.start_time
+        return self.done / elapsed if elapsed > 0 else 0
+
+    def eta(self):
+        """estimated seconds to completion, None if unknown"""
+        rate = self.rate()
+        if not rate or self.total is None:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def report(self):
+        eta = self.eta()
+        logging.info("{}processed {}/{} events ({:.1f} events/s), ETA {}".format(
+            "{}: ".format(self.name) if self.name else "", self.done, self.total, self.rate(),
+            timedelta(seconds=int(eta)) if eta is not None else "unknown"))
+
 
 class InferenceRunner:
     def __init__(self, event_type, debug):
@@ -52,6 +93,24 @@ class InferenceRunner:
         self.debug = debug
         self.collector = InferenceCollector(event_type=event_type, debug=debug)
         self.esconn = ElasticConn()
+        self.es_bulk = self.esconn.bulk_writer(on_failure=self._on_bulk_failure)
+
+    def _on_bulk_failure(self, item):
+        """
+        Recommit events one by one if they are in a bulk request that is too large.
+        :param item: failed BulkItem
+        """
+        if item.status != 413:
+            return
+        try:
+            self.esconn.index_event(item.event, index=item.index)
+        except Exception as error:
+            # TransportError on elasticsearch 7, ApiError on later versions
+            if getattr(error, "status_code", None) == 413:
+                # allow continuing the program if certain events are too large
+                logging.warning("event is too large to recommit: {}".format(item.doc_id))
+            else:
+                raise error
 
     def refill(self):
         """
@@ -62,14 +121,23 @@ class InferenceRunner:
 
         for event in self.esconn.search_generator(index="observatory-events-*", query=query_no_inference()):
             assert (isinstance(event, Event))
-            event = self.collector.infer_event(event, to_query_hegemony=False)
-            self.esconn.index_event(event)
+            self.collector.infer_event(event, to_query_hegemony=False)
+            self.es_bulk.add_event(event, index=self.esconn.infer_index_name_by_id(event.event_id))
+        self.es_bulk.flush()
 
     def rerun(self, start_ts, end_ts, tr_worthy, inserted_before=None, inserted_after=None,
-              must_tags=None, must_not_tags=None, missing_inference=False, missing_data=False, query_asrank=False):
+              must_tags=None, must_not_tags=None, missing_inference=False, missing_data=False, query_asrank=False,
+              slice_id=None, max_slices=None, pit_id=None):
         """
         Rerun the inference code for the given time period.
 
+        The matching events can be split into max_slices slices of about the same number of events, to be processed
+        in parallel by different runners, each one taking one slice_id. The slices only partition the events when all
+        the runners read the same point-in-time, opened beforehand and passed as pit_id.
+
+        :param slice_id: slice of the matching events to process
+        :param max_slices: number of slices the matching events are split into
+        :param pit_id: point-in-time to read the matching events from, see ElasticConn.open_point_in_time
         :param query_asrank:
         :param missing_data:
         :param missing_inference:
@@ -94,23 +162,35 @@ class InferenceRunner:
             query_asrank=True
 
         json.dumps(query, indent=4)
-        type_pattern = self.event_type
+        index = self.get_index(self.event_type)
+
+        total = self.esconn.count_events(index=index, query=query)
+        name = ""
+        if max_slices is not None and max_slices > 1:
+            # slices are split by document, each one gets about the same share of events
+            total = total // max_slices
+            name = "slice {}/{}".format(slice_id, max_slices)
+        progress = RerunProgress(total, name=name)
+
+        for event in self.esconn.search_generator(index=index, query=query, slice_id=slice_id, max_slices=max_slices,
+                                                  pit_id=pit_id):
+            assert (isinstance(event, Event))
+            if self._event_in_range(event, inserted_before, inserted_after):
+                event.summary.clear_inference()
+                self.collector.infer_event(event=event, to_query_asrank=query_asrank, to_query_hegemony=False)
+                self.es_bulk.add_event(event, index=self.esconn.infer_index_name_by_id(event.event_id))
+            progress.update()
+        self.es_bulk.flush()
+        progress.report()
+
+    @staticmethod
+    def get_index(event_type):
+        """index pattern of the events to rerun the inference on"""
+        type_pattern = event_type
         if type_pattern is None:
             type_pattern = "*"
         assert (type_pattern in ["*", "moas", "submoas", "defcon", "edges"])
-        for event in self.esconn.search_generator(index=self.esconn.get_index_name(type_pattern), query=query):
-            try:
-                assert (isinstance(event, Event))
-                if self._event_in_range(event, inserted_before, inserted_after):
-                    event.summary.clear_inference()
-                    self.collector.infer_event(event=event, to_query_asrank=query_asrank, to_query_hegemony=False)
-                    self.esconn.index_event(event)
-            except elasticsearch.exceptions.TransportError as error:
-                if error.status_code == 413:
-                    # allow continuing the program if certain events are too large
-                    logging.warning("event is too large to recommit: {}".format(event.event_id))
-                else:
-                    raise error
+        return ElasticConn.get_index_name(type_pattern)
 
     @staticmethod
     def _event_in_range(event: Event, before, after):
@@ -128,9 +208,10 @@ class InferenceRunner:
 
 
 def run_process(event_type, debug, start_ts, end_ts, tr_worthy, after_ts, before_ts, must_tags, must_not_tags,
-                missing_inference, missing_data, query_asrank):
+                missing_inference, missing_data, query_asrank, slice_id=None, max_slices=None, pit_id=None):
     InferenceRunner(event_type=event_type, debug=debug) \
-        .rerun(start_ts, end_ts, tr_worthy, before_ts, after_ts, must_tags, must_not_tags, missing_inference, missing_data, query_asrank)
+        .rerun(start_ts, end_ts, tr_worthy, before_ts, after_ts, must_tags, must_not_tags, missing_inference, missing_data, query_asrank,
+               slice_id, max_slices, pit_id)
 
 
 def main():
@@ -167,7 +248,7 @@ def main():
                         help="inserted after time")
     parser.add_argument('-p', '--processes', nargs="?", type=int, required=False,
                         default=1,
-                        help="Number of processes to divide the time range and run, specify 0 to use all available cores")
+                        help="Number of processes to divide the matching events and run, specify 0 to use all available cores")
     parser.add_argument('-m', "--must_tags", nargs="?", required=False,
                         help="must have one of the tags, separated by comma")
     parser.add_argument('-M', "--must_not_tags", nargs="?", required=False,
@@ -190,10 +271,6 @@ def main():
     processes = opts.processes
     if processes <= 0:
         processes = os.cpu_count()
-    if processes > 1 and not (opts.end_ts and opts.start_ts):
-        logging.info(
-            "cannot start multi-threading due to lack of end_ts or start_ts, forced back to single-thread processing")
-        processes = 1
 
     hash_str = hashlib.sha1((json.dumps(vars(opts), sort_keys=True, ensure_ascii=True)).encode()).hexdigest()
     lockfile = "/tmp/inference-runner-{}.lock".format(hash_str)
@@ -205,18 +282,24 @@ def main():
                         opts.start_ts, opts.end_ts, opts.tr_worthy, opts.after_ts, opts.before_ts,
                         must_tags, must_not_tags, opts.fix_missing, opts.fix_data, opts.as_rank)
         else:
+            # each process takes one slice of the matching events, slices have about the same number of events
+            # regardless of how skewed the events are in time.
+            # all the slices are read from the same point-in-time, so that they partition the same snapshot of the
+            # events, which is not affected by the updates of the rerun itself
+            esconn = ElasticConn()
+            pit_id = esconn.open_point_in_time(InferenceRunner.get_index(opts.type))
             args = []
-            step = int((opts.end_ts - opts.start_ts) / processes)
-            cur_ts = opts.start_ts
-            while cur_ts < opts.end_ts:
-                cur_end = cur_ts + step
+            for slice_id in range(processes):
                 args.append(
-                    (opts.type, opts.debug, cur_ts, cur_end, opts.tr_worthy, opts.after_ts, opts.before_ts, must_tags,
-                     must_not_tags, opts.fix_missing, opts.fix_data, opts.as_rank))
-                cur_ts += step
+                    (opts.type, opts.debug, opts.start_ts, opts.end_ts, opts.tr_worthy, opts.after_ts, opts.before_ts,
+                     must_tags, must_not_tags, opts.fix_missing, opts.fix_data, opts.as_rank, slice_id, processes,
+                     pit_id))
 
-            with mp.Pool(processes=processes) as pool:
-                pool.starmap(run_process, args)
+            try:
+                with mp.Pool(processes=processes) as pool:
+                    pool.starmap(run_process, args)
+            finally:
+                esconn.close_point_in_time(pit_id)
 
     # remove lockfile if process finishes running
     if os.path.exists(lockfile):
@@ -31,10 +31,17 @@
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 import logging
 import unittest
+from unittest import mock
+
+from elasticsearch import Elasticsearch
 
 from grip.inference import Inference, InferenceResult, InferenceEngine
 from grip.inference.inference_collector import InferenceCollector
+from grip.inference.inference_runner import InferenceRunner, RerunProgress
+from grip.utils.data.elastic_bulk import ElasticBulkWriter
 from grip.utils.event_utils import create_dummy_event
+from grip.utils.messages import EventOnElasticMsg
+from grip.utils.tests.test_elastic_bulk import ElasticStub
 
 
 class TestInference(unittest.TestCase):
@@ -120,6 +127,184 @@ class TestInferenceCollector(unittest.TestCase):
         self.collector.es_conn.index_event(event=event, debug=True)
 
 
+class TestInferenceRunner(unittest.TestCase):
+    """
+    Test re-inference of events against a stand-in ElasticSearch server
+    """
+
+    index = "observatory-v3-events-moas-2020-01"
+
+    def setUp(self):
+        self.stub = ElasticStub().__enter__()
+        self.es = Elasticsearch(self.stub.url)
+        # AS rank data is not queried on rerun
+        with mock.patch("grip.utils.data.elastic.Elasticsearch", return_value=self.es), \
+                mock.patch("grip.inference.inference_collector.AsRankUtils"):
+            self.runner = InferenceRunner(event_type="moas", debug=False)
+
+        self.event_ids = []
+        writer = ElasticBulkWriter(self.es)
+        for i in range(20):
+            event = create_dummy_event("moas", ts=1577836800)
+            event.event_id = "moas-1577836800-{}".format(i)
+            event.event_metrics.proc_time_inference = None
+            self.event_ids.append(event.event_id)
+            writer.add_event(event, self.index)
+        writer.flush()
+
+    def tearDown(self):
+        self.es.close()
+        self.stub.__exit__(None, None, None)
+
+    def _inferred(self):
+        return sorted(doc_id for (_, doc_id), doc in self.stub.docs.items()
+                      if doc["event_metrics"]["proc_time_inference"] is not None)
+
+    def test_rerun(self):
+        self.stub.requests.clear()
+        self.runner.rerun(None, None, False)
+        self.assertEqual(sorted(self.event_ids), self._inferred())
+        self.assertEqual(1, self.stub.requests["_bulk"])
+        self.assertEqual(0, self.stub.requests["_doc"])
+
+    def test_rerun_slices(self):
+        inferred = []
+        infer_event = self.runner.collector.infer_event
+
+        def record_infer_event(event, **kwargs):
+            inferred.append(event.event_id)
+            infer_event(event, **kwargs)
+
+        with mock.patch.object(self.runner.collector, "infer_event", side_effect=record_infer_event):
+            for slice_id in range(3):
+                self.runner.rerun(None, None, False, slice_id=slice_id, max_slices=3)
+        # every event is processed exactly once
+        self.assertEqual(sorted(self.event_ids), sorted(inferred))
+        self.assertEqual(sorted(self.event_ids), self._inferred())
+
+    def test_rerun_too_large(self):
+        # the bulk request is too large, events are recommitted one by one, skipping the ones too large by themselves
+        large = create_dummy_event("moas", ts=1577836800)
+        large.event_id = "moas-1577836800-large"
+        large.debug["padding"] = "x" * 5000
+        large.event_metrics.proc_time_inference = None
+        writer = ElasticBulkWriter(self.es)
+        writer.add_event(large, self.index)
+        writer.flush()
+        self.stub.max_content_length = 3000
+
+        with self.assertLogs(level="WARNING") as logs:
+            self.runner.rerun(None, None, False)
+        self.assertEqual(sorted(self.event_ids), self._inferred())
+        self.assertTrue(any("moas-1577836800-large" in line for line in logs.output))
+
+    def test_progress(self):
+        progress = RerunProgress(total=100, interval=3600)
+        progress.start_time -= 10
+        progress.update(20)
+        self.assertAlmostEqual(2, progress.rate(), places=1)
+        self.assertAlmostEqual(40, progress.eta(), delta=1)
+        self.assertIsNone(RerunProgress(total=None).eta())
+
+
+class KafkaMessage:
+    """consumed kafka message"""
+
+    def __init__(self, value, offset=0):
+        self._value = value
+        self._offset = offset
+
+    def error(self):
+        return None
+
+    def value(self):
+        if isinstance(self._value, bytes):
+            return self._value
+        return self._value.encode()
+
+    def topic(self):
+        return "observatory-tagger-moas"
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+
+class TestInferenceCollectorBatch(unittest.TestCase):
+    """
+    Test batched inference of event ready messages against a stand-in ElasticSearch server
+    """
+
+    index = "observatory-v3-events-moas-2020-01"
+
+    def setUp(self):
+        self.stub = ElasticStub().__enter__()
+        self.es = Elasticsearch(self.stub.url)
+        with mock.patch("grip.utils.data.elastic.Elasticsearch", return_value=self.es), \
+                mock.patch("grip.inference.inference_collector.AsRankUtils"):
+            self.collector = InferenceCollector(event_type="moas")
+        self.collector.es_bulk = self.collector.es_conn.bulk_writer(max_retries=0)
+
+        writer = ElasticBulkWriter(self.es, initial_backoff=0)
+        for event_id in ["moas-1577836800-1", "moas-1577836800-2", "moas-1577836800-reject"]:
+            event = create_dummy_event("moas", ts=1577836800)
+            event.event_id = event_id
+            event.event_metrics.proc_time_inference = None
+            writer.add_event(event, self.index)
+        writer.flush()
+        self.stub.rejected.clear()
+        self.stub.requests.clear()
+
+    def tearDown(self):
+        self.es.close()
+        self.stub.__exit__(None, None, None)
+
+    def _messages(self, event_ids):
+        return [KafkaMessage(EventOnElasticMsg(sender="tagger", es_index=self.index, es_id=event_id,
+                                               tr_worthy=False).to_str(), offset)
+                for offset, event_id in enumerate(event_ids)]
+
+    def test_infer_messages(self):
+        messages = self._messages(["moas-1577836800-1", "moas-1577836800-2", "moas-1577836800-1",
+                                   "moas-1577836800-missing"])
+        with mock.patch.object(self.collector, "infer_event", wraps=self.collector.infer_event) as infer_event:
+            self.assertTrue(self.collector.infer_messages(messages))
+        self.assertEqual(2, infer_event.call_count)
+        self.assertEqual({"_mget": 1, "_bulk": 1}, dict(self.stub.requests))
+        for event_id in ["moas-1577836800-1", "moas-1577836800-2"]:
+            self.assertIsNotNone(self.stub.docs[(self.index, event_id)]["event_metrics"]["proc_time_inference"])
+
+    def test_infer_embedded_events(self):
+        # events embedded in binary messages are still read back from ES, as other stages may have updated them since
+        embedded = EventOnElasticMsg(sender="tagger", es_index=self.index, es_id="moas-1577836800-1", tr_worthy=False)
+        event = create_dummy_event("moas", ts=1577836800)
+        event.event_id = "moas-1577836800-1"
+        embedded.attach_event(event)
+        self.stub.docs[(self.index, "moas-1577836800-1")]["tr_metrics"]["tr_request_cnt"] = 20
+        messages = [KafkaMessage(embedded.to_bytes(), 0)] + self._messages(["moas-1577836800-2"])
+        with mock.patch.object(self.collector, "infer_event", wraps=self.collector.infer_event) as infer_event:
+            self.assertTrue(self.collector.infer_messages(messages))
+        self.assertEqual(2, infer_event.call_count)
+        self.assertEqual({"_mget": 1, "_bulk": 1}, dict(self.stub.requests))
+        doc = self.stub.docs[(self.index, "moas-1577836800-1")]
+        self.assertIsNotNone(doc["event_metrics"]["proc_time_inference"])
+        self.assertEqual(20, doc["tr_metrics"]["tr_request_cnt"])
+
+    def test_transient_failure(self):
+        # the rejected event is not committed, the batch has to be processed again
+        messages = self._messages(["moas-1577836800-1", "moas-1577836800-reject"])
+        self.assertFalse(self.collector.infer_messages(messages))
+        self.assertTrue(self.collector.infer_messages(messages))
+
+        consumer = mock.Mock()
+        self.collector.kafka_helper.consumer = consumer
+        self.collector.kafka_helper.rewind(messages)
+        consumer.seek.assert_called_once()
+        self.assertEqual(0, consumer.seek.call_args[0][0].offset)
+
+
 class TestInferenceResult(unittest.TestCase):
     """
     Test InferenceResult class
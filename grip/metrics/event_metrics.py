@@ -37,6 +37,9 @@ class EventMetrics:
     metrics and extra information collected for each event
     """
 
+    __slots__ = ("pfx_events_cnt", "per_tag_cnt", "total_tags_cnt", "pfx_events_with_tr_cnt",
+                 "proc_time_tagger", "proc_time_driver", "proc_time_inference")
+
     def __init__(self,
                  pfx_events_cnt=0, per_tag_cnt=None, total_tags_cnt=0, pfx_events_with_tr_cnt=0,
                  proc_time_tagger=0.0, proc_time_driver=0.0, proc_time_inference=0.0
@@ -53,6 +56,17 @@ class EventMetrics:
         self.proc_time_driver = proc_time_driver
         self.proc_time_inference = proc_time_inference
 
+    def as_dict(self):
+        return {
+            "pfx_events_cnt": self.pfx_events_cnt,
+            "per_tag_cnt": self.per_tag_cnt,
+            "total_tags_cnt": self.total_tags_cnt,
+            "pfx_events_with_tr_cnt": self.pfx_events_with_tr_cnt,
+            "proc_time_tagger": self.proc_time_tagger,
+            "proc_time_driver": self.proc_time_driver,
+            "proc_time_inference": self.proc_time_inference,
+        }
+
     @staticmethod
     def from_dict(d):
         return EventMetrics(**d)
@@ -37,12 +37,18 @@ from grip.common import ACTIVE_MAX_PFX_EVENTS, ACTIVE_MAX_EVENT_ASES, ACTIVE_MAX
 class TracerouteMetrics:
     """metrics and extra information collected for each event"""
 
+    __slots__ = ("max_pfx_events", "max_event_ases", "max_vps_per_event_as", "tr_worthy", "tr_skipped",
+                 "tr_worthy_tags", "tr_skip_reason", "selected_vp_cnt", "selected_unique_vp_cnt", "total_event_as_cnt",
+                 "selected_event_as_cnt", "tr_worthy_pfx_event_cnt", "selected_pfx_event_cnt", "tr_request_cnt",
+                 "tr_request_failure_cnt", "ip_to_as_lookup_cnt", "ip_to_as_cache_hit_cnt")
+
     def __init__(self,
                  max_pfx_events=ACTIVE_MAX_PFX_EVENTS, max_event_ases=ACTIVE_MAX_EVENT_ASES, max_vps_per_event_as=ACTIVE_MAX_PROBES_PER_TARGET,
                  tr_worthy=False, tr_worthy_tags=None, tr_skipped=False, tr_skip_reason="",
                  selected_vp_cnt=0, selected_unique_vp_cnt=0, total_event_as_cnt=0, selected_event_as_cnt=0,
                  tr_worthy_pfx_event_cnt=0, selected_pfx_event_cnt=0,
                  tr_request_cnt=0, tr_request_failure_cnt=0,
+                 ip_to_as_lookup_cnt=0, ip_to_as_cache_hit_cnt=0,
                  ):
         # thresholds
         self.max_pfx_events = max_pfx_events  # how many prefixes are we willing to trace per event?
@@ -71,11 +77,36 @@ class TracerouteMetrics:
         self.tr_request_cnt = tr_request_cnt
         self.tr_request_failure_cnt = tr_request_failure_cnt
 
+        # hop IP origin lookups of the traceroute results, and how many were answered from the collector's cache
+        self.ip_to_as_lookup_cnt = ip_to_as_lookup_cnt
+        self.ip_to_as_cache_hit_cnt = ip_to_as_cache_hit_cnt
+
     def update_tags(self, pfx_events):
         for e in pfx_events:
             if e.traceroutes["worthy"]:
                 self.tr_worthy_tags.add(tuple(e.traceroutes["worthy_tags"]))
 
+    def as_dict(self):
+        return {
+            "max_pfx_events": self.max_pfx_events,
+            "max_event_ases": self.max_event_ases,
+            "max_vps_per_event_as": self.max_vps_per_event_as,
+            "tr_worthy": self.tr_worthy,
+            "tr_skipped": self.tr_skipped,
+            "tr_worthy_tags": list(self.tr_worthy_tags),
+            "tr_skip_reason": self.tr_skip_reason,
+            "selected_vp_cnt": self.selected_vp_cnt,
+            "selected_unique_vp_cnt": self.selected_unique_vp_cnt,
+            "total_event_as_cnt": self.total_event_as_cnt,
+            "selected_event_as_cnt": self.selected_event_as_cnt,
+            "tr_worthy_pfx_event_cnt": self.tr_worthy_pfx_event_cnt,
+            "selected_pfx_event_cnt": self.selected_pfx_event_cnt,
+            "tr_request_cnt": self.tr_request_cnt,
+            "tr_request_failure_cnt": self.tr_request_failure_cnt,
+            "ip_to_as_lookup_cnt": self.ip_to_as_lookup_cnt,
+            "ip_to_as_cache_hit_cnt": self.ip_to_as_cache_hit_cnt,
+        }
+
     @staticmethod
     def from_dict(d):
         return TracerouteMetrics(**d)
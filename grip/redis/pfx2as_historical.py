@@ -391,6 +391,42 @@ class Pfx2AsHistorical:
         return self.rh.get_str_pfx(bin_pfx), [(start_ts, end_ts, asns.split(" ")) for (start_ts, asns), end_ts in
                                               records]
 
+    def lookup_many(self, prefixes):
+        """
+        Same as `lookup` without time constraints, for many prefixes at once: the queries for all the prefixes and
+        their super-prefixes are sent to Redis in one pipelined request.
+
+        :param prefixes: iterable of prefixes
+        :return: dict mapping each prefix to its lookup result, malformatted prefixes are omitted
+        """
+        bin_pfxs = {}
+        for prefix in prefixes:
+            bin_pfx = self.rh.get_bin_pfx(prefix)
+            if bin_pfx is not None:
+                bin_pfxs[prefix] = bin_pfx
+        if not bin_pfxs:
+            return {}
+
+        # query each prefix and super-prefix once, as done by `lookup` when walking up the tree
+        keys = sorted({bin_pfx[:length] for bin_pfx in bin_pfxs.values() for length in range(2, len(bin_pfx) + 1)})
+        pipe = self.rh.get_pipeline()
+        for key in keys:
+            pipe.zrangebyscore(PFX_KEY_TMPL % key, "-inf", "+inf", withscores=True)
+        found = dict(zip(keys, pipe.execute()))
+
+        results = {}
+        for prefix, bin_pfx in bin_pfxs.items():
+            records = []
+            while len(bin_pfx) > 1:
+                records = found[bin_pfx]
+                if len(records):
+                    break
+                bin_pfx = bin_pfx[:-1]
+            records = [(x.split(":"), str(int(score))) for (x, score) in records]
+            results[prefix] = (self.rh.get_str_pfx(bin_pfx),
+                               [(start_ts, end_ts, asns.split(" ")) for (start_ts, asns), end_ts in records])
+        return results
+
     @staticmethod
     def _compress_to_ranges(records):
         """
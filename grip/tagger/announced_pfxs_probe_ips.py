@@ -51,11 +51,13 @@ import wandio.swift
 
 import grip.active.ripe_atlas.target_ip_generator
 import grip.coodinator.announce
+from grip.active.ripe_atlas.target_ip_generator import pfx_sort_key
 
 INPUT_CONTAINER = "bgp-hijacks-announced-pfxs"
 OUTPUT_CONTAINER = "bgp-hijacks-announced-pfxs-probe-ips"
 OBJECT_TMPL = "year=%04d/month=%02d/day=%02d/hour=%02d/announced-pfxs-probe-ips.%d.%s.gz"
 OUTPUT_TMPL = "swift://%s/%s"
+WRITE_CHUNK_LINES = 10000
 
 
 def parse_filename(filename):
@@ -93,11 +95,63 @@ def generate_output_filename(filename):
     return OUTPUT_TMPL % (OUTPUT_CONTAINER, objname)
 
 
+def is_sorted_input(ip_gen, input_file):
+    """
+    Check whether the prefixes to probe of the input file are sorted by `pfx_sort_key`, reading the file once.
+
+    :param ip_gen: TargetIpGenerator
+    :return: True if the input file can be streamed by `write_probe_ips` without sorting it
+    """
+    prev_key = None
+    with wandio.open(input_file) as in_fh:
+        for line in in_fh:
+            pfx = line.strip()
+            if not ip_gen.is_probe_pfx(pfx):
+                continue
+            key = pfx_sort_key(pfx)
+            if prev_key is not None and key < prev_key:
+                logging.warning("announced prefixes are not sorted: %s comes after a greater prefix" % pfx)
+                return False
+            prev_key = key
+    return True
+
+
+def write_probe_ips(ip_gen, input_file, output_file, sort=False):
+    """
+    Stream the prefixes of the input file through the target IP generator and write the probe IPs as they come.
+
+    :param ip_gen: TargetIpGenerator
+    :param sort: sort the prefixes in memory first, for input files that are not sorted by `pfx_sort_key`
+    :return: number of probe IPs written
+    :raises UnsortedPrefixesError: if the input file is not sorted and `sort` is not set
+    """
+    count = 0
+    with wandio.open(input_file) as in_fh, wandio.open(output_file, mode="w") as out_fh:
+        pfxs = (line.strip() for line in in_fh)
+        if sort:
+            pfxs = sorted((pfx for pfx in pfxs if ip_gen.is_probe_pfx(pfx)), key=pfx_sort_key)
+        # lines are written in chunks, each write is compressed separately
+        lines = []
+        for pfx, ip in ip_gen.iter_probe_pfx_ips(pfxs):
+            lines.append("%s\t%s\n" % (pfx, ip))
+            if len(lines) >= WRITE_CHUNK_LINES:
+                out_fh.write("".join(lines))
+                count += len(lines)
+                lines = []
+        out_fh.write("".join(lines))
+        count += len(lines)
+    return count
+
+
 def pfxs_to_ip(input_file, output_file=None):
     """Extract a list of IP host addresses from a lis of prefixes
     Reads the prefixes from the input file and outputs
     for each prefix, a corresponding host IP address
     (unless the prefix is fully covered by subprefixes)
+
+    The prefixes are processed in one pass as they are read, holding only the chain of enclosing prefixes in memory,
+    when the input file is sorted (see `pfx_sort_key`). Other input files are sorted in memory. The order is checked
+    before the output file is opened, so that the output file is only written once.
     """
 
     if output_file is None:
@@ -109,19 +163,12 @@ def pfxs_to_ip(input_file, output_file=None):
 
     ip_gen = grip.active.ripe_atlas.target_ip_generator.TargetIpGenerator()
 
-    # load announced prefixes in a patricia trie
-    logging.info("Loading announced prefixes")
-    with wandio.open(input_file) as in_fh:
-        for line in in_fh:
-            pfx = line.strip()
-            ip_gen.add_pfx(pfx)
-
-    logging.info("Generating probe IPs")
-    pfx_ip = ip_gen.get_probe_pfx_ip_map()
+    sort = not is_sorted_input(ip_gen, input_file)
+    if sort:
+        logging.warning("sorting the announced prefixes in memory")
+    count = write_probe_ips(ip_gen, input_file, output_file, sort=sort)
 
-    with wandio.open(output_file, mode="w") as out_fh:
-        for pfx in pfx_ip:
-            out_fh.write("%s\t%s\n" % (pfx, pfx_ip[pfx]))
+    logging.info("Generated %d probe IPs" % count)
 
 
 def listen(group, offset):
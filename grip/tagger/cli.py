@@ -86,6 +86,10 @@ def main():
                         help="Run tagging off from production site")
     parser.add_argument("-p", "--pfx2as-file", help="Prefix to AS mapping file", default=None)
     parser.add_argument("-O", "--output-file", help="Output tagged events in JSON format to this file", default=None)
+    parser.add_argument("-H", "--hegemony-db", help="Local hegemony database file (see grip-hegemony-ingest)",
+                        default=None)
+    parser.add_argument("-B", "--binary-messages", action="store_true", default=False,
+                        help="Produce pipeline messages in the binary format, embedding the tagged events")
 
     parser.add_argument('-v', '--verbose', action="store_true",
                         required=False, help='Verbose logging')
@@ -123,6 +127,8 @@ def main():
         "offsite_mode": opts.offsite_mode,
         "pfx2as_file": opts.pfx2as_file,
         "output_file": opts.output_file,
+        "hegemony_db": opts.hegemony_db,
+        "binary_messages": opts.binary_messages,
     })
 
     to_cache = not opts.no_cache and not opts.offsite_mode
@@ -69,6 +69,7 @@ class Finisher:
         assert (event_type in ["moas", "submoas", "defcon", "edges"])
         self.event_type = event_type
         self.esconn = ElasticConn()
+        self.es_bulk = self.esconn.bulk_writer()
 
         self.unfinished_events = {}
         self.unfinished_pfx_events = {}
@@ -87,7 +88,7 @@ class Finisher:
         kafka_template = KAFKA_TOPIC_TEMPLATE
         self.kafka_producer_topic = kafka_template % ("tagger", event_type)
         self.kafka_producer = KafkaHelper()
-        self.kafka_producer.init_producer(topic=self.kafka_producer_topic)
+        self.kafka_producer.init_producer(topic=self.kafka_producer_topic, asynchronous=True)
 
     @staticmethod
     def _update_finished_ts(event: Event, event_finished, pfx_feature_to_finished_ts, time_ts):
@@ -213,7 +214,7 @@ class Finisher:
                     updated_events.add(event_id)
                     # we only update the most recent match
 
-        updated = False
+        finished_events = {}
         for event_id in updated_events:
             event_finished = False
             # for all the updated events, we should push it to ElasticSearch
@@ -225,10 +226,28 @@ class Finisher:
                 # this event is finished
                 self.unfinished_events.pop(event_id)
                 event_finished = True
+            finished_events[event_id] = (event_data, event_finished)
+
+        # retrieve all the updated events of this view at once
+        res_events = self.esconn.get_events_by_ids(
+            finished_events.keys(), indices={event_id: data["index"] for event_id, (data, _) in finished_events.items()})
+
+        # only send signal for reinference if it is a transition event (MOAS only)
+        transition_msg = EventOnElasticMsg(
+            sender="tagger",
+            es_index=self.esconn.infer_index_name_by_id(event.event_id),
+            es_id=event.event_id,
+            tr_worthy=False,  # do not trigger active probing actions
+        ).to_str() if self.event_type == "moas" else None
+
+        def notify_transition(_):
+            self.kafka_producer.produce(transition_msg)
 
-            res_event = self.esconn.get_event_by_id(event_id=event_id)
+        updated = False
+        for event_id, (event_data, event_finished) in finished_events.items():
+            res_event = res_events.get(event_id)
             if res_event is None:
-                logging.warning("cannot retrieve {} for marking it as finished", event_id)
+                logging.warning("cannot retrieve {} for marking it as finished".format(event_id))
                 continue
 
             # mark the event's finished prefix events as finished
@@ -246,21 +265,24 @@ class Finisher:
                     self.unchecked_transition_events[finished_ts] = []
                 self.unchecked_transition_events[finished_ts].append(res_event)
 
-            # update event on elasticsearch.
-            self.esconn.index_event(event=res_event, update=True)
-            if is_transition:
-                # only send signal for reinference if it is a transition event (MOAS only)
-                kafka_msg = EventOnElasticMsg(
-                    sender="tagger",
-                    es_index=self.esconn.infer_index_name_by_id(event.event_id),
-                    es_id=event.event_id,
-                    tr_worthy=False,  # do not trigger active probing actions
-                )
-                self.kafka_producer.produce(kafka_msg.to_str(), flush=True)
+            # update event on elasticsearch, committed with one bulk request below
+            self.es_bulk.add_event(res_event, index=event_data["index"], update=True,
+                                   callback=notify_transition if is_transition else None)
             updated = True
 
+        failed = self.es_bulk.flush()
+        if failed:
+            logging.error("FINISHER: failed to update {} finished events".format(len(failed)))
+        self._flush_kafka()
+
         return updated
 
+    def _flush_kafka(self):
+        """wait for the transition notifications to be delivered"""
+        failed = self.kafka_producer.flush()
+        if failed:
+            logging.error("FINISHER: failed to deliver {} transition messages".format(len(failed)))
+
     def recheck_transition_events(self):
         """
         Recheck previously unchecked finished events to determine if they're transition events.
@@ -281,10 +303,11 @@ class Finisher:
                             es_id=event.event_id,
                             tr_worthy=False,  # do not trigger active probing actions
                         )
-                        self.kafka_producer.produce(kafka_msg.to_str(), flush=True)
+                        self.kafka_producer.produce(kafka_msg.to_str())
             except ValueError:
                 break
             finished_views.append(view_ts)
+        self._flush_kafka()
 
         for view_ts in finished_views:
             # remove all views that has finished processing
@@ -50,6 +50,7 @@ from grip.tagger.tags import tagshelper
 from grip.utils.data.asrank import AsRankUtils
 from grip.utils.data.elastic import ElasticConn
 from grip.utils.data.hegemony import HegemonyUtils
+from grip.utils.data.hegemony_store import HegemonyStore
 from grip.utils.data.ixpinfo import IXPInfo
 from grip.utils.data.reserved_prefixes import ReservedPrefixes
 from grip.utils.data.spamhaus import AsnDrop
@@ -85,6 +86,8 @@ class Tagger(object):
 
         self.force_process_view = options.get("force_process_view", False)
         self.produce_kafka_message = options.get("produce_kafka_message", True)
+        # produce binary messages embedding the events, so that downstream stages can skip reading them from ES
+        self.binary_messages = options.get("binary_messages", False)
         self.offsite_mode = options.get("offsite_mode", False)
         self.in_memory = options.get("in_memory_data", self.offsite_mode)  # if offsite mode then must in memory
         self.finisher = Finisher(event_type=name, load_unfinished=options.get("load_unfinished", True)) \
@@ -92,6 +95,7 @@ class Tagger(object):
         pfx2as_datafile = options.get("pfx2as_file", None)
         self.output_file = options.get("output_file", None)
         self.rpki_data_dir = options.get("rpki_data_dir", grip.common.RPKI_DATA_DIR)
+        hegemony_db = options.get("hegemony_db", None)
 
         self.name = name  # type of tagger: moas, submoas, defcon, edges
         self.consumer_filename_regex = file_regex  # regex to parse consumer files
@@ -109,7 +113,7 @@ class Tagger(object):
             "pfx2asn_newcomer_local": Pfx2AsNewcomerLocal(datafile=pfx2as_datafile),
             "rpki": RpkiUtils(self.rpki_data_dir),
             "as_rank": AsRankUtils(),
-            "hegemony": HegemonyUtils(),
+            "hegemony": HegemonyUtils(store=HegemonyStore(hegemony_db) if hegemony_db else None),
             "trust_asns": TrustedAsns(),
             "friend_asns": OrgFriends(),
             "reserved_pfxs": ReservedPrefixes(),
@@ -122,12 +126,13 @@ class Tagger(object):
         if not self.offsite_mode:
             # elasticsearch
             self.es_conn = ElasticConn()
+            self.es_bulk = self.es_conn.bulk_writer()
             # kafka
             kafka_template = grip.common.KAFKA_DEBUG_TOPIC_TEMPLATE if self.DEBUG \
                 else grip.common.KAFKA_TOPIC_TEMPLATE
             self.kafka_producer_topic = kafka_template % ("tagger", name)
             self.kafka = KafkaHelper()
-            self.kafka.init_producer(topic=self.kafka_producer_topic)
+            self.kafka.init_producer(topic=self.kafka_producer_topic, asynchronous=True)
 
         # time tracking
         self.start_time = None
@@ -258,8 +263,9 @@ class Tagger(object):
                 pfx_event.add_tags([TagSkippedPfxEvent])
                 continue
 
-            # main (per prefix-event) tagging function
+            # main (per prefix-event) tagging function, which may also set the previous origins of the prefix event
             self.tag_pfxevent(pfx_event)
+            event.summary.pfx_event_changed(pfx_event, details_changed=True)
 
         event.summary.update()
         return is_recurring
@@ -283,22 +289,26 @@ class Tagger(object):
             self.finisher.process_new_event(event, index_name)
 
         event.event_metrics.proc_time_tagger = time.time() - self.start_time
-        succeeded = self.es_conn.index_event(index=index_name, event=event)
-        if not succeeded:
-            return
 
-        if not self.produce_kafka_message:
-            return
-
-        kafka_msg = EventOnElasticMsg(
-            sender="tagger",
-            es_index=index_name,
-            es_id=event.event_id,
-            tr_worthy=event.summary.tr_worthy,
-        )
-        self.kafka.produce(kafka_msg.to_str(), topic=self.kafka_producer_topic, flush=True)
-        if output_fh is not None:
-            output_fh.write((event.as_json() + "\n").encode())
+        def on_elastic(committed_event):
+            # only notify the pipeline once the event is committed to elasticsearch
+            if not self.produce_kafka_message:
+                return
+            kafka_msg = EventOnElasticMsg(
+                sender="tagger",
+                es_index=index_name,
+                es_id=committed_event.event_id,
+                tr_worthy=committed_event.summary.tr_worthy,
+            )
+            if self.binary_messages:
+                kafka_msg.attach_event(committed_event)
+                self.kafka.produce(kafka_msg.to_bytes(), topic=self.kafka_producer_topic)
+            else:
+                self.kafka.produce(kafka_msg.to_str(), topic=self.kafka_producer_topic)
+            if output_fh is not None:
+                output_fh.write((committed_event.as_json() + "\n").encode())
+
+        self.es_bulk.add_event(event, index=index_name, callback=on_elastic)
 
     def _dump_events(self, new_events, finished_event):
         """
@@ -316,8 +326,16 @@ class Tagger(object):
         if finished_event is not None:
             self._produce_event(finished_event)
 
+        # commit the remaining events, kafka messages are produced as the events are committed
+        failed = self.es_bulk.flush()
+        if failed:
+            logging.error("failed to commit {} events to elasticsearch".format(len(failed)))
+
         if self.produce_kafka_message:
-            self.kafka.flush()
+            # wait for the notifications of the view to be delivered
+            failed = self.kafka.flush()
+            if failed:
+                logging.error("failed to deliver {} kafka messages".format(len(failed)))
 
     def cache_consumer_file(self, consumer_filename):
         # set is_caching=True to avoid saving aspaths for submoas and defcon
@@ -135,8 +135,7 @@ class MoasTagger(Tagger):
 
         # based on the tags, extract prefix event's traceroute-worthiness
         do_traceroute, worthy_tags = tagshelper.check_tr_worthy(pfxevent.event_type, tags)
-        pfxevent.traceroutes["worthy"] = do_traceroute
-        pfxevent.traceroutes["worthy_tags"] = worthy_tags
+        pfxevent.set_tr_worthy(do_traceroute, worthy_tags)
 
         pfxevent.add_tags(tags)
 
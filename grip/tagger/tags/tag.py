@@ -57,14 +57,40 @@ class TagTrWorthy:
 
 
 class Tag(object):
+    """
+    Immutable tag definition.
+
+    Tags are shared between all the events that carry them: TagsHelper keeps one PlainTag instance per tag name and
+    hands out references to it, so a tag must never be modified once created.
+    """
+    __slots__ = ("name", "category", "definition", "comments", "_hash")
+
+    type = None
+
     def __init__(self, name, category, definition="", comments=None):
-        self.name = name
-        self.category = category
-        self.definition = definition
-        if not comments:
-            self.comments = []
-        else:
-            self.comments = comments
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "category", category)
+        object.__setattr__(self, "definition", definition)
+        object.__setattr__(self, "comments", comments if comments else [])
+        object.__setattr__(self, "_hash", hash(self.to_json()))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("tag {} is immutable".format(self.name))
+
+    def __delattr__(self, key):
+        raise AttributeError("tag {} is immutable".format(self.name))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (self.name, self.category, self.definition, self.comments)
+
+    def __hash__(self):
+        return self._hash
 
     def to_definition(self):
         raise NotImplementedError
@@ -77,9 +103,9 @@ class Tag(object):
 
 
 class PlainTag(Tag):
-    def __init__(self, name, category, definition="", comments=None):
-        super().__init__(name, category, definition, comments)
-        self.type = "plain"
+    __slots__ = ()
+
+    type = "plain"
 
     def __lt__(self, other):
         return self.name < other.name
@@ -111,17 +137,23 @@ class PlainTag(Tag):
         return self.__str__()
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __eq__(self, other):
-        return isinstance(other, PlainTag) and str(self) == str(other)
+        return self is other or (isinstance(other, PlainTag) and self.name == other.name)
 
 
 class ValueTag(Tag):
+    __slots__ = ("value",)
+
+    type = "value"
+
     def __init__(self, name, category="", definition="", comments=None, value=None):
+        object.__setattr__(self, "value", value)
         super().__init__(name, category, definition, comments)
-        self.value = value
-        self.type = "value"
+
+    def __reduce__(self):
+        return self.__class__, (self.name, self.category, self.definition, self.comments, self.value)
 
     def to_definition(self):
         return {
@@ -151,7 +183,7 @@ class ValueTag(Tag):
         return self.__str__()
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __eq__(self, other):
-        return isinstance(other, ValueTag) and str(self) == str(other)
+        return self is other or (isinstance(other, ValueTag) and str(self) == str(other))
@@ -33,7 +33,6 @@
 import json
 import logging
 import os
-from copy import copy
 
 import yaml
 
@@ -63,6 +62,7 @@ class TagsHelper(object):
         # load tags from yaml files
         self._load_all_tags()
         self._load_all_tags_worthy()
+        self._compile_tags_worthy()
 
         self.blacklist_asns = self._load_blacklist_asns()
         self.registered_tags = {}
@@ -92,18 +92,22 @@ class TagsHelper(object):
             if raise_error:
                 raise UseUndefinedTag("use of undefined tag: %s" % tag_name)
             return None
-        # make a copy when return the tag, the tag could be modified later
-        return copy(self.all_tag_map[tag_name])
+        # tags are immutable, all events share the same tag instance
+        return self.all_tag_map[tag_name]
 
     def parse_tag_dict(self, tag_dict):
         assert "name" in tag_dict
         t = self.all_tag_map[tag_dict["name"]]
+        if t.type == "plain":
+            return t
         return TAG_TYPE_TO_CLASS[t.type].from_dict(tag_dict, t.category, t.definition, t.comments)
 
     # def tag_from_str(self, tag_name, raise_error=False):
     def parse_tag(self, tag_to_parse, raise_error=False):
 
         if isinstance(tag_to_parse, Tag):
+            if tag_to_parse.type == "plain":
+                return self.all_tag_map.get(tag_to_parse.name, tag_to_parse)
             return tag_to_parse
 
         if isinstance(tag_to_parse, dict):
@@ -113,6 +117,8 @@ class TagsHelper(object):
             # could be:
             # - just tag name: return barebone tag
             # - json in str: parse to dict
+            if tag_to_parse in self.all_tag_map:
+                return self.all_tag_map[tag_to_parse]
             try:
                 tag_dict = json.loads(tag_to_parse)
                 return self.parse_tag_dict(tag_dict)
@@ -128,47 +134,83 @@ class TagsHelper(object):
                         if raise_error:
                             raise UseUndefinedTag(tag_name)
                         return None
-                return copy(self.all_tag_map[tag_name])
+                return self.all_tag_map[tag_name]
 
         raise UseUndefinedTag("use of undefined tag: %s" % tag_to_parse)
 
     def check_tr_worthy(self, event_type, tags_set):
         """
         Check if a given set of tags is traceroute worthy, and return the worthy tags.
+
+        The tr-worthiness table is compiled into bitmasks by _compile_tags_worthy, so the check is a handful of
+        integer operations instead of a scan over all tag combinations.
+
         :param event_type: event type
         :param tags_set: set of tags
         :return: (bool, list)
         """
-        tag_names = {t.name for t in tags_set}
-        yes_tags = set()
-        no_tags = set()
-        na_tags = set()
-        for combination in self.tags_worthy_map:
-            if event_type not in combination.apply_to:
-                # event does no apply to this tr checking, skip
-                continue
-            current_tags = {t.name for t in combination.tags}
-            if current_tags.issubset(tag_names):
-                if combination.worthy == "yes":
-                    # it has a yes tag combination
-                    yes_tags.update(current_tags)
-                elif combination.worthy == "no":
-                    # it has a no tag combination
-                    no_tags.update(current_tags)
-                else:
-                    # it has na tag combination
-                    na_tags.update(current_tags)
+        if event_type not in self.tags_worthy_rules:
+            # no combination applies to this event type, only na tags
+            return True, []
+        no_single, no_multi, yes_single, yes_multi = self.tags_worthy_rules[event_type]
 
-        if len(no_tags) > 0:
+        tags_mask = 0
+        for t in tags_set:
+            tags_mask |= self.tag_bits.get(t.name, 0)
+
+        if tags_mask & no_single or any(tags_mask & mask == mask for mask in no_multi):
             # if have some no tags, then it's not traceroute worthy
             return False, []
-        elif len(yes_tags) > 0:
+
+        yes_mask = tags_mask & yes_single
+        for mask in yes_multi:
+            if tags_mask & mask == mask:
+                yes_mask |= mask
+        if yes_mask:
             # else if have some yes tags, then it's traceroute worthy
-            return True, list(yes_tags)
-        else:
-            # otherwise, it has only na tags or no tags, it's traceroute worthy
-            # note: it's not possible to have no tags, since there will be notags Tag which is a na tag itself
-            return True, []
+            return True, self._tag_names_from_mask(yes_mask)
+        # otherwise, it has only na tags or no tags, it's traceroute worthy
+        # note: it's not possible to have no tags, since there will be notags Tag which is a na tag itself
+        return True, []
+
+    def _tag_names_from_mask(self, mask):
+        names = []
+        while mask:
+            low_bit = mask & -mask
+            names.append(self.bit_tag_names[low_bit.bit_length() - 1])
+            mask ^= low_bit
+        return names
+
+    def _compile_tags_worthy(self):
+        """
+        Compile the tr-worthiness table into bitmasks: each tag is assigned a bit, and each combination becomes the
+        mask of its tags. Per event type, single-tag combinations of the same worthiness are merged into one mask,
+        multi-tag combinations are kept as a tuple of masks to check for containment.
+        """
+        self.bit_tag_names = sorted(self.all_tag_map)
+        self.tag_bits = {name: 1 << i for i, name in enumerate(self.bit_tag_names)}
+
+        rules = {}
+        for combination in self.tags_worthy_map:
+            if combination.worthy not in ("yes", "no") or not combination.tags:
+                # na and empty combinations never change the result
+                continue
+            mask = 0
+            for t in combination.tags:
+                mask |= self.tag_bits[t.name]
+            for event_type in combination.apply_to:
+                # [no_single, no_multi, yes_single, yes_multi]
+                rule = rules.setdefault(event_type, [0, set(), 0, set()])
+                offset = 0 if combination.worthy == "no" else 2
+                if len(combination.tags) == 1:
+                    rule[offset] |= mask
+                else:
+                    rule[offset + 1].add(mask)
+
+        self.tags_worthy_rules = {
+            event_type: (no_single, tuple(sorted(no_multi)), yes_single, tuple(sorted(yes_multi)))
+            for event_type, (no_single, no_multi, yes_single, yes_multi) in rules.items()
+        }
 
     def _load_all_tags(self):
         tag_map = {}
@@ -29,7 +29,74 @@
 #  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
-from grip.tagger.announced_pfxs_probe_ips import main
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import wandio
+
+from grip.active.ripe_atlas.target_ip_generator import TargetIpGenerator
+import grip.tagger.announced_pfxs_probe_ips
+from grip.tagger.announced_pfxs_probe_ips import main, pfxs_to_ip
+
+
+class TestPfxsToIp(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rand = random.Random(3)
+        pfxs = set()
+        for _ in range(2000):
+            length = rand.randint(8, 24)
+            first = rand.randint(1 << 24, 223 << 24) >> (32 - length) << (32 - length)
+            pfxs.add("{}.{}.{}.{}/{}".format(first >> 24, first >> 16 & 255, first >> 8 & 255, first & 255, length))
+        self.pfxs = sorted(pfxs) + ["", "10.0.0.0/16"]
+
+        generator = TargetIpGenerator()
+        for pfx in self.pfxs:
+            generator.add_pfx(pfx)
+        self.expected = generator.get_probe_pfx_ip_map()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check_pfxs_to_ip(self, pfxs):
+        input_file = os.path.join(self.tmp_dir, "announced-pfxs.1577836800.w604800.gz")
+        output_file = os.path.join(self.tmp_dir, "announced-pfxs-probe-ips.gz")
+        with wandio.open(input_file, mode="w") as fh:
+            for pfx in pfxs:
+                fh.write(pfx + "\n")
+        pfxs_to_ip(input_file, output_file)
+        with wandio.open(output_file) as fh:
+            lines = [line.rstrip("\n").split("\t") for line in fh]
+        self.assertEqual(len(self.expected), len(lines))
+        self.assertEqual(self.expected, dict(lines))
+
+    def test_unsorted(self):
+        write_probe_ips = grip.tagger.announced_pfxs_probe_ips.write_probe_ips
+        with self.assertLogs(level="WARNING") as logs, \
+                mock.patch("grip.tagger.announced_pfxs_probe_ips.write_probe_ips", wraps=write_probe_ips) as write:
+            self.check_pfxs_to_ip(self.pfxs)
+        self.assertTrue(any("sorting the announced prefixes in memory" in line for line in logs.output))
+        # the order is detected before writing, the output file is written only once
+        self.assertEqual(1, write.call_count)
+        self.assertTrue(write.call_args.kwargs["sort"])
+
+    def test_non_canonical(self):
+        # prefixes with host bits set are written in canonical form, as done with the radix tree
+        pfxs = sorted(self.pfxs[:-2])
+        pfxs[:3] = [pfx.replace(".0/", ".7/") for pfx in pfxs[:3]]
+        self.check_pfxs_to_ip(pfxs)
+
+    def test_sorted(self):
+        pfxs = sorted(self.pfxs[:-2], key=lambda pfx: (
+            tuple(int(octet) for octet in pfx.split("/")[0].split(".")), int(pfx.split("/")[1])))
+        with self.assertLogs(level="INFO") as logs:
+            self.check_pfxs_to_ip(["10.0.0.0/16"] + pfxs)
+        self.assertEqual([], [line for line in logs.output if line.startswith("WARNING")])
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,102 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+from unittest import TestCase, mock
+
+from elasticsearch import Elasticsearch
+
+from grip.events.details_edges import EdgesDetails
+from grip.events.event import Event
+from grip.events.pfxevent import PfxEvent
+from grip.tagger.finisher import Finisher
+from grip.utils.data.elastic_bulk import ElasticBulkWriter
+from grip.utils.tests.test_elastic_bulk import ElasticStub
+
+VIEW_TS = 1577836800
+INDEX = "observatory-v3-events-edges-2020-01"
+
+
+def build_event(position, view_ts, prefixes):
+    event_id = "edges-{}-3356_{}".format(view_ts, len(prefixes))
+    event = Event(event_type="edges", position=position, event_id=event_id, view_ts=view_ts)
+    for prefix in prefixes:
+        details = EdgesDetails(as1=3356, as2=64512, prefix=prefix, aspaths_str="174 3356 64512")
+        event.add_pfx_event(PfxEvent(event_type="edges", view_ts=view_ts, position=position, details=details))
+    event.summary.update()
+    return event
+
+
+class TestFinisher(TestCase):
+
+    def setUp(self):
+        self.stub = ElasticStub().__enter__()
+        self.es = Elasticsearch(self.stub.url)
+        with mock.patch("grip.utils.data.elastic.Elasticsearch", return_value=self.es):
+            self.finisher = Finisher("edges", load_unfinished=False)
+
+        # two new events, the first one with two prefix events
+        self.events = [build_event("NEW", VIEW_TS, ["10.0.0.0/24", "10.0.1.0/24"]),
+                       build_event("NEW", VIEW_TS, ["10.0.2.0/24"])]
+        writer = ElasticBulkWriter(self.es)
+        for event in self.events:
+            self.finisher.process_new_event(event, INDEX)
+            writer.add_event(event, INDEX)
+        writer.flush()
+        self.stub.requests.clear()
+
+    def tearDown(self):
+        self.es.close()
+        self.stub.__exit__(None, None, None)
+
+    def test_process_finished_event(self):
+        finished_ts = VIEW_TS + 600
+        finished = build_event("FINISHED", finished_ts, ["10.0.0.0/24", "10.0.2.0/24"])
+        self.assertTrue(self.finisher.process_finished_event(finished))
+
+        # one multi-get and one bulk update for the whole view
+        self.assertEqual({"_mget": 1, "_bulk": 1}, dict(self.stub.requests))
+
+        partial = self.stub.docs[(INDEX, self.events[0].event_id)]
+        self.assertIsNone(partial["finished_ts"])
+        self.assertEqual([finished_ts, None], [pfx_event["finished_ts"] for pfx_event in partial["pfx_events"]])
+        self.assertIn(self.events[0].event_id, self.finisher.unfinished_events)
+
+        done = self.stub.docs[(INDEX, self.events[1].event_id)]
+        self.assertEqual(finished_ts, done["finished_ts"])
+        self.assertEqual([finished_ts], [pfx_event["finished_ts"] for pfx_event in done["pfx_events"]])
+        self.assertNotIn(self.events[1].event_id, self.finisher.unfinished_events)
+
+    def test_missing_event(self):
+        del self.stub.docs[(INDEX, self.events[1].event_id)]
+        finished = build_event("FINISHED", VIEW_TS + 600, ["10.0.2.0/24"])
+        self.assertFalse(self.finisher.process_finished_event(finished))
+        self.assertEqual({"_mget": 1}, dict(self.stub.requests))
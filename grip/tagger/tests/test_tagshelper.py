@@ -0,0 +1,118 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import copy
+import pickle
+import random
+from unittest import TestCase
+
+from grip.tagger.tags import tagshelper
+
+
+def check_tr_worthy_table(event_type, tags_set):
+    """
+    reference tr-worthiness check scanning the tags_tr.yaml table
+    """
+    tag_names = {t.name for t in tags_set}
+    yes_tags = set()
+    no_tags = set()
+    for combination in tagshelper.tags_worthy_map:
+        if event_type not in combination.apply_to:
+            continue
+        current_tags = {t.name for t in combination.tags}
+        if current_tags.issubset(tag_names):
+            if combination.worthy == "yes":
+                yes_tags.update(current_tags)
+            elif combination.worthy == "no":
+                no_tags.update(current_tags)
+
+    if len(no_tags) > 0:
+        return False, []
+    elif len(yes_tags) > 0:
+        return True, list(yes_tags)
+    else:
+        return True, []
+
+
+class TestTrWorthy(TestCase):
+
+    def _check(self, event_type, tags):
+        expected_worthy, expected_tags = check_tr_worthy_table(event_type, tags)
+        worthy, worthy_tags = tagshelper.check_tr_worthy(event_type, tags)
+        self.assertEqual(expected_worthy, worthy)
+        self.assertEqual(sorted(expected_tags), sorted(worthy_tags))
+
+    def test_combinations(self):
+        # every combination of the table on its own
+        for combination in tagshelper.tags_worthy_map:
+            for event_type in ["moas", "submoas", "defcon", "edges"]:
+                self._check(event_type, set(combination.tags))
+
+    def test_same_as_table(self):
+        rand = random.Random(0)
+        all_tags = [tagshelper.get_tag(name) for name in sorted(tagshelper.all_tag_map)]
+        for _ in range(3000):
+            tags = set(rand.sample(all_tags, rand.randint(0, 8)))
+            # make multi-tag combinations more likely to match
+            combination = rand.choice(tagshelper.tags_worthy_map)
+            if rand.random() < 0.5:
+                tags.update(combination.tags)
+            self._check(rand.choice(["moas", "submoas", "defcon", "edges", "unknown"]), tags)
+
+    def test_worthy(self):
+        self.assertEqual((True, ["hegemony-valley-paths"]),
+                         tagshelper.check_tr_worthy("moas", {tagshelper.get_tag("hegemony-valley-paths")}))
+        self.assertEqual((False, []),
+                         tagshelper.check_tr_worthy("moas", {tagshelper.get_tag("hegemony-valley-paths"),
+                                                             tagshelper.get_tag("ipv6-prefix")}))
+
+
+class TestTag(TestCase):
+
+    def test_interned(self):
+        tag = tagshelper.get_tag("hegemony-valley-paths")
+        self.assertIs(tag, tagshelper.get_tag("hegemony-valley-paths"))
+        self.assertIs(tag, tagshelper.parse_tag("hegemony-valley-paths"))
+        self.assertIs(tag, tagshelper.parse_tag({"name": "hegemony-valley-paths"}))
+        self.assertIs(tag, tagshelper.parse_tag('{"name": "hegemony-valley-paths"}'))
+        self.assertIs(tag, copy.copy(tag))
+        self.assertIs(tag, copy.deepcopy(tag))
+        self.assertEqual(tag, pickle.loads(pickle.dumps(tag)))
+        self.assertIs(tag, tagshelper.parse_tag(pickle.loads(pickle.dumps(tag))))
+
+    def test_immutable(self):
+        tag = tagshelper.get_tag("hegemony-valley-paths")
+        with self.assertRaises(AttributeError):
+            tag.name = "other"
+        with self.assertRaises(AttributeError):
+            tag.extra = 1
+        self.assertFalse(hasattr(tag, "__dict__"))
+        self.assertEqual({"name": "hegemony-valley-paths"}, tag.as_dict())
@@ -39,6 +39,8 @@ from elasticsearch.exceptions import RequestError, ConnectionTimeout
 
 import grip.events.event
 import grip.metrics.view_metrics
+import grip.utils.data.elastic_bulk
+import grip.utils.data.elastic_pit
 from grip.common import ES_VIEW_METRICS_INDEX, ES_OPS_EVENTS_INDEX
 
 
@@ -54,6 +56,21 @@ def convert_data_int_to_str(date, is_year):
 MAIN_INDEX_NAME_PATTERN = 'observatory-v3-events-{}-{}-{}'
 TEST_INDEX_NAME_PATTERN = 'observatory-v3-test-events-{}-{}-{}'
 
+# max number of documents retrieved per multi-get request
+MGET_CHUNK_SIZE = 1000
+
+
+def update_event_ts(event):
+    """
+    Update insert time and last modified time of an event before committing it to ElasticSearch
+    :param event: Event object
+    """
+    now = int(datetime.datetime.now().strftime("%s"))
+    if event.insert_ts is None:
+        # only update insert_ts if insert_ts is not available
+        event.insert_ts = now
+    event.last_modified_ts = now
+
 
 class ElasticConn:
     """maintain elasticsearch connection and provide utilities"""
@@ -68,6 +85,14 @@ class ElasticConn:
         if not self.es.ping():
             raise ValueError("Connection failed")
 
+    def bulk_writer(self, **kwargs):
+        """
+        Create a ElasticBulkWriter on this connection
+        :param kwargs: ElasticBulkWriter parameters
+        :return: ElasticBulkWriter object
+        """
+        return grip.utils.data.elastic_bulk.ElasticBulkWriter(self.es, **kwargs)
+
     def index_ops_event(self, ops_event, index=None):
         """
         Index a OperationalEvent object to ElasticSearch
@@ -191,10 +216,7 @@ class ElasticConn:
 
         try:
             # update insert time and last modified time before inserting it to elasticsearch
-            if event.insert_ts is None:
-                # only update insert_ts if insert_ts is not available
-                event.insert_ts = int(datetime.datetime.now().strftime("%s"))
-            event.last_modified_ts = int(datetime.datetime.now().strftime("%s"))
+            update_event_ts(event)
 
             if update:
                 self.es.update(index=index, id=event.event_id, body=
@@ -204,7 +226,7 @@ class ElasticConn:
                 }
                                )
             else:
-                self.es.index(index=index, id=event.event_id, body=event.as_json())
+                self.es.index(index=index, id=event.event_id, body=event.as_json(compact=True))
             succeeded = True
         except RequestError as e:
             logging.error(e)
@@ -253,63 +275,96 @@ class ElasticConn:
             return None
         return grip.events.event.Event.from_dict(event_json)
 
-    def id_generator(self, index, query, timeout="10m"):
-        # extract events into objects
-        query["_source"] = ["_id"]
-        res = self.es.search(index=index, body=query, scroll=timeout)
-        count = 0
-
-        while len(res['hits']['hits']):
-            scroll = res['_scroll_id']
-            events = res["hits"]["hits"]
-            for e in events:
-                try:
-                    count += 1
-                    yield e["_id"]
-                except TypeError as err:
-                    logging.error("%s", err)
-                    logging.error("%s", e)
-            res = self.es.scroll(scroll_id=scroll, scroll=timeout)
-
-    def search_generator(self, index, query=None, limit=-1, timeout="10m", raw_json=False):
+    def get_events_by_ids(self, event_ids, indices=None, debug=False, chunk_size=MGET_CHUNK_SIZE):
+        """
+        retrieve event objects of the given event ids from ElasticSearch with multi-get requests
+
+        :param event_ids: list of event ids to look for events
+        :param indices: (optional) dict mapping event ids to ElasticSearch index names
+        :param debug: whether the events are in debug index
+        :param chunk_size: max number of events retrieved per request
+        :return: dict mapping event ids to Event objects, events that cannot be retrieved are omitted
+        """
+        if indices is None:
+            indices = {}
+        events = {}
+        event_ids = list(event_ids)
+        for i in range(0, len(event_ids), chunk_size):
+            docs = [{"_index": indices.get(event_id) or self.infer_index_name_by_id(event_id, debug), "_id": event_id}
+                    for event_id in event_ids[i:i + chunk_size]]
+            res = self.es.mget(body={"docs": docs})
+            for doc in res["docs"]:
+                if not doc.get("found"):
+                    continue
+                events[doc["_id"]] = grip.events.event.Event.from_dict(doc["_source"])
+        return events
+
+    def count_events(self, index, query=None):
+        """
+        Count the events matching a query
+        :param index: ES index to search
+        :param query: query, only the "query" part is used
+        :return: number of matching events
+        """
+        body = {"query": query["query"]} if query and "query" in query else None
+        return self.es.count(index=index, body=body)["count"]
+
+    def open_point_in_time(self, index, timeout="10m"):
+        """
+        Open a point-in-time on an index, so that several readers, e.g. of different slices, see the same snapshot.
+        :return: point-in-time id to pass as pit_id, release it with close_point_in_time
+        """
+        return grip.utils.data.elastic_pit.open_pit(self.es, index, keep_alive=timeout)
+
+    def close_point_in_time(self, pit_id):
+        grip.utils.data.elastic_pit.close_pit(self.es, pit_id)
+
+    def search_reader(self, index, query=None, limit=-1, timeout="10m", cursor=None, slice_id=None, max_slices=None,
+                      resumable=False, pit_id=None):
+        """
+        Create a resumable, optionally sliced, point-in-time reader of the hits of a query.
+        See PitSearchReader for the parameters.
+        :return: PitSearchReader object
+        """
+        return grip.utils.data.elastic_pit.PitSearchReader(self.es, index=index, query=query, limit=limit,
+                                                           keep_alive=timeout, cursor=cursor, slice_id=slice_id,
+                                                           max_slices=max_slices, resumable=resumable, pit_id=pit_id)
+
+    def id_generator(self, index, query, timeout="10m", cursor=None, slice_id=None, max_slices=None, pit_id=None):
+        query = dict(query)
+        query["_source"] = False
+        reader = self.search_reader(index, query, timeout=timeout, cursor=cursor, slice_id=slice_id,
+                                    max_slices=max_slices, pit_id=pit_id)
+        for e in reader:
+            yield e["_id"]
+
+    def search_generator(self, index, query=None, limit=-1, timeout="10m", raw_json=False, cursor=None,
+                         slice_id=None, max_slices=None, pit_id=None):
         """
         search for events based on match conditions, yields Event object
         :param index: ES index to search
         :param query: query
         :param limit: limit of total number of objects to return
-        :param timeout: timeout string, e.g. "10m" means 10 minutes
+        :param timeout: point-in-time keep alive string, e.g. "10m" means 10 minutes
         :param raw_json: true if to return raw json string, otherwise return Event object
+        :param cursor: (optional) cursor token of a PitSearchReader to resume from
+        :param slice_id: (optional) slice of the results to read, between 0 and max_slices - 1
+        :param max_slices: (optional) number of slices to split the results into
+        :param pit_id: (optional) point-in-time to search, see open_point_in_time
         :return:
         """
-        if not query:
-            query = {
-                'size': 1000,
-                "query": {
-                    "match_all": {}
-                }
-            }
-
-        # extract events into objects
-        res = self.es.search(index=index, body=query, scroll=timeout)
-        count = 0
-
-        while len(res['hits']['hits']):
-            scroll = res['_scroll_id']
-            events = res["hits"]["hits"]
-            for e in events:
-                try:
-                    count += 1
-                    if raw_json:
-                        event = e["_source"]
-                    else:
-                        event = grip.events.event.Event.from_dict(e["_source"])
-                    yield event
-                except TypeError as err:
-                    logging.error("%s", err)
-                    logging.error("%s", e)
-                if limit and limit > 0 and count >= limit:
-                    return
-            res = self.es.scroll(scroll_id=scroll, scroll=timeout)
+        reader = self.search_reader(index, query, limit=limit, timeout=timeout, cursor=cursor, slice_id=slice_id,
+                                    max_slices=max_slices, pit_id=pit_id)
+        for e in reader:
+            try:
+                if raw_json:
+                    event = e["_source"]
+                else:
+                    event = grip.events.event.Event.from_dict(e["_source"])
+                yield event
+            except TypeError as err:
+                logging.error("%s", err)
+                logging.error("%s", e)
 
     @staticmethod
     def get_index_name(event_type, year="*", month="*", debug=False):
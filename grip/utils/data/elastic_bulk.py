@@ -0,0 +1,257 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import logging
+import time
+from collections import deque
+
+from elasticsearch.exceptions import TransportError
+from elasticsearch.helpers import streaming_bulk
+
+import grip.events.event
+import grip.utils.data.elastic
+from grip.utils import serialization
+
+# flush thresholds
+BULK_MAX_DOCS = 500
+BULK_MAX_BYTES = 20 * 1024 * 1024
+BULK_MAX_AGE = 10  # seconds
+
+# per-item retries for rejected (429) or unavailable (503) items and connection failures
+BULK_MAX_RETRIES = 3
+BULK_INITIAL_BACKOFF = 2  # seconds, doubled for every retry
+BULK_RETRY_STATUS = {429, 502, 503, 504}
+
+
+class BulkWriteError(RuntimeError):
+    """documents could not be written to ElasticSearch"""
+
+    def __init__(self, failed):
+        RuntimeError.__init__(self, "failed to write {} documents".format(len(failed)))
+        self.failed = failed
+
+
+class BulkItem:
+    """
+    One document queued in a ElasticBulkWriter.
+    """
+
+    __slots__ = ("index", "doc_id", "op_type", "body", "event", "callback", "error", "status")
+
+    def __init__(self, index, doc_id, op_type, body, event=None, callback=None):
+        self.index = index
+        self.doc_id = doc_id
+        self.op_type = op_type
+        self.body = body
+        self.event = event
+        self.callback = callback
+        self.error = None
+        self.status = None
+
+    @property
+    def retriable(self):
+        """whether the item failed because of a transient error, i.e. it could succeed if written again"""
+        return not isinstance(self.status, int) or self.status in BULK_RETRY_STATUS
+
+    def __repr__(self):
+        return "{} {}/{}: {} {}".format(self.op_type, self.index, self.doc_id, self.status, self.error)
+
+
+def _expand_bulk_item(item):
+    # the body is already serialized, the client passes strings through as-is
+    return {item.op_type: {"_index": item.index, "_id": item.doc_id}}, item.body
+
+
+class ElasticBulkWriter:
+    """
+    Buffer event writes to ElasticSearch and commit them with bulk requests.
+
+    Events are queued with add_event and written when the buffer reaches max_docs documents or max_bytes bytes, or
+    when the oldest queued event is older than max_age seconds (checked on add_event and flush_if_due). Rejected items
+    and connection failures are retried per item with exponential backoff.
+
+    The callback of an event is called only after the event is successfully written, so that the downstream
+    components are notified only for events that are on ElasticSearch. Failed items are passed to on_failure and
+    returned by flush.
+    """
+
+    def __init__(self, es, max_docs=BULK_MAX_DOCS, max_bytes=BULK_MAX_BYTES, max_age=BULK_MAX_AGE,
+                 max_retries=BULK_MAX_RETRIES, initial_backoff=BULK_INITIAL_BACKOFF, on_failure=None):
+        """
+        :param es: Elasticsearch client, e.g. ElasticConn().es
+        :param max_docs: max number of documents to buffer
+        :param max_bytes: max number of serialized bytes to buffer
+        :param max_age: max number of seconds a document waits in the buffer
+        :param max_retries: number of retries for failed items
+        :param initial_backoff: seconds to wait before the first retry
+        :param on_failure: function called with each BulkItem that failed to be written
+        """
+        self.es = es
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.on_failure = on_failure
+
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.buffer_ts = None
+
+        # statistics
+        self.docs_written = 0
+        self.docs_failed = 0
+        self.bulk_requests = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def add_event(self, event, index, update=False, upsert=True, callback=None):
+        """
+        Queue an Event object to be committed to ElasticSearch.
+
+        :param event: Event object
+        :param index: index name
+        :param update: whether to update the object instead of replace it
+        :param upsert: whether to insert the document when updating an non-existing document
+        :param callback: function called with the event once it is written
+        :return: list of failed BulkItems if the buffer got flushed, empty list otherwise
+        """
+        assert (isinstance(event, grip.events.event.Event))
+        grip.utils.data.elastic.update_event_ts(event)
+        if update:
+            body = serialization.dumps_compact({"doc": event.as_dict(), "doc_as_upsert": upsert})
+            op_type = "update"
+        else:
+            body = event.as_json(compact=True)
+            op_type = "index"
+        return self.add(BulkItem(index, event.event_id, op_type, body, event=event, callback=callback))
+
+    def add(self, item):
+        """
+        Queue a BulkItem, flush the buffer if it is full or too old.
+        :param item: BulkItem object
+        :return: list of failed BulkItems if the buffer got flushed, empty list otherwise
+        """
+        if not self.buffer:
+            self.buffer_ts = time.time()
+        self.buffer.append(item)
+        self.buffer_bytes += len(item.body)
+        if len(self.buffer) >= self.max_docs or self.buffer_bytes >= self.max_bytes:
+            return self.flush()
+        return self.flush_if_due()
+
+    def flush_if_due(self):
+        """
+        Flush the buffer if the oldest queued document is older than max_age.
+        :return: list of failed BulkItems
+        """
+        if self.buffer and time.time() - self.buffer_ts >= self.max_age:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Write all the queued documents to ElasticSearch.
+        :return: list of failed BulkItems
+        """
+        if not self.buffer:
+            return []
+        pending = self.buffer
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.buffer_ts = None
+
+        failed = []
+        for attempt in range(self.max_retries + 1):
+            retry = self._write(pending, failed)
+            if not retry:
+                break
+            if attempt == self.max_retries:
+                failed.extend(retry)
+                break
+            backoff = self.initial_backoff * 2 ** attempt
+            logging.warning("bulk: retrying {} items in {} seconds".format(len(retry), backoff))
+            time.sleep(backoff)
+            pending = retry
+
+        for item in failed:
+            logging.error("bulk: failed to write {}".format(item))
+            self.docs_failed += 1
+            if self.on_failure is not None:
+                self.on_failure(item)
+        return failed
+
+    def _write(self, items, failed):
+        """
+        Send one round of bulk requests.
+        :param items: BulkItems to write
+        :param failed: list to append BulkItems that failed permanently to
+        :return: list of BulkItems to retry
+        """
+        # map results back to items, the same document could be queued more than once
+        unreported = {}
+        for item in items:
+            unreported.setdefault((item.index, item.doc_id), deque()).append(item)
+
+        retry = []
+        try:
+            self.bulk_requests += (len(items) + self.max_docs - 1) // self.max_docs
+            for ok, result in streaming_bulk(self.es, items, chunk_size=self.max_docs,
+                                             max_chunk_bytes=self.max_bytes,
+                                             expand_action_callback=_expand_bulk_item,
+                                             raise_on_error=False, raise_on_exception=False):
+                info = next(iter(result.values()))
+                item = unreported[(info.get("_index"), info.get("_id"))].popleft()
+                if ok:
+                    self.docs_written += 1
+                    if item.callback is not None:
+                        item.callback(item.event)
+                    continue
+                item.status = info.get("status")
+                item.error = info.get("error")
+                if item.retriable:
+                    retry.append(item)
+                else:
+                    failed.append(item)
+        except TransportError as e:
+            # connection failures: retry everything that has not been reported yet
+            logging.error("bulk: request failed: {}".format(e))
+            for items_left in unreported.values():
+                for item in items_left:
+                    item.status = None
+                    item.error = str(e)
+                    retry.append(item)
+        return retry
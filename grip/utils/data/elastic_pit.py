@@ -0,0 +1,190 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import base64
+import json
+import logging
+
+from elasticsearch import NotFoundError
+
+PIT_KEEP_ALIVE = "10m"
+PIT_PAGE_SIZE = 1000
+
+# tiebreaker for search_after, the shard and Lucene doc id of each document in the point-in-time
+PIT_TIEBREAKER = {"_shard_doc": "asc"}
+
+
+def encode_cursor(state):
+    """encode reader position as an url-safe cursor token"""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """decode cursor token into reader position"""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("invalid search cursor: {}".format(cursor))
+
+
+def open_pit(es, index, keep_alive=PIT_KEEP_ALIVE):
+    """
+    Open a point-in-time on the given index, to be shared by several readers
+    :return: point-in-time id
+    """
+    return es.open_point_in_time(index=index, keep_alive=keep_alive)["id"]
+
+
+def close_pit(es, pit_id):
+    """release a point-in-time on the server"""
+    try:
+        es.close_point_in_time(body={"id": pit_id})
+    except NotFoundError:
+        # already expired
+        pass
+    except Exception as e:
+        logging.warning("failed to close point-in-time: {}".format(e))
+
+
+class PitSearchReader:
+    """
+    Read all the hits of a query with a point-in-time and search_after.
+
+    Unlike the scroll API, a point-in-time does not keep the result pages on the server, and pages are fetched one
+    after another, so the memory used on both sides does not depend on the number of results.
+
+    A resumable reader can be resumed from its cursor token as long as the point-in-time is alive, i.e. up to
+    keep_alive after the last page was fetched. Queries can be split into max_slices disjoint slices that can be read in parallel, by
+    different processes, each reader taking one slice_id.
+    """
+
+    def __init__(self, es, index=None, query=None, limit=-1, keep_alive=PIT_KEEP_ALIVE, cursor=None,
+                 slice_id=None, max_slices=None, resumable=False, pit_id=None):
+        """
+        :param es: Elasticsearch client
+        :param index: index name or pattern to search, not used when resuming from a cursor
+        :param query: search body, size sets the page size
+        :param limit: limit of total number of hits to return
+        :param keep_alive: how long to keep the point-in-time alive between two pages, e.g. "10m"
+        :param cursor: cursor token to resume from, as returned by the cursor property
+        :param slice_id: slice to read, between 0 and max_slices - 1
+        :param max_slices: number of slices the query is split into
+        :param resumable: keep the point-in-time open when the iteration stops before the last hit (limit reached,
+        iteration abandoned or failed), so that it can be resumed from the cursor. Otherwise it is released as soon as
+        the iteration stops.
+        :param pit_id: point-in-time opened by the caller (see open_pit), e.g. to read the slices of the same snapshot
+        in different processes. It is not released by the reader.
+        """
+        self.es = es
+        self.limit = limit
+        self.keep_alive = keep_alive
+        self.resumable = resumable
+        self.query = dict(query) if query else {"query": {"match_all": {}}}
+        self.page_size = self.query.pop("size", PIT_PAGE_SIZE)
+
+        self.pit_id = pit_id
+        self.shared_pit = pit_id is not None
+        self.search_after = None
+        self.count = 0
+        if cursor is not None:
+            state = decode_cursor(cursor)
+            self.pit_id = state["pit"]
+            self.search_after = state["after"]
+            self.count = state["count"]
+            slice_id, max_slices = state.get("slice", (None, None))
+        elif index is None and pit_id is None:
+            raise ValueError("index or pit_id must be specified when not resuming from a cursor")
+        self.index = index
+        self.slice_id = slice_id
+        self.max_slices = max_slices
+
+        sort = self.query.get("sort", [])
+        if not isinstance(sort, list):
+            sort = [sort]
+        self.query["sort"] = sort + [PIT_TIEBREAKER]
+        if max_slices is not None and max_slices > 1:
+            assert 0 <= slice_id < max_slices
+            self.query["slice"] = {"id": slice_id, "max": max_slices}
+        self.query["track_total_hits"] = False
+
+    @property
+    def cursor(self):
+        """
+        Token to resume reading after the last returned hit, None if the reader has not started or is done
+        """
+        if self.pit_id is None:
+            return None
+        state = {"pit": self.pit_id, "after": self.search_after, "count": self.count}
+        if "slice" in self.query:
+            state["slice"] = [self.slice_id, self.max_slices]
+        return encode_cursor(state)
+
+    def __iter__(self):
+        if self.pit_id is None:
+            self.pit_id = open_pit(self.es, self.index, self.keep_alive)
+
+        exhausted = False
+        try:
+            while not self.limit or self.limit < 0 or self.count < self.limit:
+                body = dict(self.query)
+                body["size"] = self.page_size
+                body["pit"] = {"id": self.pit_id, "keep_alive": self.keep_alive}
+                if self.search_after is not None:
+                    body["search_after"] = self.search_after
+                res = self.es.search(body=body)
+                # the point-in-time id may change between pages
+                self.pit_id = res.get("pit_id", self.pit_id)
+
+                hits = res["hits"]["hits"]
+                if not hits:
+                    exhausted = True
+                    break
+                for hit in hits:
+                    self.count += 1
+                    self.search_after = hit["sort"]
+                    yield hit
+                    if self.limit and 0 < self.limit <= self.count:
+                        return
+        finally:
+            # resumable readers keep the point-in-time until all the hits are read, or it expires
+            if exhausted or not self.resumable:
+                self.close()
+
+    def close(self):
+        """
+        Release the point-in-time on the server, unless it is shared, the cursor cannot be resumed afterwards.
+        """
+        if self.pit_id is None:
+            return
+        if not self.shared_pit:
+            close_pit(self.es, self.pit_id)
+        self.pit_id = None
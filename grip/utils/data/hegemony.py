@@ -30,16 +30,20 @@
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
+import calendar
 import logging
 from collections import defaultdict
 from datetime import datetime, timedelta
 from pprint import pprint
 
+import numpy as np
 import requests
 from future.utils import iteritems
 from requests import ConnectionError
 from scipy import stats, spatial
 
+IHR_HEGEMONY_API_URL = "https://ihr.iijlab.net/ihr/api/hegemony/"
+
 
 def ceil_dt(dt):
     """ Currently, hegemony is calculated every 15 minute,
@@ -58,10 +62,16 @@ class HegemonyUtils:
     IIJ AS hegemony score utility class
     """
 
-    def __init__(self):
+    def __init__(self, store=None, api_url=IHR_HEGEMONY_API_URL):
+        """
+        :param store: optional local HegemonyStore, scores are fetched from the IHR API for timebins not in the store
+        :param api_url: IHR hegemony API endpoint
+        """
         self.cache = {}
         self.cached_subgraph = set()
         self.cache_ts = ""
+        self.store = store
+        self.api_url = api_url
 
 
     ########
@@ -81,71 +91,85 @@ class HegemonyUtils:
             unique_ases.update(path)
         hegemony_scores = self.query_hegemony(timestamp=view_ts, subgraph_asn_lst=[0], asn_lst=list(unique_ases))["0"]
 
-        # hegemony paths
-        hege_paths = []
-        for path in paths:
-            # remove consecutive ASes
-            new_path = [v for i, v in enumerate(path) if i == 0 or v != path[i - 1]]
-            hege_paths.append([(asn, hegemony_scores[asn]) if asn in hegemony_scores else 0 for asn in new_path])
+        return self.count_hegemony_valleys(paths, hegemony_scores, threshold)
 
-        if not hege_paths:
-            return 0.0, []
+    @staticmethod
+    def count_hegemony_valleys(paths, hegemony_scores, threshold):
+        """ Count hegemony valleys in paths given the global hegemony scores of the ASes on the paths.
 
-        ####
-        # look for valleys
-        ####
+        All paths are packed into a padded matrix of hegemony scores (one row per path) so that peaks, minimums and
+        valley depths are computed for all paths at once.
 
-        valleys = []
-        paths_with_valleys = []
-        for index, hege_path in enumerate(hege_paths):
+        A peak is a hop with score no smaller than its neighbors (the first and the last hops are compared against
+        their only neighbor). Each pair of consecutive peaks forms a valley, the depth of which is the average depth
+        of the two peaks relative to the path minimum; valleys with depth >= threshold are counted.
 
-            if len(hege_path) < 3:
-                # need at least 3 hops to form a valley
-                continue
+        :param paths: list of AS paths (list of asns)
+        :param hegemony_scores: dict of asn -> global hegemony score
+        :param threshold: minimum valley depth
+        :return: average num of valleys per path, hegemony paths ([(asn, score)]) with valleys
+        """
+        if not paths:
+            return 0.0, []
 
-            # find all peaks based on global hegemony scores
-            peak_idxs = []
-            for i in range(1, len(hege_path) - 1):
-                prev_score = hege_path[i - 1][1]
-                curr_score = hege_path[i][1]
-                next_score = hege_path[i + 1][1]
-                # case 1: peak at the first element
-                if i == 1 and prev_score > curr_score:
-                    peak_idxs.append(0)
-                # case 2: peak at the current element
-                if prev_score <= curr_score and curr_score >= next_score:
-                    peak_idxs.append(i)
-                # case 3: peak at the last element
-                if i == len(hege_path) - 2 and next_score >= curr_score:
-                    peak_idxs.append(i + 1)
-
-            # count valleys
-            if len(peak_idxs) <= 1:
-                # one peak create no valleys
-                valleys.append(0)
-                continue
+        # map ASes to integer indexes, and remove consecutive ASes
+        asn_idxs = {}
+        hops = np.array([asn_idxs.setdefault(asn, len(asn_idxs)) for path in paths for asn in path], dtype=np.int64)
+        rows = np.arange(len(paths))
+        hop_rows = np.repeat(rows, [len(path) for path in paths])
+        keep = np.ones(len(hops), dtype=bool)
+        keep[1:] = (hops[1:] != hops[:-1]) | (hop_rows[1:] != hop_rows[:-1])
+        hops, hop_rows = hops[keep], hop_rows[keep]
+        lengths = np.bincount(hop_rows, minlength=len(paths))
+        starts = np.cumsum(lengths) - lengths
+
+        # hegemony score matrix, padded with zeros
+        width = max(int(lengths.max()), 3)
+        asn_scores = np.array([float(hegemony_scores.get(asn, 0)) for asn in asn_idxs], dtype=np.float64)
+        scores = np.zeros((len(paths), width), dtype=np.float64)
+        scores[hop_rows, np.arange(len(hops)) - starts[hop_rows]] = asn_scores[hops]
+
+        # need at least 3 hops to form a valley
+        long_paths = lengths >= 3
+        last = np.maximum(lengths - 1, 1)
+
+        # find all peaks
+        peaks = np.zeros(scores.shape, dtype=bool)
+        prev_score, curr_score, next_score = scores[:, :-2], scores[:, 1:-1], scores[:, 2:]
+        inner = np.arange(1, width - 1)[np.newaxis, :] <= (lengths - 2)[:, np.newaxis]
+        peaks[:, 1:-1] = inner & (prev_score <= curr_score) & (curr_score >= next_score)
+        # peak at the first element
+        peaks[:, 0] = long_paths & (scores[:, 0] > scores[:, 1])
+        # peak at the last element
+        peaks[rows, last] |= long_paths & (scores[rows, last] >= scores[rows, last - 1])
+
+        # minimum of each path
+        padding = np.arange(width)[np.newaxis, :] >= lengths[:, np.newaxis]
+        minimums = np.where(padding, np.inf, scores).min(axis=1)
+
+        # consecutive peaks on the same path form valleys
+        peak_rows, peak_cols = np.nonzero(peaks)
+        same_path = peak_rows[1:] == peak_rows[:-1]
+        peak_before = scores[peak_rows[:-1], peak_cols[:-1]]
+        peak_after = scores[peak_rows[1:], peak_cols[1:]]
+        minimum = minimums[peak_rows[1:]]
+        # peaks with zero score have undefined depths and are not counted
+        counted = same_path & (peak_before != 0) & (peak_after != 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            depth_before_bottom = (peak_before - minimum) / peak_before
+            depth_after_bottom = (peak_after - minimum) / peak_after
+            avg_depth = (depth_before_bottom + depth_after_bottom) / 2.0
+        counted &= avg_depth >= threshold
+        valleys = np.bincount(peak_rows[1:][counted], minlength=len(paths))
+
+        # save valley paths for record keeping
+        asns = list(asn_idxs)
+        paths_with_valleys = []
+        for row in np.nonzero(valleys)[0]:
+            path = [asns[idx] for idx in hops[starts[row]:starts[row] + lengths[row]]]
+            paths_with_valleys.append([(asn, hegemony_scores[asn]) if asn in hegemony_scores else 0 for asn in path])
 
-            valley_cnt = 0
-            for i in range(1, len(peak_idxs)):
-                minimum = sorted(hege_path, key=lambda x: x[1])[0][1]
-
-                # calculate each depth between each peak and minimum
-                try:
-                    depth_before_bottom = (hege_path[peak_idxs[i - 1]][1] - minimum) / float(
-                        hege_path[peak_idxs[i - 1]][1])
-                    depth_after_bottom = (hege_path[peak_idxs[i]][1] - minimum) / float(hege_path[peak_idxs[i]][1])
-                    avg_depth = (depth_before_bottom + depth_after_bottom) / 2.0
-                    # we count depth, only when it is larger than threshold
-                    if avg_depth >= threshold:
-                        valley_cnt += 1
-                except ZeroDivisionError:
-                    pass
-            valleys.append(valley_cnt)
-            # save valley paths for record keeping
-            if valley_cnt > 0:
-                paths_with_valleys.append(hege_path)
-
-        avg_valleys = sum(valleys) / float(len(hege_paths))
+        avg_valleys = int(valleys.sum()) / float(len(paths))
         return avg_valleys, paths_with_valleys
 
     ########
@@ -167,7 +191,7 @@ class HegemonyUtils:
         peerASNTotalCount = {pasn: float(sum([counter["total"][p] for p in peers])) for pasn, peers in
                              iteritems(peersPerASN)}
 
-        for asn in counter["asn"].iterkeys():
+        for asn in counter["asn"].keys():
             # Don't do that: (for very distributed asn we want to report at least
             # the origin AS
             # if asn==scope:
@@ -338,9 +362,8 @@ class HegemonyUtils:
         subgraph_asn_lst = [str(asn) for asn in subgraph_asn_lst]
 
         t = datetime.utcfromtimestamp(int(timestamp))
-        query_time_str = datetime.strftime(
-            ceil_dt(t) - timedelta(hours=1),
-            '%Y-%m-%dT%H:%M')
+        query_dt = ceil_dt(t) - timedelta(hours=1)
+        query_time_str = datetime.strftime(query_dt, '%Y-%m-%dT%H:%M')
 
         if self.cache_ts != query_time_str:
             # if timestamp changed, clear cache
@@ -389,11 +412,46 @@ class HegemonyUtils:
         for subgraphasn in uncached:
             asns.update(uncached[subgraphasn])
 
-        subgraph_query_str = ",".join(uncached.keys())
-        asns_query_str = ",".join(list(asns))
+        query_timebin = calendar.timegm(query_dt.utctimetuple())
+        if self.store is not None and self.store.has_timebin(query_timebin):
+            # scores available locally
+            fetched = self.store.get_hegemony_scores(query_timebin, list(uncached.keys()), list(asns))
+        else:
+            fetched = self._query_remote(query_time_str, list(uncached.keys()), list(asns))
+        for subgraph_asn, scores in iteritems(fetched):
+            if subgraph_asn not in res:
+                res[subgraph_asn] = {}
+            res[subgraph_asn].update(scores)
 
-        url = "https://ihr.iijlab.net/ihr/api/hegemony/?af=4&timebin={}&format=json&originasn={}&asn={}".format(
-            query_time_str, subgraph_query_str, asns_query_str
+        # caching results
+        for subgraph_asn in subgraph_asn_lst:
+            if subgraph_asn not in self.cache:
+                self.cache[subgraph_asn] = {}
+            if subgraph_asn not in res:
+                res[subgraph_asn] = {}
+            if asn_lst:
+                for asn in asn_lst:
+                    res[subgraph_asn][asn] = res[subgraph_asn].get(asn, 0)
+                    self.cache[subgraph_asn][asn] = res[subgraph_asn][asn]
+            else:
+                for asn in res[subgraph_asn]:
+                    self.cache[subgraph_asn][asn] = res[subgraph_asn][asn]
+                self.cached_subgraph.add(subgraph_asn)
+        self.cache_ts = query_time_str
+
+        return _extract_data(res, subgraph_asn_lst, asn_lst)
+
+    def _query_remote(self, query_time_str, subgraph_asn_lst, asn_lst):
+        """
+        query IHR hegemony API
+        :param query_time_str: timebin string
+        :param subgraph_asn_lst: list of subgraph origin asns
+        :param asn_lst: list of asns to filter by
+        :return: dict of subgraph -> {asn -> score}
+        """
+        res = {}
+        url = "{}?af=4&timebin={}&format=json&originasn={}&asn={}".format(
+            self.api_url, query_time_str, ",".join(subgraph_asn_lst), ",".join(asn_lst)
         )
         rsp_raw = ""
         try:
@@ -409,30 +467,13 @@ class HegemonyUtils:
                         res[originasn] = {}
                     res[originasn][str(result['asn'])] = result['hege']
             else:
-                for subgraphasn in uncached:
+                for subgraphasn in subgraph_asn_lst:
                     res[subgraphasn] = {}
         except ConnectionError as e:
             logging.error("cannot connect to remote at %s: %s" % (url, e))
         except ValueError as e:
             logging.error("cannot parse json object: %s ; %s" % (e, rsp_raw))
-
-        # caching results
-        for subgraph_asn in subgraph_asn_lst:
-            if subgraph_asn not in self.cache:
-                self.cache[subgraph_asn] = {}
-            if subgraph_asn not in res:
-                res[subgraph_asn] = {}
-            if asn_lst:
-                for asn in asn_lst:
-                    res[subgraph_asn][asn] = res[subgraph_asn].get(asn, 0)
-                    self.cache[subgraph_asn][asn] = res[subgraph_asn][asn]
-            else:
-                for asn in res[subgraph_asn]:
-                    self.cache[subgraph_asn][asn] = res[subgraph_asn][asn]
-                self.cached_subgraph.add(subgraph_asn)
-        self.cache_ts = query_time_str
-
-        return _extract_data(res, subgraph_asn_lst, asn_lst)
+        return res
 
 
 if __name__ == '__main__':
@@ -0,0 +1,195 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import argparse
+import calendar
+import csv
+import logging
+import sqlite3
+
+import dateutil.parser
+import wandio
+
+# number of rows inserted per transaction while ingesting dumps
+INGEST_BATCH_SIZE = 10000
+# number of asns per "IN (...)" clause, sqlite limits the number of bound variables
+QUERY_CHUNK_SIZE = 500
+
+
+def parse_timebin(timebin):
+    """
+    Convert an IHR timebin value (unix time or "2020-01-01 00:00:00+00") into unix time
+    :param timebin: timebin string or integer
+    :return: unix time integer
+    """
+    try:
+        return int(timebin)
+    except ValueError:
+        dt = dateutil.parser.parse(timebin)
+        return calendar.timegm(dt.utctimetuple())
+
+
+class HegemonyStore:
+    """
+    Local IHR AS hegemony score database.
+
+    IHR hegemony dumps (CSV files, optionally compressed) are ingested into a sqlite database keyed by
+    (timebin, originasn, asn), so that hegemony scores can be looked up without querying the IHR REST API.
+    """
+
+    def __init__(self, db_file, af=4):
+        """
+        :param db_file: path to the sqlite database file
+        :param af: address family of the scores to ingest
+        """
+        self.db_file = db_file
+        self.af = af
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hegemony ("
+            "timebin INTEGER NOT NULL, "
+            "originasn INTEGER NOT NULL, "
+            "asn INTEGER NOT NULL, "
+            "hege REAL NOT NULL, "
+            "PRIMARY KEY (timebin, originasn, asn)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.commit()
+        # timebins the store has data for. missing timebins are not cached, they may be ingested later on by
+        # another process (see main)
+        self.timebin_cache = set()
+
+    def ingest_file(self, filename):
+        """
+        Ingest a IHR hegemony dump file. The file must have a header line with at least the
+        "timebin", "originasn", "asn" and "hege" columns.
+
+        :param filename: path to the dump file, any format supported by wandio
+        :return: number of rows ingested
+        """
+        logging.info("ingesting hegemony dump {}".format(filename))
+        timebins = {}
+        batch = []
+        count = 0
+        with wandio.open(filename) as fh:
+            reader = csv.DictReader(fh, skipinitialspace=True)
+            for row in reader:
+                if "af" in row and row["af"] and int(row["af"]) != self.af:
+                    continue
+                timebin_str = row["timebin"]
+                if timebin_str not in timebins:
+                    timebins[timebin_str] = parse_timebin(timebin_str)
+                batch.append((timebins[timebin_str], int(row["originasn"]), int(row["asn"]), float(row["hege"])))
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    count += self._insert(batch)
+                    batch = []
+        if batch:
+            count += self._insert(batch)
+        self.timebin_cache.update(timebins.values())
+        logging.info("ingested {} hegemony scores from {}".format(count, filename))
+        return count
+
+    def _insert(self, rows):
+        self.conn.executemany("INSERT OR REPLACE INTO hegemony VALUES (?, ?, ?, ?)", rows)
+        self.conn.commit()
+        return len(rows)
+
+    def has_timebin(self, timebin):
+        """
+        Check whether the store has any scores for the given timebin
+        :param timebin: unix time of the timebin
+        :return: True if data is available
+        """
+        if timebin in self.timebin_cache:
+            return True
+        cur = self.conn.execute("SELECT 1 FROM hegemony WHERE timebin = ? LIMIT 1", (timebin,))
+        if cur.fetchone() is None:
+            return False
+        self.timebin_cache.add(timebin)
+        return True
+
+    def get_hegemony_scores(self, timebin, originasn_lst, asn_lst=None):
+        """
+        Get hegemony scores of asns in the subgraphs of the given origin ASes. This answers the same
+        question as the IHR hegemony API: the cross product of origin ASes and ASes is looked up.
+
+        :param timebin: unix time of the timebin
+        :param originasn_lst: list of origin ASes of the subgraphs, 0 for the global graph
+        :param asn_lst: list of asns to filter by, None or empty list for entire subgraphs
+        :return: dict of originasn -> {asn -> hege}, with asns as strings; asns without scores are missing
+        """
+        res = {}
+        asn_lst = [int(asn) for asn in asn_lst] if asn_lst else []
+        for originasn in originasn_lst:
+            scores = res.setdefault(str(originasn), {})
+            if not asn_lst:
+                cur = self.conn.execute(
+                    "SELECT asn, hege FROM hegemony WHERE timebin = ? AND originasn = ?",
+                    (timebin, int(originasn)))
+                for asn, hege in cur:
+                    scores[str(asn)] = hege
+                continue
+            for i in range(0, len(asn_lst), QUERY_CHUNK_SIZE):
+                chunk = asn_lst[i:i + QUERY_CHUNK_SIZE]
+                cur = self.conn.execute(
+                    "SELECT asn, hege FROM hegemony WHERE timebin = ? AND originasn = ? AND asn IN ({})".format(
+                        ",".join("?" * len(chunk))),
+                    [timebin, int(originasn)] + chunk)
+                for asn, hege in cur:
+                    scores[str(asn)] = hege
+        return res
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="""
+    Ingest IHR AS hegemony dumps into a local hegemony database.
+    """)
+    parser.add_argument("-d", "--db-file", required=True, help="sqlite database file to ingest into")
+    parser.add_argument("-a", "--af", type=int, default=4, help="address family to ingest (default: 4)")
+    parser.add_argument("files", nargs="+", help="IHR hegemony dump files (csv, optionally compressed)")
+    opts = parser.parse_args()
+
+    logging.basicConfig(level="INFO",
+                        format="%(asctime)s|%(levelname)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+
+    store = HegemonyStore(opts.db_file, af=opts.af)
+    for filename in opts.files:
+        store.ingest_file(filename)
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -30,28 +30,207 @@
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
+import bisect
+import csv
+import functools
+import ipaddress
 import logging
+import os
+import threading
 from unittest import TestCase
 
 import requests
+import wandio
 
+IPMETA_API_URL = "https://api.data.caida.org/ipmeta/v1/iplookup/"
+# path to the local geolocation dataset used by get_ip_geo_location, if any
+IPMETA_DB_FILE_ENV = "GRIP_IPMETA_DB_FILE"
+# number of IP lookups kept in memory
+IPMETA_CACHE_SIZE = 100000
+# seconds to wait for the ipmeta API
+IPMETA_API_TIMEOUT = 10
 
-def get_ip_geo_location(ip):
-    """get location of the IP address, returning latitude,longitude pair"""
+
+def fetch_remote_ip_geo_location(ip):
+    """
+    get location of the IP address from the CAIDA ipmeta API, returning latitude,longitude pair
+
+    :raises requests.exceptions.RequestException: if the API could not be queried
+    :raises ValueError: if the API returned a malformed response
+    """
     location = []
     country_code = ""
-    try:
-        response = requests.get("https://api.data.caida.org/ipmeta/v1/iplookup/" + ip).json()
-        if len(response) > 0:
-            prefered_source = [r for r in response if r["source"] == 2]
-            if not prefered_source:
-                logging.warning("no preferred location data found for {} failed: {}".format(ip, response))
+    response = requests.get(IPMETA_API_URL + ip, timeout=IPMETA_API_TIMEOUT)
+    response.raise_for_status()
+    response = response.json()
+    if not isinstance(response, list):
+        raise ValueError("unexpected ipmeta response for {}: {}".format(ip, response))
+    if len(response) > 0:
+        prefered_source = [r for r in response if r.get("source") == 2]
+        if not prefered_source:
+            logging.warning("no preferred location data found for {} failed: {}".format(ip, response))
+        else:
             location = prefered_source[0].get("lat_long", [])
             country_code = prefered_source[0].get("country_code", "")
+    return location, country_code
+
+
+def get_remote_ip_geo_location(ip):
+    """get location of the IP address from the CAIDA ipmeta API, returning latitude,longitude pair"""
+    try:
+        return fetch_remote_ip_geo_location(ip)
     except Exception as e:
         logging.error("retrieving location for {} failed: {}".format(ip, e))
-    finally:
-        return location, country_code
+        return [], ""
+
+
+class IpMetaDb:
+    """
+    Local IP geolocation database.
+
+    IP ranges are loaded from range files into sorted interval indexes (one per address family) and looked up by
+    binary search. Lookups go through an LRU cache; IPs not covered by any range are passed to the fallback function
+    (by default the CAIDA ipmeta API), whose answers are cached as well. Failed fallback lookups are not cached, so the
+    IPs are looked up again once the fallback recovers.
+
+    Range files are CSV files (optionally compressed, any format supported by wandio) with one range per line:
+    start_ip,end_ip,country_code,latitude,longitude
+    Ranges must not overlap. Empty lines and lines starting with "#" are ignored.
+    """
+
+    def __init__(self, fallback=fetch_remote_ip_geo_location, cache_size=IPMETA_CACHE_SIZE):
+        """
+        :param fallback: function called with the IP string for IPs not in the database, returning a
+        (lat_long, country_code) pair, or raising an exception if the location could not be retrieved. None to disable.
+        :param cache_size: max number of lookups cached
+        """
+        self.fallback = fallback
+        # address family -> sorted range starts, range ends, (lat_long, country_code) pairs
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        self._values = {4: [], 6: []}
+        self._lock = threading.Lock()
+        # exceptions are not cached by lru_cache
+        self._cached_lookup = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self):
+        return sum(len(starts) for starts in self._starts.values())
+
+    @staticmethod
+    def from_file(filename, **kwargs):
+        """create a database and load the given range file into it"""
+        db = IpMetaDb(**kwargs)
+        db.load_file(filename)
+        return db
+
+    def load_file(self, filename):
+        """
+        Load a range file into the database.
+
+        :param filename: path to the range file
+        :return: number of ranges loaded
+        """
+        logging.info("loading IP geolocation ranges from {}".format(filename))
+        ranges = {4: [], 6: []}
+        locations = {}  # share the location objects of ranges with the same location
+        with wandio.open(filename) as fh:
+            for row in csv.reader(fh):
+                if not row or row[0].startswith("#"):
+                    continue
+                start_ip, end_ip, country_code, lat, long = [field.strip() for field in row[:5]]
+                start = ipaddress.ip_address(start_ip)
+                end = ipaddress.ip_address(end_ip)
+                if start.version != end.version or int(start) > int(end):
+                    raise ValueError("invalid IP range: {}".format(",".join(row)))
+                location = (float(lat), float(long)) if lat and long else ()
+                value = locations.setdefault((location, country_code), (location, country_code))
+                ranges[start.version].append((int(start), int(end), value))
+
+        with self._lock:
+            for version, new_ranges in ranges.items():
+                if not new_ranges:
+                    continue
+                merged = sorted(list(zip(self._starts[version], self._ends[version], self._values[version])) +
+                                new_ranges, key=lambda r: r[0])
+                self._starts[version] = [r[0] for r in merged]
+                self._ends[version] = [r[1] for r in merged]
+                self._values[version] = [r[2] for r in merged]
+            self._cached_lookup.cache_clear()
+
+        count = sum(len(new_ranges) for new_ranges in ranges.values())
+        logging.info("loaded {} IP geolocation ranges from {}".format(count, filename))
+        return count
+
+    def find(self, ip):
+        """
+        Find the location of the IP address in the database, without cache nor fallback.
+
+        :param ip: IP address string
+        :return: (lat_long, country_code) pair, or None if the IP is not in the database
+        """
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            logging.error("invalid IP address {}".format(ip))
+            return None
+        version = address.version
+        value = int(address)
+        idx = bisect.bisect_right(self._starts[version], value) - 1
+        if idx >= 0 and value <= self._ends[version][idx]:
+            return self._values[version][idx]
+        return None
+
+    def lookup(self, ip):
+        """
+        Find the location of the IP address, in the database or with the fallback function.
+
+        :param ip: IP address string
+        :return: (lat_long, country_code) pair, empty if the location is unknown or could not be retrieved
+        """
+        try:
+            return self._cached_lookup(ip)
+        except Exception as e:
+            logging.error("retrieving location for {} failed: {}".format(ip, e))
+            return [], ""
+
+    def _lookup(self, ip):
+        result = self.find(ip)
+        if result is None:
+            if self.fallback is None:
+                return (), ""
+            return self.fallback(ip)
+        return result
+
+
+_default_db = None
+_default_db_lock = threading.Lock()
+
+
+def set_default_db(db):
+    """set the IpMetaDb used by get_ip_geo_location"""
+    global _default_db
+    _default_db = db
+
+
+def get_default_db():
+    """
+    Get the IpMetaDb used by get_ip_geo_location. It is created on first use, loading the range file set in the
+    GRIP_IPMETA_DB_FILE environment variable, if any.
+    """
+    global _default_db
+    with _default_db_lock:
+        if _default_db is None:
+            db = IpMetaDb()
+            db_file = os.environ.get(IPMETA_DB_FILE_ENV)
+            if db_file:
+                db.load_file(db_file)
+            _default_db = db
+        return _default_db
+
+
+def get_ip_geo_location(ip):
+    """get location of the IP address, returning latitude,longitude pair"""
+    return get_default_db().lookup(ip)
 
 
 class TestIpMeta(TestCase):
@@ -31,11 +31,31 @@
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
 import logging
+import time
+from collections import namedtuple
 
 import confluent_kafka
 
 import grip.common
 
+# max number of messages produced asynchronously waiting for delivery before produce blocks
+KAFKA_MAX_IN_FLIGHT = 10000
+
+# number of times messages produced asynchronously are produced before giving up, and seconds between two attempts
+KAFKA_DELIVERY_ATTEMPTS = 5
+KAFKA_DELIVERY_RETRY_INTERVAL = 5
+
+# message produced asynchronously that could not be delivered
+FailedDelivery = namedtuple("FailedDelivery", ["msg_id", "topic", "value", "error"])
+
+
+class KafkaDeliveryError(RuntimeError):
+    """messages produced asynchronously could not be delivered"""
+
+    def __init__(self, failed):
+        RuntimeError.__init__(self, "failed to deliver {} kafka messages".format(len(failed)))
+        self.failed = failed
+
 
 def _kafka_producer_delivery_report(err, msg):
     """ Called once for each message produced to indicate delivery result.
@@ -66,12 +86,28 @@ class KafkaHelper:
         self.default_producer_topic = None
         self.default_consumer_topic = None
 
-    def init_producer(self, topic):
+        # asynchronous producing
+        self.asynchronous = False
+        self.max_in_flight = KAFKA_MAX_IN_FLIGHT
+        self.in_flight = {}
+        self.failed_deliveries = []
+        self.last_msg_id = 0
+
+    def init_producer(self, topic, asynchronous=False, max_in_flight=KAFKA_MAX_IN_FLIGHT):
         """
         initialize kafka producer. allow setting default producer topic.
 
+        in asynchronous mode, messages are not flushed when produced, even with produce(flush=True). delivery reports
+        are served while producing, and produce only blocks when max_in_flight messages are waiting for delivery.
+        callers should call flush at processing boundaries (e.g. end of a view), which returns the messages that could
+        not be delivered.
+
         :param topic: default producer topic, nullable
+        :param asynchronous: whether to produce messages asynchronously
+        :param max_in_flight: max number of messages waiting for delivery in asynchronous mode
         """
+        self.asynchronous = asynchronous
+        self.max_in_flight = max_in_flight
         self.producer = confluent_kafka.Producer({
             "bootstrap.servers": self.brokers,
             "message.max.bytes": self.max_bytes,
@@ -120,6 +156,33 @@ class KafkaHelper:
         assert (isinstance(self.consumer, confluent_kafka.Consumer))
         return self.consumer.poll(interval)
 
+    def consume(self, num_messages=500, timeout=5):
+        """
+        consume a batch of messages from consumer
+        :param num_messages: maximum number of messages to return
+        :param timeout: seconds to wait for the batch to fill up
+        :return: list of messages, possibly empty
+        """
+        assert (self.consumer is not None)
+        assert (isinstance(self.consumer, confluent_kafka.Consumer))
+        return self.consumer.consume(num_messages=num_messages, timeout=timeout)
+
+    def rewind(self, messages):
+        """
+        seek consumer back to the earliest of the given messages on each partition, so that they are consumed again
+        :param messages: list of consumed messages
+        """
+        assert (self.consumer is not None)
+        offsets = {}
+        for msg in messages:
+            if msg.error():
+                continue
+            key = (msg.topic(), msg.partition())
+            if key not in offsets or msg.offset() < offsets[key]:
+                offsets[key] = msg.offset()
+        for (topic, partition), offset in offsets.items():
+            self.consumer.seek(confluent_kafka.TopicPartition(topic, partition, offset))
+
     def produce(self, value_str, topic=None, flush=False, report=False):
         """
         produce message to kafka topic.
@@ -144,6 +207,10 @@ class KafkaHelper:
         callback_func = None
         if report:
             callback_func = _kafka_producer_delivery_report
+
+        if self.asynchronous:
+            return self._produce_async(tmp_topic, value_str, callback_func)
+
         self.producer.produce(topic=tmp_topic, value=value_str, callback=callback_func)
 
         if flush:
@@ -151,16 +218,80 @@ class KafkaHelper:
             # https://github.com/edenhill/librdkafka/wiki/FAQ#why-is-there-no-sync-produce-interface
             self.producer.flush()
 
+    def _produce_async(self, topic, value_str, report_func=None):
+        """
+        produce message without waiting for its delivery.
+
+        :return: message id, as in FailedDelivery.msg_id
+        """
+        # block until there is room for one more message
+        while len(self.in_flight) >= self.max_in_flight:
+            self.producer.poll(1)
+
+        self.last_msg_id += 1
+        msg_id = self.last_msg_id
+
+        def _on_delivery(err, msg):
+            self.in_flight.pop(msg_id, None)
+            if err is not None:
+                logging.error("kafka message delivery to {} failed: {}".format(topic, err))
+                self.failed_deliveries.append(FailedDelivery(msg_id, topic, value_str, err))
+            if report_func is not None:
+                report_func(err, msg)
+
+        while True:
+            try:
+                self.producer.produce(topic=topic, value=value_str, callback=_on_delivery)
+                break
+            except BufferError:
+                # local queue is full, wait for some messages to be delivered
+                self.producer.poll(1)
+        self.in_flight[msg_id] = topic
+
+        # serve delivery reports of previously produced messages
+        self.producer.poll(0)
+        return msg_id
+
     def flush(self):
         """
         flush kafka producer.
         also read: https://github.com/edenhill/librdkafka/wiki/FAQ#why-is-there-no-sync-produce-interface
+
+        :return: list of FailedDelivery for messages produced asynchronously that could not be delivered since the last
+                 flush
         """
         assert (self.producer is not None)
         assert (isinstance(self.producer, confluent_kafka.Producer))
         logging.debug("flushing kafka producer")
         self.producer.flush()
 
+        failed = self.failed_deliveries
+        self.failed_deliveries = []
+        return failed
+
+    def deliver(self, max_attempts=KAFKA_DELIVERY_ATTEMPTS, retry_interval=KAFKA_DELIVERY_RETRY_INTERVAL):
+        """
+        flush kafka producer, and produce again the messages that could not be delivered until they are all delivered.
+        callers that commit consumer offsets should call it before committing, so that the messages produced while
+        processing the consumed messages are not lost.
+
+        :param max_attempts: maximum number of times a message is produced
+        :param retry_interval: seconds to wait before producing the failed messages again
+        :raises KafkaDeliveryError: if some messages still could not be delivered after max_attempts attempts
+        """
+        failed = self.flush()
+        attempts = 1
+        while failed and attempts < max_attempts:
+            logging.warning("failed to deliver {} kafka messages, retrying in {} seconds".format(
+                len(failed), retry_interval))
+            time.sleep(retry_interval)
+            for delivery in failed:
+                self.produce(delivery.value, topic=delivery.topic)
+            failed = self.flush()
+            attempts += 1
+        if failed:
+            raise KafkaDeliveryError(failed)
+
 
 def drain_topic(topics, group):
     print("draining topic %s for group: %s" % (topics, group))
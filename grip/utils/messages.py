@@ -30,12 +30,120 @@
 #  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
 #  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
+import zlib
+
+import msgpack
+
+import grip.events.event
 from grip.active.ripe_atlas.ripe_atlas_msm import AtlasMeasurement
 
+# version of the binary message layout, bumped whenever fields are removed or change meaning
+WIRE_VERSION = 1
+# binary messages are msgpack maps, whose first byte is never printable (unlike the string messages)
+WIRE_MAP_BYTES = frozenset(list(range(0x80, 0x90)) + [0xde, 0xdf])
+# events whose compressed payload is larger than this are not embedded, consumers read them from ElasticSearch
+MAX_EVENT_PAYLOAD = 512 * 1024
+
 
 class Message:
+    """
+    Base class of the messages exchanged between the pipeline stages over kafka.
+
+    Messages can be encoded in two forms:
+    - the legacy space-separated string form (to_str/from_str);
+    - a versioned binary form (to_bytes/from_bytes), a msgpack map of the following layout:
+      {"v": <WIRE_VERSION>, "t": <message type>, "f": {<message fields>}, "e": <optional event payload>}
+      where the event payload is the zlib-compressed msgpack encoding of the full event, letting the downstream
+      stages skip reading the event back from ElasticSearch.
+
+    from_wire accepts both forms, so consumers can be upgraded before producers switch to the binary form.
+    """
+
+    # message type tag in the binary form, set by subclasses
+    WIRE_TYPE = None
+
     def __init__(self, sender):
         self.sender = sender
+        # compressed event payload, only carried by the binary form
+        self.event_payload = None
+
+    def wire_fields(self):
+        """return the message fields as a dict of msgpack-serializable values"""
+        raise NotImplementedError
+
+    @classmethod
+    def from_wire_fields(cls, fields):
+        """build a message from the fields dict of the binary form"""
+        raise NotImplementedError
+
+    @staticmethod
+    def from_str(value):
+        raise NotImplementedError
+
+    def attach_event(self, event, max_payload=MAX_EVENT_PAYLOAD):
+        """
+        Embed a snapshot of the full event in the message. Only carried by the binary form.
+
+        :param event: Event object to embed
+        :param max_payload: maximum size of the compressed payload in bytes
+        :return: True if the event is embedded, False if it is too large
+        """
+        payload = zlib.compress(msgpack.packb(event.as_dict(), use_bin_type=True))
+        if len(payload) > max_payload:
+            self.event_payload = None
+            return False
+        self.event_payload = payload
+        return True
+
+    def get_event(self):
+        """
+        Decode the embedded event.
+
+        :return: Event object, or None if the message does not carry the event
+        """
+        if self.event_payload is None:
+            return None
+        return grip.events.event.Event.from_dict(msgpack.unpackb(zlib.decompress(self.event_payload), raw=False))
+
+    def to_bytes(self):
+        """encode the message in the binary form"""
+        data = {"v": WIRE_VERSION, "t": self.WIRE_TYPE, "f": self.wire_fields()}
+        if self.event_payload is not None:
+            data["e"] = self.event_payload
+        return msgpack.packb(data, use_bin_type=True)
+
+    @classmethod
+    def from_bytes(cls, value):
+        """
+        Decode a message in the binary form.
+
+        :raises ValueError: if the value is not a message of this type or uses an unsupported version
+        """
+        try:
+            data = msgpack.unpackb(value, raw=False)
+        except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError) as e:
+            raise ValueError("malformed binary message: {}".format(e))
+        if not isinstance(data, dict) or data.get("t") != cls.WIRE_TYPE:
+            raise ValueError("not a {} message".format(cls.__name__))
+        if data.get("v", 0) > WIRE_VERSION:
+            raise ValueError("unsupported message version {}".format(data.get("v")))
+        msg = cls.from_wire_fields(data["f"])
+        msg.event_payload = data.get("e")
+        return msg
+
+    @classmethod
+    def from_wire(cls, value):
+        """
+        Decode a message from a kafka message value, in either the binary or the string form.
+
+        :param value: message value, bytes or str
+        :return: message object
+        """
+        if isinstance(value, bytes):
+            if value and value[0] in WIRE_MAP_BYTES:
+                return cls.from_bytes(value)
+            value = value.decode("utf-8")
+        return cls.from_str(value)
 
 
 class EventOnElasticMsg(Message):
@@ -43,6 +151,8 @@ class EventOnElasticMsg(Message):
     Message indicating event ready message to be retrieved from ElasticSearch.
     """
 
+    WIRE_TYPE = "event_on_elastic"
+
     def __init__(self, sender, es_index, es_id, tr_worthy, es_doc_type="event_result", process_finished=False):
         Message.__init__(self, sender)
         self.es_index = es_index
@@ -60,6 +170,23 @@ class EventOnElasticMsg(Message):
             self.es_index, self.es_doc_type, self.es_id
         )
 
+    def wire_fields(self):
+        return {
+            "sender": self.sender,
+            "es_index": self.es_index,
+            "es_id": self.es_id,
+            "es_doc_type": self.es_doc_type,
+            "tr_worthy": self.tr_worthy,
+            "process_finished": self.process_finished,
+        }
+
+    @classmethod
+    def from_wire_fields(cls, fields):
+        return EventOnElasticMsg(
+            sender=fields["sender"], es_index=fields["es_index"], es_id=fields["es_id"],
+            es_doc_type=fields.get("es_doc_type", "event_result"), tr_worthy=fields["tr_worthy"],
+            process_finished=fields.get("process_finished", False))
+
     @staticmethod
     def from_str(value):
         fields = value.split(" ")
@@ -82,6 +209,8 @@ class MeasurementsRequestedMsg(Message):
     Message indicating active probing measurements has been requested.
     """
 
+    WIRE_TYPE = "measurements_requested"
+
     def __init__(self, sender, event_type, view_ts, event_id, measurements):
         Message.__init__(self, sender)
         self.event_type = event_type
@@ -100,6 +229,25 @@ class MeasurementsRequestedMsg(Message):
             ]
         )
 
+    def wire_fields(self):
+        return {
+            "sender": self.sender,
+            "event_type": self.event_type,
+            "view_ts": self.view_ts,
+            "event_id": self.event_id,
+            "measurements": [msm.as_str() for msm in self.measurements],
+        }
+
+    @classmethod
+    def from_wire_fields(cls, fields):
+        return MeasurementsRequestedMsg(
+            sender=fields["sender"],
+            event_type=fields["event_type"],
+            view_ts=fields["view_ts"],
+            event_id=fields["event_id"],
+            measurements=[AtlasMeasurement.from_str(msm_str) for msm_str in fields["measurements"]],
+        )
+
     @staticmethod
     def from_event(sender, event_type, view_ts, event_id, measurements):
         return MeasurementsRequestedMsg(
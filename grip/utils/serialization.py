@@ -0,0 +1,98 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+"""
+JSON encoding and decoding of the documents exchanged with ElasticSearch and between the pipeline stages.
+
+Objects are converted to plain dicts by their own as_dict/from_dict methods, this module only turns those dicts into
+JSON text and back. orjson is used when it is installed, the standard library otherwise:
+- dumps produces exactly the same text as json.dumps, regardless of the backend;
+- dumps_compact produces the same document without whitespace, for ElasticSearch and kafka payloads where the layout
+  does not matter. The two backends only differ in the notation of very large and very small floats (e.g. 1e-05 vs
+  0.00001), which decode to the same values;
+- loads decodes both forms to the same objects with either backend.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def backend():
+    """name of the JSON library used by dumps_compact and loads"""
+    return "orjson" if orjson is not None else "json"
+
+
+def dumps(obj):
+    """
+    Encode an object as JSON, byte-identical to json.dumps with the default options.
+
+    :param obj: dict, list or scalar
+    :return: JSON string
+    """
+    return json.dumps(obj)
+
+
+def dumps_compact(obj):
+    """
+    Encode an object as compact JSON (no whitespace, non-ASCII characters not escaped).
+
+    :param obj: dict, list or scalar, dict keys can be strings, integers or floats
+    :return: JSON string
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=ORJSON_OPTIONS).decode("utf-8")
+        except orjson.JSONEncodeError:
+            # e.g. integers larger than 64 bits, the standard library handles them
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(value):
+    """
+    Decode a JSON document.
+
+    :param value: JSON str or bytes
+    :return: decoded object
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            # e.g. NaN or integers larger than 64 bits, the standard library accepts them
+            pass
+    return json.loads(value)
@@ -0,0 +1,296 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import fnmatch
+import json
+import threading
+import uuid
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+
+from grip.events.event import Event
+from grip.utils.data.elastic_bulk import ElasticBulkWriter
+
+INDEX = "observatory-v3-test-events-moas-2020-01"
+
+
+class ElasticStubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the ElasticSearch document, multi-get, bulk and point-in-time search APIs.
+
+    Documents with "fail" in their id are refused with a 400 error, documents with "reject" in their id are rejected
+    with a 429 error the first time they are written.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+
+    def do_GET(self):
+        self._reply(200, {"version": {"number": "7.17.0"}, "tagline": "You Know, for Search"})
+
+    def do_PUT(self):
+        self.do_POST()
+
+    def do_DELETE(self):
+        path = self.path.split("?")[0].strip("/").split("/")
+        body = self._read_body()
+        if path[-1] == "_pit":
+            self.server.requests["_pit"] += 1
+            self._reply(200, self.server.close_pit(json.loads(body)["id"]))
+        else:
+            self._reply(404, {"error": "unsupported path {}".format(self.path)})
+
+    def do_POST(self):
+        path = self.path.split("?")[0].strip("/").split("/")
+        body = self._read_body()
+        self.server.requests[path[-1] if path[-1].startswith("_") else "_doc"] += 1
+        if len(body) > self.server.max_content_length:
+            self._reply(413, {"error": "request entity too large"})
+        elif path[-1] == "_bulk":
+            self._reply(200, self.server.bulk(body))
+        elif path[-1] == "_mget":
+            self._reply(200, self.server.mget(json.loads(body)))
+        elif path[-1] == "_pit":
+            self._reply(200, self.server.open_pit(path[0]))
+        elif path[-1] == "_count":
+            self._reply(200, {"count": len(self.server.match_index(path[0]))})
+        elif path[-1] == "_search":
+            self._reply(*self.server.search(json.loads(body)))
+        elif len(path) == 3 and path[1] == "_doc":
+            status, result = self.server.write("index", path[0], path[2], json.loads(body))
+            self._reply(status, result)
+        else:
+            self._reply(404, {"error": "unsupported path {}".format(self.path)})
+
+
+class ElasticStub(ThreadingHTTPServer):
+    """
+    stand-in ElasticSearch server keeping the documents in memory.
+    Search queries are ignored, point-in-time searches return all the documents of the index pattern.
+    Requests larger than max_content_length are refused with a 413 error.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", 0), ElasticStubHandler)
+        self.docs = {}
+        self.rejected = set()
+        self.requests = Counter()
+        self.pits = {}
+        self.max_content_length = 100 * 1024 * 1024
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+    def write(self, op_type, index, doc_id, source):
+        with self.lock:
+            if "fail" in doc_id:
+                return 400, {"type": "mapper_parsing_exception", "reason": "failed to parse"}
+            if "reject" in doc_id and doc_id not in self.rejected:
+                self.rejected.add(doc_id)
+                return 429, {"type": "es_rejected_execution_exception", "reason": "rejected execution"}
+            key = (index, doc_id)
+            if op_type == "update":
+                if key not in self.docs and not source.get("doc_as_upsert"):
+                    return 404, {"type": "document_missing_exception", "reason": "document missing"}
+                self.docs.setdefault(key, {}).update(source["doc"])
+            else:
+                self.docs[key] = source
+            return 200, {"_index": index, "_id": doc_id, "result": "updated"}
+
+    def match_index(self, index_pattern):
+        patterns = index_pattern.split(",")
+        with self.lock:
+            return sorted((index, doc_id, source) for (index, doc_id), source in self.docs.items()
+                          if any(fnmatch.fnmatch(index, pattern) for pattern in patterns))
+
+    def open_pit(self, index_pattern):
+        pit_id = uuid.uuid4().hex
+        docs = self.match_index(index_pattern)
+        with self.lock:
+            self.pits[pit_id] = docs
+        return {"id": pit_id}
+
+    def close_pit(self, pit_id):
+        with self.lock:
+            return {"succeeded": self.pits.pop(pit_id, None) is not None, "num_freed": 1}
+
+    def search(self, body):
+        with self.lock:
+            snapshot = self.pits.get(body["pit"]["id"])
+        if snapshot is None:
+            return 404, {"error": {"type": "search_context_missing_exception"}, "status": 404}
+        start = body["search_after"][0] + 1 if "search_after" in body else 0
+        slicing = body.get("slice")
+        hits = []
+        for pos in range(start, len(snapshot)):
+            index, doc_id, source = snapshot[pos]
+            if slicing and zlib.crc32(doc_id.encode()) % slicing["max"] != slicing["id"]:
+                continue
+            hit = {"_index": index, "_id": doc_id, "sort": [pos]}
+            if body.get("_source", True) is not False:
+                hit["_source"] = source
+            hits.append(hit)
+            if len(hits) >= body.get("size", 10):
+                break
+        return 200, {"pit_id": body["pit"]["id"], "hits": {"hits": hits}}
+
+    def mget(self, body):
+        docs = []
+        with self.lock:
+            for doc in body["docs"]:
+                key = (doc["_index"], doc["_id"])
+                if key in self.docs:
+                    docs.append({"_index": key[0], "_id": key[1], "found": True, "_source": self.docs[key]})
+                else:
+                    docs.append({"_index": key[0], "_id": key[1], "found": False})
+        return {"docs": docs}
+
+    def bulk(self, body):
+        lines = body.splitlines()
+        items = []
+        for action_line, source_line in zip(lines[0::2], lines[1::2]):
+            (op_type, meta), = json.loads(action_line).items()
+            status, result = self.write(op_type, meta["_index"], meta["_id"], json.loads(source_line))
+            item = {"_index": meta["_index"], "_id": meta["_id"], "status": status}
+            if status >= 300:
+                item["error"] = result
+            items.append({op_type: item})
+        return {"took": 1, "errors": any(next(iter(item.values()))["status"] >= 300 for item in items),
+                "items": items}
+
+
+def build_event(event_id):
+    event = Event(event_type="moas", position="NEW", event_id=event_id, view_ts=1577836800)
+    event.summary.update()
+    return event
+
+
+class TestElasticBulkWriter(TestCase):
+
+    def setUp(self):
+        self.stub = ElasticStub().__enter__()
+        self.es = Elasticsearch(self.stub.url)
+        self.written = []
+        self.failed = []
+        self.writer = ElasticBulkWriter(self.es, max_docs=10, max_age=3600, initial_backoff=0,
+                                        on_failure=self.failed.append)
+
+    def tearDown(self):
+        self.es.close()
+        self.stub.__exit__(None, None, None)
+
+    def test_flush_by_size(self):
+        for i in range(25):
+            self.writer.add_event(build_event("moas-1577836800-{}".format(i)), INDEX, callback=self.written.append)
+        # two full chunks are written, the last five events are still buffered
+        self.assertEqual(20, len(self.stub.docs))
+        self.assertEqual(20, len(self.written))
+        self.assertEqual(2, self.stub.requests["_bulk"])
+        self.assertEqual([], self.writer.flush())
+        self.assertEqual(25, len(self.stub.docs))
+        self.assertEqual(25, self.writer.docs_written)
+
+        doc = self.stub.docs[(INDEX, "moas-1577836800-3")]
+        self.assertEqual("moas-1577836800-3", doc["id"])
+        self.assertIsNotNone(doc["insert_ts"])
+
+    def test_flush_by_age(self):
+        self.writer.max_age = 0
+        self.writer.add_event(build_event("moas-1577836800-1"), INDEX)
+        self.assertEqual(1, len(self.stub.docs))
+        self.assertEqual([], self.writer.flush_if_due())
+
+    def test_update(self):
+        self.writer.add_event(build_event("moas-1577836800-1"), INDEX)
+        self.writer.flush()
+        event = build_event("moas-1577836800-1")
+        event.finished_ts = 1577840400
+        self.writer.add_event(event, INDEX, update=True)
+        self.writer.flush()
+        self.assertEqual(1577840400, self.stub.docs[(INDEX, "moas-1577836800-1")]["finished_ts"])
+
+    def test_failures(self):
+        for event_id in ["moas-1577836800-1", "moas-1577836800-fail", "moas-1577836800-reject"]:
+            self.writer.add_event(build_event(event_id), INDEX, callback=self.written.append)
+        failed = self.writer.flush()
+
+        # the rejected event is retried, the refused one is reported and not notified
+        self.assertEqual(["moas-1577836800-1", "moas-1577836800-reject"], [e.event_id for e in self.written])
+        self.assertEqual(["moas-1577836800-fail"], [item.doc_id for item in failed])
+        self.assertEqual(failed, self.failed)
+        self.assertEqual(400, failed[0].status)
+        self.assertEqual(1, self.writer.docs_failed)
+
+    def test_connection_failure(self):
+        writer = ElasticBulkWriter(Elasticsearch("http://127.0.0.1:1", max_retries=0), max_retries=1,
+                                   initial_backoff=0)
+        writer.add_event(build_event("moas-1577836800-1"), INDEX, callback=self.written.append)
+        failed = writer.flush()
+        self.assertEqual(["moas-1577836800-1"], [item.doc_id for item in failed])
+        self.assertEqual([], self.written)
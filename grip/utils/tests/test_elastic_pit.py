@@ -0,0 +1,135 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+from unittest import TestCase, mock
+
+from elasticsearch import Elasticsearch, NotFoundError
+
+from grip.utils.data.elastic import ElasticConn
+from grip.utils.data.elastic_bulk import ElasticBulkWriter
+from grip.utils.tests.test_elastic_bulk import ElasticStub, INDEX, build_event
+
+NUM_EVENTS = 25
+QUERY = {"size": 10, "query": {"match_all": {}}}
+
+
+class TestPitSearchReader(TestCase):
+
+    def setUp(self):
+        self.stub = ElasticStub().__enter__()
+        self.es = Elasticsearch(self.stub.url)
+        with mock.patch("grip.utils.data.elastic.Elasticsearch", return_value=self.es):
+            self.esconn = ElasticConn()
+        writer = ElasticBulkWriter(self.es)
+        self.event_ids = ["moas-1577836800-{}".format(i) for i in range(NUM_EVENTS)]
+        for event_id in self.event_ids:
+            writer.add_event(build_event(event_id), INDEX)
+        writer.flush()
+        self.stub.requests.clear()
+
+    def tearDown(self):
+        self.es.close()
+        self.stub.__exit__(None, None, None)
+
+    def test_search_generator(self):
+        events = list(self.esconn.search_generator(index="observatory-v3-test-events-*", query=QUERY))
+        self.assertEqual(sorted(self.event_ids), sorted(event.event_id for event in events))
+        # three pages and an empty one, the point-in-time is released at the end
+        self.assertEqual({"_pit": 2, "_search": 4}, dict(self.stub.requests))
+        self.assertEqual({}, self.stub.pits)
+
+        self.assertEqual(sorted(self.event_ids), sorted(self.esconn.id_generator(index=INDEX, query=QUERY)))
+        raw = list(self.esconn.search_generator(index=INDEX, query=QUERY, raw_json=True, limit=5))
+        self.assertEqual(5, len(raw))
+        self.assertIn(raw[0]["id"], self.event_ids)
+
+    def test_resume(self):
+        reader = self.esconn.search_reader(INDEX, QUERY, limit=12, resumable=True)
+        self.assertIsNone(reader.cursor)
+        first = [hit["_id"] for hit in reader]
+        self.assertEqual(12, len(first))
+
+        # resume with a new reader, the limit applies to the total
+        cursor = reader.cursor
+        rest = [event.event_id for event in self.esconn.search_generator(INDEX, cursor=cursor)]
+        self.assertEqual(sorted(self.event_ids), sorted(first + rest))
+        self.assertEqual({}, self.stub.pits)
+
+        # the point-in-time is released, resuming again fails
+        with self.assertRaises(NotFoundError):
+            list(self.esconn.search_generator(INDEX, cursor=cursor))
+
+    def test_release_on_stop(self):
+        # limit reached
+        self.assertEqual(5, len(list(self.esconn.search_generator(INDEX, QUERY, limit=5))))
+        self.assertEqual({}, self.stub.pits)
+
+        # iteration abandoned
+        reader = self.esconn.search_reader(INDEX, QUERY)
+        hits = iter(reader)
+        next(hits)
+        self.assertEqual(1, len(self.stub.pits))
+        hits.close()
+        self.assertEqual({}, self.stub.pits)
+        self.assertIsNone(reader.cursor)
+
+    def test_slices(self):
+        slices = [list(self.esconn.id_generator(INDEX, QUERY, slice_id=i, max_slices=3)) for i in range(3)]
+        self.assertEqual(sorted(self.event_ids), sorted(sum(slices, [])))
+        self.assertTrue(all(slices))
+
+        # slicing is kept when resuming
+        reader = self.esconn.search_reader(INDEX, QUERY, limit=1, slice_id=1, max_slices=3, resumable=True)
+        first = [hit["_id"] for hit in reader]
+        rest = [hit["_id"] for hit in self.esconn.search_reader(INDEX, cursor=reader.cursor)]
+        self.assertEqual(slices[1], first + rest)
+
+    def test_shared_point_in_time(self):
+        pit_id = self.esconn.open_point_in_time(INDEX)
+        # events written after the point-in-time was opened are not seen by any slice
+        writer = ElasticBulkWriter(self.es)
+        writer.add_event(build_event("moas-1577836800-{}".format(NUM_EVENTS)), INDEX)
+        writer.flush()
+
+        slices = [list(self.esconn.id_generator(None, QUERY, slice_id=i, max_slices=3, pit_id=pit_id))
+                  for i in range(3)]
+        self.assertEqual(sorted(self.event_ids), sorted(sum(slices, [])))
+        # the readers do not release the shared point-in-time
+        self.assertEqual(1, len(self.stub.pits))
+        self.esconn.close_point_in_time(pit_id)
+        self.assertEqual({}, self.stub.pits)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            self.esconn.search_reader(INDEX, cursor="not-a-cursor")
+        with self.assertRaises(ValueError):
+            self.esconn.search_reader(None)
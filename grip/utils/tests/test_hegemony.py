@@ -0,0 +1,111 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import random
+from unittest import TestCase
+
+from grip.utils.data.hegemony import HegemonyUtils
+
+
+def count_valleys_loop(paths, hegemony_scores, threshold):
+    """
+    per-path implementation of HegemonyUtils.count_hegemony_valleys, used as reference
+    """
+    hege_paths = []
+    for path in paths:
+        new_path = [v for i, v in enumerate(path) if i == 0 or v != path[i - 1]]
+        hege_paths.append([(asn, hegemony_scores[asn]) if asn in hegemony_scores else 0 for asn in new_path])
+
+    if not hege_paths:
+        return 0.0, []
+
+    valleys = []
+    paths_with_valleys = []
+    for index, hege_path in enumerate(hege_paths):
+        if len(hege_path) < 3:
+            continue
+        peak_idxs = []
+        for i in range(1, len(hege_path) - 1):
+            prev_score = hege_path[i - 1][1]
+            curr_score = hege_path[i][1]
+            next_score = hege_path[i + 1][1]
+            if i == 1 and prev_score > curr_score:
+                peak_idxs.append(0)
+            if prev_score <= curr_score and curr_score >= next_score:
+                peak_idxs.append(i)
+            if i == len(hege_path) - 2 and next_score >= curr_score:
+                peak_idxs.append(i + 1)
+        if len(peak_idxs) <= 1:
+            valleys.append(0)
+            continue
+        valley_cnt = 0
+        for i in range(1, len(peak_idxs)):
+            minimum = sorted(hege_path, key=lambda x: x[1])[0][1]
+            try:
+                depth_before_bottom = (hege_path[peak_idxs[i - 1]][1] - minimum) / float(
+                    hege_path[peak_idxs[i - 1]][1])
+                depth_after_bottom = (hege_path[peak_idxs[i]][1] - minimum) / float(hege_path[peak_idxs[i]][1])
+                avg_depth = (depth_before_bottom + depth_after_bottom) / 2.0
+                if avg_depth >= threshold:
+                    valley_cnt += 1
+            except ZeroDivisionError:
+                pass
+        valleys.append(valley_cnt)
+        if valley_cnt > 0:
+            paths_with_valleys.append(hege_path)
+
+    avg_valleys = sum(valleys) / float(len(hege_paths))
+    return avg_valleys, paths_with_valleys
+
+
+class TestHegemonyValleys(TestCase):
+
+    def test_valley(self):
+        scores = {"3356": 0.24, "15169": 0.001, "1299": 0.18, "174": 0.15}
+        self.assertEqual((1.0, [[("3356", 0.24), ("15169", 0.001), ("1299", 0.18)]]),
+                         HegemonyUtils.count_hegemony_valleys([["3356", "15169", "1299"]], scores, 0.95))
+        self.assertEqual((0.0, []),
+                         HegemonyUtils.count_hegemony_valleys([["3356", "1299", "174"], ["3356", "15169"]],
+                                                              scores, 0.95))
+        self.assertEqual((0.0, []), HegemonyUtils.count_hegemony_valleys([], scores, 0.95))
+
+    def test_same_as_loop(self):
+        rand = random.Random(0)
+        asns = [str(asn) for asn in range(1, 40)]
+        for _ in range(300):
+            # coarse scores so that ties and zero scores are frequent
+            scores = {asn: rand.choice([0, 0.0, 0.001, 0.05, 0.1, 0.1, 0.25, 0.5, 1.0, rand.random()])
+                      for asn in asns}
+            paths = [[rand.choice(asns[:rand.randint(2, len(asns))]) for _ in range(rand.randint(0, 12))]
+                     for _ in range(rand.randint(0, 30))]
+            threshold = rand.choice([0, 0.5, 0.95, 1.0])
+            self.assertEqual(count_valleys_loop(paths, scores, threshold),
+                             HegemonyUtils.count_hegemony_valleys(paths, scores, threshold))
@@ -0,0 +1,133 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import bz2
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+from urllib.parse import urlparse, parse_qs
+
+from grip.utils.data.hegemony import HegemonyUtils
+from grip.utils.data.hegemony_store import HegemonyStore, parse_timebin
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DUMP_FILE = os.path.join(DATA_DIR, "ihr_hegemony_ipv4_global_2019-12-31.csv")
+API_FIXTURE = os.path.join(DATA_DIR, "ihr_hegemony_api_2019-12-31T23:00.json")
+
+# 2020-01-01T00:00, scores are queried from one hour before
+VIEW_TS = 1577836800
+TIMEBIN = 1577833200
+
+
+class RecordedResponse:
+    """replays recorded IHR API results, filtered by the query parameters"""
+
+    def __init__(self, url):
+        with open(API_FIXTURE) as fh:
+            recorded = json.load(fh)
+        params = parse_qs(urlparse(url).query)
+        origins = set(params.get("originasn", [""])[0].split(","))
+        asns = set(filter(None, params.get("asn", [""])[0].split(",")))
+        results = [r for r in recorded["results"]
+                   if str(r["originasn"]) in origins and (not asns or str(r["asn"]) in asns)]
+        self.data = {"count": len(results), "results": results}
+
+    def json(self):
+        return self.data
+
+
+class TestHegemonyStore(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = HegemonyStore(os.path.join(self.tmp_dir, "hegemony.db"))
+        self.store.ingest_file(DUMP_FILE)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse_timebin(self):
+        self.assertEqual(TIMEBIN, parse_timebin("2019-12-31 23:00:00+00"))
+        self.assertEqual(TIMEBIN, parse_timebin(str(TIMEBIN)))
+
+    def test_get_hegemony_scores(self):
+        self.assertTrue(self.store.has_timebin(TIMEBIN))
+        self.assertFalse(self.store.has_timebin(TIMEBIN - 900))
+        self.assertEqual({"0": {"3356": 0.2384, "15169": 0.0012}},
+                         self.store.get_hegemony_scores(TIMEBIN, [0], [3356, 15169, 64512]))
+        self.assertEqual({"15169": {"15169": 1.0, "3356": 0.0412, "1299": 0.0219, "174": 0.0103}},
+                         self.store.get_hegemony_scores(TIMEBIN, ["15169"]))
+
+    def test_ingested_later(self):
+        # the store is filled by a separate process, timebins missing at first are found once ingested
+        store = HegemonyStore(os.path.join(self.tmp_dir, "hegemony-live.db"))
+        self.assertFalse(store.has_timebin(TIMEBIN))
+        ingester = HegemonyStore(store.db_file)
+        ingester.ingest_file(DUMP_FILE)
+        ingester.close()
+        self.assertTrue(store.has_timebin(TIMEBIN))
+        self.assertEqual(self.store.get_hegemony_scores(TIMEBIN, [0]), store.get_hegemony_scores(TIMEBIN, [0]))
+        store.close()
+
+    def test_ingest_compressed(self):
+        bz2_file = os.path.join(self.tmp_dir, "dump.csv.bz2")
+        with open(DUMP_FILE, "rb") as in_fh, bz2.open(bz2_file, "wb") as out_fh:
+            out_fh.write(in_fh.read())
+        store = HegemonyStore(os.path.join(self.tmp_dir, "hegemony-bz2.db"))
+        with open(DUMP_FILE) as fh:
+            self.assertEqual(len(fh.readlines()) - 1, store.ingest_file(bz2_file))
+        self.assertEqual(self.store.get_hegemony_scores(TIMEBIN, [0, 9121]),
+                         store.get_hegemony_scores(TIMEBIN, [0, 9121]))
+        store.close()
+
+    def test_same_as_remote(self):
+        paths = [["3356", "15169", "1299"], ["174", "2914", "6939", "15169"], ["9121", "1299", "3356", "13335"]]
+        local = HegemonyUtils(store=self.store)
+        with mock.patch("grip.utils.data.hegemony.requests.get", side_effect=RecordedResponse):
+            remote = HegemonyUtils()
+            self.assertEqual(remote.count_global_hegemony_valleys(VIEW_TS, paths, 0),
+                             local.count_global_hegemony_valleys(VIEW_TS, paths, 0))
+            self.assertEqual(remote.query_hegemony(VIEW_TS, [15169, 9121], []),
+                             local.query_hegemony(VIEW_TS, [15169, 9121], []))
+            self.assertEqual(remote.get_local_hege_path(VIEW_TS, [["1299", "9121"]]),
+                             local.get_local_hege_path(VIEW_TS, [["1299", "9121"]]))
+
+    def test_fallback_to_remote(self):
+        # timebins not in the store are fetched from the API
+        local = HegemonyUtils(store=self.store)
+        with mock.patch("grip.utils.data.hegemony.requests.get", side_effect=RecordedResponse) as get:
+            local.query_hegemony(VIEW_TS + 3600, [0], [3356])
+            self.assertEqual(1, get.call_count)
+            local.query_hegemony(VIEW_TS, [0], [3356])
+            self.assertEqual(1, get.call_count)
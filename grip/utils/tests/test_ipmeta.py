@@ -0,0 +1,138 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+import os
+import tempfile
+from unittest import TestCase
+
+import requests
+
+from grip.utils.data import ipmeta
+from grip.utils.data.ipmeta import IpMetaDb, get_ip_geo_location, set_default_db
+
+RANGES = """# start_ip,end_ip,country_code,latitude,longitude
+1.0.0.0,1.0.0.255,AU,-33.494,143.2104
+1.0.4.0,1.0.7.255,AU,-33.494,143.2104
+8.8.8.0,8.8.8.255,US,37.751,-97.822
+9.0.0.0,9.255.255.255,US,,
+
+2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,US,37.751,-97.822
+"""
+
+
+class TestIpMetaDb(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ranges_file = self.write_ranges("ranges.csv", RANGES)
+        self.fallback_calls = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        set_default_db(None)
+
+    def write_ranges(self, name, content):
+        filename = os.path.join(self.tmp_dir.name, name)
+        with open(filename, "w") as fh:
+            fh.write(content)
+        return filename
+
+    def fallback(self, ip):
+        self.fallback_calls.append(ip)
+        return [1.0, 2.0], "ZZ"
+
+    def test_lookup(self):
+        db = IpMetaDb.from_file(self.ranges_file, fallback=self.fallback)
+        self.assertEqual(5, len(db))
+        self.assertEqual(((-33.494, 143.2104), "AU"), db.lookup("1.0.0.0"))
+        self.assertEqual(((-33.494, 143.2104), "AU"), db.lookup("1.0.7.255"))
+        self.assertEqual(((37.751, -97.822), "US"), db.lookup("8.8.8.8"))
+        self.assertEqual(((), "US"), db.lookup("9.1.2.3"))
+        self.assertEqual(((37.751, -97.822), "US"), db.lookup("2001:4860:4860::8888"))
+        self.assertEqual([], self.fallback_calls)
+
+        # IPs between, before and after the ranges go to the fallback, once
+        for ip in ["1.0.1.0", "0.0.0.1", "200.0.0.1", "1.0.1.0", "2001:db8::1"]:
+            self.assertEqual(([1.0, 2.0], "ZZ"), db.lookup(ip))
+        self.assertEqual(["1.0.1.0", "0.0.0.1", "200.0.0.1", "2001:db8::1"], self.fallback_calls)
+        self.assertIsNone(db.find("1.0.1.0"))
+
+    def test_no_fallback(self):
+        db = IpMetaDb.from_file(self.ranges_file, fallback=None)
+        self.assertEqual(((), ""), db.lookup("1.0.1.0"))
+        self.assertEqual(((), ""), db.lookup("not-an-ip"))
+
+    def test_fallback_failure(self):
+        outage = {"on": True}
+
+        def fallback(ip):
+            self.fallback_calls.append(ip)
+            if outage["on"]:
+                raise requests.exceptions.ConnectionError("ipmeta unreachable")
+            return [1.0, 2.0], "ZZ"
+
+        db = IpMetaDb(fallback=fallback)
+        self.assertEqual(([], ""), db.lookup("1.0.2.1"))
+        self.assertEqual(([], ""), db.lookup("1.0.2.1"))
+        # failures are not cached, the IP is looked up again once the fallback recovers
+        outage["on"] = False
+        self.assertEqual(([1.0, 2.0], "ZZ"), db.lookup("1.0.2.1"))
+        self.assertEqual(([1.0, 2.0], "ZZ"), db.lookup("1.0.2.1"))
+        self.assertEqual(["1.0.2.1"] * 3, self.fallback_calls)
+
+    def test_load_multiple_files(self):
+        db = IpMetaDb(fallback=self.fallback)
+        self.assertEqual(([1.0, 2.0], "ZZ"), db.lookup("1.0.2.1"))
+        db.load_file(self.ranges_file)
+        db.load_file(self.write_ranges("more.csv", "1.0.1.0,1.0.3.255,CN,23.1167,113.25\n"))
+        self.assertEqual(6, len(db))
+        # the cache is cleared when ranges are added
+        self.assertEqual(((23.1167, 113.25), "CN"), db.lookup("1.0.2.1"))
+        self.assertEqual(((-33.494, 143.2104), "AU"), db.lookup("1.0.4.1"))
+
+    def test_invalid_range(self):
+        db = IpMetaDb(fallback=None)
+        with self.assertRaises(ValueError):
+            db.load_file(self.write_ranges("bad.csv", "1.0.1.0,1.0.0.0,CN,23.1167,113.25\n"))
+        with self.assertRaises(ValueError):
+            db.load_file(self.write_ranges("bad.csv", "1.0.0.0,2001:db8::,CN,23.1167,113.25\n"))
+
+    def test_default_db(self):
+        os.environ[ipmeta.IPMETA_DB_FILE_ENV] = self.ranges_file
+        try:
+            set_default_db(None)
+            lat, lg = get_ip_geo_location("8.8.8.8")[0]
+            self.assertEqual((37.751, -97.822), (lat, lg))
+        finally:
+            del os.environ[ipmeta.IPMETA_DB_FILE_ENV]
+
+        set_default_db(IpMetaDb(fallback=self.fallback))
+        self.assertEqual(([1.0, 2.0], "ZZ"), get_ip_geo_location("8.8.8.8"))
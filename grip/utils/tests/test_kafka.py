@@ -0,0 +1,87 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import time
+from unittest import TestCase
+
+import confluent_kafka
+
+from grip.utils.kafka import KafkaDeliveryError, KafkaHelper
+
+# no broker listens here, messages fail once they time out
+UNREACHABLE_BROKER = "127.0.0.1:1"
+
+
+class TestKafkaHelperAsync(TestCase):
+
+    def setUp(self):
+        self.kafka = KafkaHelper(brokers=UNREACHABLE_BROKER)
+        self.kafka.init_producer(topic="grip-test", asynchronous=True, max_in_flight=3)
+        self.kafka.producer = confluent_kafka.Producer({
+            "bootstrap.servers": UNREACHABLE_BROKER,
+            "message.timeout.ms": 200,
+            "log_level": 0,
+        })
+
+    def test_failed_deliveries(self):
+        start = time.time()
+        msg_ids = [self.kafka.produce("message {}".format(i), flush=True) for i in range(2)]
+        # produce neither flushes nor waits for the broker
+        self.assertLess(time.time() - start, 0.2)
+        self.assertEqual([1, 2], msg_ids)
+        self.assertEqual(2, len(self.kafka.in_flight))
+
+        failed = self.kafka.flush()
+        self.assertEqual(msg_ids, sorted(f.msg_id for f in failed))
+        self.assertEqual({"message 0", "message 1"}, {f.value for f in failed})
+        self.assertEqual({"grip-test"}, {f.topic for f in failed})
+        self.assertEqual({}, self.kafka.in_flight)
+        # failures are returned once
+        self.assertEqual([], self.kafka.flush())
+
+    def test_deliver(self):
+        for i in range(2):
+            self.kafka.produce("message {}".format(i))
+        with self.assertRaises(KafkaDeliveryError) as ctx:
+            self.kafka.deliver(max_attempts=3, retry_interval=0)
+        # failed messages are produced again before giving up
+        self.assertEqual(6, self.kafka.last_msg_id)
+        self.assertEqual({"message 0", "message 1"}, {f.value for f in ctx.exception.failed})
+        self.assertEqual({}, self.kafka.in_flight)
+
+    def test_max_in_flight(self):
+        for i in range(5):
+            self.kafka.produce("message {}".format(i))
+            self.assertLessEqual(len(self.kafka.in_flight), 3)
+        # produce waited for the first messages to fail before producing more
+        self.assertGreaterEqual(len(self.kafka.failed_deliveries), 2)
+        self.assertEqual(5, len(self.kafka.flush()))
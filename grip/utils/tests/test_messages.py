@@ -0,0 +1,97 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+from unittest import TestCase
+
+import msgpack
+
+from grip.active.ripe_atlas.ripe_atlas_msm import AtlasMeasurement
+from grip.utils.event_utils import create_dummy_event
+from grip.utils.messages import EventOnElasticMsg, MeasurementsRequestedMsg, WIRE_VERSION
+
+
+class TestMessages(TestCase):
+
+    def setUp(self):
+        self.msg = EventOnElasticMsg(sender="tagger", es_index="observatory-v3-events-moas-2020-01",
+                                     es_id="moas-1577836800-1", tr_worthy=True)
+
+    def assert_same_msg(self, expected, msg):
+        self.assertEqual(type(expected), type(msg))
+        self.assertEqual(expected.to_str(), msg.to_str())
+
+    def test_event_on_elastic_round_trip(self):
+        for value in [self.msg.to_str(), self.msg.to_str().encode(), self.msg.to_bytes()]:
+            msg = EventOnElasticMsg.from_wire(value)
+            self.assert_same_msg(self.msg, msg)
+            self.assertIsNone(msg.get_event())
+
+    def test_optional_fields(self):
+        fields = self.msg.wire_fields()
+        del fields["es_doc_type"], fields["process_finished"]
+        msg = EventOnElasticMsg.from_wire(msgpack.packb({"v": WIRE_VERSION, "t": "event_on_elastic", "f": fields}))
+        self.assert_same_msg(self.msg, msg)
+        self.assertFalse(msg.process_finished)
+
+    def test_measurements_requested_round_trip(self):
+        msms = [AtlasMeasurement(msm_id=1234, probe_ids=[1, 2, 3], target_ip="8.8.8.8", target_pfx="8.8.8.0/24",
+                                 target_asn=15169, request_error=[], event_id="moas-1577836800-1")]
+        orig = MeasurementsRequestedMsg(sender="driver", event_type="moas", view_ts=1577836800,
+                                        event_id="moas-1577836800-1", measurements=msms)
+        for value in [orig.to_str().encode(), orig.to_bytes()]:
+            msg = MeasurementsRequestedMsg.from_wire(value)
+            self.assert_same_msg(orig, msg)
+            self.assertEqual(1234, msg.measurements[0].msm_id)
+
+    def test_embedded_event(self):
+        event = create_dummy_event("moas", ts=1577836800, tr_worthy=True)
+        event.summary.update()
+        self.assertTrue(self.msg.attach_event(event))
+        msg = EventOnElasticMsg.from_wire(self.msg.to_bytes())
+        self.assert_same_msg(self.msg, msg)
+        self.assertEqual(event.as_dict(), msg.get_event().as_dict())
+        # the string form does not carry the event
+        self.assertIsNone(EventOnElasticMsg.from_wire(self.msg.to_str()).get_event())
+
+    def test_event_too_large(self):
+        event = create_dummy_event("moas", ts=1577836800)
+        self.assertFalse(self.msg.attach_event(event, max_payload=10))
+        self.assertIsNone(EventOnElasticMsg.from_wire(self.msg.to_bytes()).get_event())
+
+    def test_invalid_messages(self):
+        with self.assertRaises(ValueError):
+            # wrong message type
+            MeasurementsRequestedMsg.from_wire(self.msg.to_bytes())
+        with self.assertRaises(ValueError):
+            EventOnElasticMsg.from_wire(msgpack.packb({"v": WIRE_VERSION + 1, "t": "event_on_elastic", "f": {}}))
+        with self.assertRaises(ValueError):
+            EventOnElasticMsg.from_bytes(self.msg.to_bytes()[:-3])
@@ -0,0 +1,93 @@
+#  This software is Copyright (c) 2015 The Regents of the University of
+#  California. All Rights Reserved. Permission to copy, modify, and distribute this
+#  software and its documentation for academic research and education purposes,
+#  without fee, and without a written agreement is hereby granted, provided that
+#  the above copyright notice, this paragraph and the following three paragraphs
+#  appear in all copies. Permission to make use of this software for other than
+#  academic research and education purposes may be obtained by contacting:
+#
+#  Office of Innovation and Commercialization
+#  9500 Gilman Drive, Mail Code 0910
+#  University of California
+#  La Jolla, CA 92093-0910
+#  (858) 534-5815
+#  invent@ucsd.edu
+#
+#  This software program and documentation are copyrighted by The Regents of the
+#  University of California. The software program and documentation are supplied
+#  "as is", without any accompanying services from The Regents. The Regents does
+#  not warrant that the operation of the program will be uninterrupted or
+#  error-free. The end-user understands that the program was developed for research
+#  purposes and is advised not to rely exclusively on the program for any reason.
+#
+#  IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+#  DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST
+#  PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF
+#  THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH
+#  DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY WARRANTIES,
+#  INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED HEREUNDER IS ON AN "AS
+#  IS" BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO OBLIGATIONS TO PROVIDE
+#  MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+
+import json
+from unittest import TestCase, mock
+
+from grip.events.event import Event
+from grip.metrics.event_metrics import EventMetrics
+from grip.metrics.traceroute_metrics import TracerouteMetrics
+from grip.utils import serialization
+from grip.utils.event_utils import create_dummy_event
+
+
+def build_events():
+    events = []
+    for event_type in ["moas", "submoas", "defcon", "edges"]:
+        event = create_dummy_event(event_type, ts=1577836800, tr_worthy=True, tags=["all-newcomers"])
+        event.add_to_asinfo(15169, "hegemony", 0.25)
+        event.event_metrics.proc_time_tagger = 1.375
+        event.summary.update()
+        events.append(event)
+    return events
+
+
+class TestSerialization(TestCase):
+
+    def test_metrics_round_trip(self):
+        tr_metrics = TracerouteMetrics(tr_worthy=True, tr_worthy_tags=[["a", "b"]], selected_vp_cnt=3)
+        d = tr_metrics.as_dict()
+        self.assertEqual(set(TracerouteMetrics.__slots__), set(d))
+        self.assertEqual([("a", "b")], d["tr_worthy_tags"])
+        self.assertEqual(d, TracerouteMetrics.from_dict(json.loads(json.dumps(d))).as_dict())
+
+        event_metrics = EventMetrics(per_tag_cnt=[{"name": "a", "count": 1}], proc_time_tagger=0.5)
+        d = event_metrics.as_dict()
+        self.assertEqual(set(EventMetrics.__slots__), set(d))
+        self.assertEqual(d, EventMetrics.from_dict(d).as_dict())
+
+    def test_as_json(self):
+        for event in build_events():
+            d = event.as_dict()
+            # the default form is byte-identical to json.dumps
+            self.assertEqual(json.dumps(d), event.as_json())
+            self.assertEqual(json.loads(event.as_json()), json.loads(event.as_json(compact=True)))
+            self.assertEqual(event.as_json(), Event.from_json(event.as_json(compact=True)).as_json())
+
+    def test_backends(self):
+        if serialization.orjson is None:
+            self.skipTest("orjson is not installed")
+        for event in build_events():
+            d = event.as_dict()
+            fast = serialization.dumps_compact(d)
+            with mock.patch.object(serialization, "orjson", None):
+                self.assertEqual("json", serialization.backend())
+                slow = serialization.dumps_compact(d)
+                self.assertEqual(serialization.loads(slow), serialization.loads(fast))
+            self.assertEqual(slow, fast)
+            self.assertEqual(json.loads(json.dumps(d)), serialization.loads(fast))
+
+    def test_fallback(self):
+        # values orjson does not support are handled by the standard library
+        self.assertEqual('{"a":18446744073709551616}', serialization.dumps_compact({"a": 2 ** 64}))
+        self.assertEqual({"a": 2 ** 64}, serialization.loads('{"a": 18446744073709551616}'))
+        self.assertEqual({"1": "a"}, serialization.loads(serialization.dumps_compact({1: "a"})))
@@ -56,11 +56,12 @@ setuptools.setup(
         'netaddr',
         'filelock',
         'fuzzywuzzy',
-        'elasticsearch>=7.0.4',
+        'elasticsearch>=7.12',
         'nltk',
         'requests',
         'flask-restful',
         'numpy',
+        'msgpack',
         'python-Levenshtein',
         'scipy',
         'future',
@@ -69,6 +70,10 @@ setuptools.setup(
         # pinning the version to 2.10.6 because redis-py 3.0 introduced breaking change of it's zadd function
         # https://github.com/andymccurdy/redis-py/issues/1068
     ],
+    extras_require={
+        # faster JSON encoding and decoding of events, see grip.utils.serialization
+        'fast-json': ['orjson'],
+    },
     entry_points={'console_scripts': [
         # Announce CLI tools
         "grip-announce = grip.coodinator.announce:main",
@@ -104,6 +109,7 @@ setuptools.setup(
         "grip-ops-event = grip.metrics.operational_event:main",
 
         # External data CLI tools
-        "grip-update-spamhaus = grip.utils.data.spamhaus:update_spamhaus"
+        "grip-update-spamhaus = grip.utils.data.spamhaus:update_spamhaus",
+        "grip-hegemony-ingest = grip.utils.data.hegemony_store:main",
     ]}
 )